@@ -3,8 +3,11 @@
 #####################################################
 #imports
 #####################################################
+import time
+startup = time.time() # reference for startup time measurement
 import os, sys
 import logging, logging.handlers
+import multiprocessing
 from re import search
 from platform import system
 import numpy
@@ -14,13 +17,16 @@ from matplotlib.ticker import MaxNLocator
 from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigCanvas, NavigationToolbar2WxAgg as NavigationToolbar
 from matplotlib import rcParams
 import extensions.smp as smp
-import extensions.map as maps
 import extensions.mathematics as calc
-from extensions.residual_analysis import residual_analysis
-from extensions.menus import HeaderInfo, GraphOptions, SaveOptions, SuperPosition
-import wx
+import extensions.profiler as profiler
+from extensions.median import hampel
+from extensions.summary import profileSummary
+from extensions.menus import HeaderInfo, GraphOptions, SaveOptions
+from extensions.browser import FileList, ThumbnailGrid
+import wx, wx.lib.dialogs
 from wx.lib.agw.floatspin import FloatSpin
-from extensions import mean
+#optional tools (map, mean, residual_analysis, SuperPosition) are imported on first use
+imported = time.time()
 
 #####################################################
 #Globals
@@ -60,6 +66,19 @@ link = """http://www.slf.ch """ #/ueber/organisation/schnee_permafrost/schneephy
 #####################################################
 #User Interface
 #####################################################
+def currentBytes(args, kwargs, result):
+    """
+    size of data of the current measurement, used by profiler
+    """
+    ui = args[0]
+    return ui.File[ui.current].data.nbytes if ui.File else 0
+
+def allBytes(args, kwargs, result):
+    """
+    size of data of all open measurements, used by profiler
+    """
+    return sum(f.data.nbytes for f in args[0].File)
+
 class UI(wx.Frame):
     """main user interface"""
     def __init__(self, files, **kwargs):
@@ -72,6 +91,7 @@ class UI(wx.Frame):
         self.create_main_panel()
         self.File = []
         self.current = int(0)
+        self.hardness = numpy.array([0.1, 0.5, 1., 2., 5., 10.]) # force thresholds [N]
         self.create_plot()
         self.ToggleItems(False)
         self.plotOptions = GraphOptions(self)
@@ -126,6 +146,8 @@ class UI(wx.Frame):
         export.AppendSeparator()
         meg = export.Append(wx.ID_ANY, "GPS Data")
         self.Bind(wx.EVT_MENU, self.OnExportGPS, meg)
+        mehd = export.Append(wx.ID_ANY, "Hardness Threshold Depths")
+        self.Bind(wx.EVT_MENU, self.OnExportHardness, mehd)
         men = export.Append(wx.ID_ANY, "Noise, Drift and Offset")
         self.Bind(wx.EVT_MENU, self.OnExportNoise, men)
         mem = export.Append(wx.ID_ANY, "Maximum Forces, Surface and Ground")
@@ -153,8 +175,10 @@ class UI(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSuperpose, mss)
         mshmean = wx.MenuItem(self.dataMenu, 204, "&Range Mean Value, Offset and Drift")
         self.Bind(wx.EVT_MENU, self.OnMean, mshmean)
-        #mshhist = wx.MenuItem(self.dataMenu, 205, "&Force Histogram")
-        #self.Bind(wx.EVT_MENU, self.OnHist, mshhist)
+        mshhist = wx.MenuItem(self.dataMenu, 205, "&Force Drop Histogram")
+        self.Bind(wx.EVT_MENU, self.OnHist, mshhist)
+        mthumb = wx.MenuItem(self.dataMenu, 206, "&Thumbnail Overview")
+        self.Bind(wx.EVT_MENU, self.OnThumbnails, mthumb)
 
         self.viewMenu = wx.Menu()
 
@@ -164,7 +188,9 @@ class UI(wx.Frame):
         #self.showLayers = self.viewMenu.Append(307, "Manage Layers", "Manage and show Layers", kind=wx.ITEM_CHECK)
         self.shnd = self.viewMenu.Append(303, "Show Noise, Drift & Offset", "Show Noise, Drift & Offset", kind=wx.ITEM_CHECK)
         self.shgrad = self.viewMenu.Append(304, "Show Gradient", "Show derivation of the force signal", kind=wx.ITEM_CHECK)
+        self.shhard = self.viewMenu.Append(309, "Show Hardness Thresholds", "Show depths where the force first reaches the hardness thresholds", kind=wx.ITEM_CHECK)
         self.shmed = self.viewMenu.Append(305, "Raw Data Minus Median", "Subtract median window from original signal", kind=wx.ITEM_CHECK)
+        self.despike = self.viewMenu.Append(308, "Remove Spikes", "Replace spikes by the running median (Hampel filter)", kind=wx.ITEM_CHECK)
 
         self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shmf)
         self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shsf)
@@ -172,6 +198,8 @@ class UI(wx.Frame):
         self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shgrad)
         self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shgnd)
         self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shmed)
+        self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shhard)
+        self.Bind(wx.EVT_MENU, self.OnDespike,self.despike)
         #self.Bind(wx.EVT_MENU, self.OnLayers, self.showLayers)
         #self.Bind(wx.EVT_MENU, self.UpdateFigure,self.shhn)
 
@@ -179,7 +207,8 @@ class UI(wx.Frame):
         #self.dataMenu.AppendMenu(300, "&Analysis", self.viewMenu)
         self.dataMenu.AppendItem(mss)
         self.dataMenu.AppendItem(mshmean)
-        #self.dataMenu.AppendItem(mshhist)
+        self.dataMenu.AppendItem(mshhist)
+        self.dataMenu.AppendItem(mthumb)
         self.dataMenu.AppendItem(msm)
 
         #self.fft = self.dataMenu.Append(wx.ID_ANY,
@@ -204,6 +233,18 @@ class UI(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnAbout, about)
        # self.Bind(wx.EVT_MENU, self.OnHelp, help)
 
+        diagnostics = wx.Menu()
+        self.profile = diagnostics.Append(wx.ID_ANY, "Enable Profiling", "Record call counts, time and bytes of reader, calculations, plots and exports", kind=wx.ITEM_CHECK)
+        self.profile.Check(profiler.enabled)
+        self.Bind(wx.EVT_MENU, self.OnProfile, self.profile)
+        mpr = diagnostics.Append(wx.ID_ANY, "Show Profiling Report")
+        self.Bind(wx.EVT_MENU, self.OnProfileReport, mpr)
+        mps = diagnostics.Append(wx.ID_ANY, "Save Profiling Report...")
+        self.Bind(wx.EVT_MENU, self.OnProfileSave, mps)
+        mpc = diagnostics.Append(wx.ID_ANY, "Reset Profiling")
+        self.Bind(wx.EVT_MENU, self.OnProfileReset, mpc)
+        self.helpMenu.AppendMenu(wx.ID_ANY, "&Diagnostics", diagnostics)
+
         #####################################################
         #set menu bar
         #####################################################
@@ -262,8 +303,9 @@ class UI(wx.Frame):
 
         self.prevButton = self.toolbar.AddSimpleTool(wx.ID_BACKWARD, back_ico, "Previous Image","Show previous measurement")
 
-        self.choice = wx.Choice(self.toolbar, wx.ID_ANY,size=(200,-1))
-        self.choiceTool = self.toolbar.AddControl(self.choice)
+        self.filterBox = wx.SearchCtrl(self.toolbar, wx.ID_ANY, size=(200,-1))
+        self.filterBox.SetDescriptiveText("Filter Files")
+        self.filterTool = self.toolbar.AddControl(self.filterBox)
 
         self.nextButton = self.toolbar.AddSimpleTool(wx.ID_FORWARD, forward_ico, "Next Image","Show next measurement")
 
@@ -289,7 +331,7 @@ class UI(wx.Frame):
 
         self.Bind(wx.EVT_TOOL, self.OnSettings,self.menuButton)
 
-        self.Bind(wx.EVT_CHOICE, self.OnChoice ,self.choiceTool)
+        self.Bind(wx.EVT_TEXT, self.OnFilterFiles, self.filterBox)
         self.Bind(wx.EVT_TEXT_ENTER, self.OnTextEnter, self.textboxTool)
         self.Bind(wx.EVT_TOOL, self.OnNext,self.nextButton)
         self.Bind(wx.EVT_TOOL, self.OnPrev,self.prevButton)
@@ -322,6 +364,10 @@ class UI(wx.Frame):
 
         self.plot_toolbar.Realize()
 
+        #virtual list of the open files, sorted and filtered in numpy
+        self.fileList = FileList(self.panel, size=(300,-1))
+        self.Bind(wx.EVT_LIST_ITEM_SELECTED, self.OnSelectFile, self.fileList)
+
         self.vbox = wx.BoxSizer(wx.VERTICAL)
         self.vbox.Add(self.canvas, 1, wx.LEFT | wx.TOP | wx.GROW)
         self.vbox.Add(self.plot_toolbar, 0, wx.EXPAND | wx.ALIGN_CENTER_VERTICAL)
@@ -329,8 +375,12 @@ class UI(wx.Frame):
 
         self.vbox.Add(self.hbox, 0, flag = wx.ALIGN_LEFT | wx.TOP)
 
-        self.panel.SetSizer(self.vbox)
-        self.vbox.Fit(self)
+        self.mainbox = wx.BoxSizer(wx.HORIZONTAL)
+        self.mainbox.Add(self.fileList, 0, wx.EXPAND)
+        self.mainbox.Add(self.vbox, 1, wx.EXPAND)
+
+        self.panel.SetSizer(self.mainbox)
+        self.mainbox.Fit(self)
 
         self.canvas.mpl_connect('button_press_event', self.OnCanvas)
         self.canvas.mpl_connect('scroll_event', self.OnCanvas)
@@ -393,6 +443,7 @@ class UI(wx.Frame):
 
         event.guiEvent.GetEventObject().ReleaseMouse()
 
+    @profiler.timed("UI.draw_figure", size=currentBytes)
     def draw_figure(self, show=True, autozoom=True):
         """
         Redraws the figure
@@ -400,7 +451,7 @@ class UI(wx.Frame):
 
         self.axes.clear()
 
-        if self.current not in range(len(self.File)): # actually not (!?) necessary, implemented for Scheebeli
+        if not 0 <= self.current < len(self.File): # actually not (!?) necessary, implemented for Scheebeli
             print "index %d out of range [%d-%d]" %(self.current, 0, len(self.File)-1)
             self.current = len(self.File) -1
 
@@ -442,6 +493,9 @@ class UI(wx.Frame):
                        linewidth = self.plotOptions.width
                        )
 
+        if self.despike.IsChecked():
+            self.drawSpikes(self.File[self.current])
+
         if self.shgrad.IsChecked():
             amp = self.File[self.current].header['Samples Dist [mm]']
             grad = calc.downsample(numpy.gradient(y,amp),self.plotOptions.grad_sampling)
@@ -467,8 +521,12 @@ class UI(wx.Frame):
             self.drawGround(self.File[self.current].ground)
             text += "Ground: %.2f mm\n" %self.File[self.current].ground
 
+        if self.shhard.IsChecked():
+            self.drawHardness(*self.GetHardness())
+
         if self.shmf.IsChecked():
             fmax,xfmax = self.GetMaxForce()
+            self.drawMaxForce(fmax, xfmax)
             text += "Max Force: %.2f N at %.2f mm\n" %(fmax,xfmax)
 
         if self.shnd.IsChecked():
@@ -498,16 +556,59 @@ class UI(wx.Frame):
 
         self.drawMedian(x_smooth,y_smooth)
 
+        #surface, ground or spikes may have changed
+        self.fileList.setFile(self.current, self.File[self.current])
+
         if show: self.canvas.draw()
 
     def drawMedian(self,x,y):
         if self.shmed.IsChecked():
-            x_median, y_median = calc.subtractMedian(x, y, self.plotOptions.median_sampling)
+            x_median, y_median = calc.subtractMedian(x, y, self.plotOptions.median_sampling, self.plotOptions.median_sliding)
             self.axes.plot(x_median, y_median,
                            color = self.plotOptions.median_color,
                            linestyle = self.plotOptions.median_style,
                            linewidth = self.plotOptions.median_width)
 
+    def drawSpikes(self, file):
+        spikes = getattr(file, "spikes", None)
+        if spikes is not None and spikes.any():
+            self.axes.plot(file.data[spikes,0], file.force_orig[spikes], "rx")
+
+    def removeSpikes(self, file, remove=True):
+        """
+        replace spikes of file by the running median or restore original force
+        """
+        if not hasattr(file, "force_orig"):
+            file.force_orig = file.data[:,1].copy()
+        file.version = getattr(file, "version", 0) + 1 # invalidates data caches
+
+        if remove:
+            file.data[:,1], file.spikes = hampel(file.force_orig,
+                                                 self.plotOptions.spike_window,
+                                                 self.plotOptions.spike_threshold,
+                                                 self.plotOptions.spike_minimum)
+            print "Replaced %d spikes in %s" %(file.spikes.sum(), file.filename)
+        else:
+            file.data[:,1] = file.force_orig
+            file.spikes = None
+
+    def OnDespike(self, e):
+        remove = self.despike.IsChecked()
+        for file in self.File:
+            self.removeSpikes(file, remove)
+        self.fileList.setFiles(self.File)
+        self.draw_figure(autozoom=False)
+
+        if remove:
+            self.updateStatus("Replaced %d spikes" %self.File[self.current].spikes.sum())
+
+    def drawHardness(self, depths, forces):
+        surface = self.File[self.current].surface
+        for depth, force, threshold in zip(depths, forces, self.hardness):
+            if not numpy.isnan(depth):
+                self.axes.axvline(x=depth+surface,color="y",ls="--")
+                self.axes.text(depth+surface, force, " %g N" %threshold, color="y", va="bottom")
+
     def drawSurface(self, surface):
 
         xlim = self.axes.get_xlim()
@@ -560,7 +661,7 @@ class UI(wx.Frame):
         self.draw_figure(autozoom=False)
 
     def updateIndex(self):
-
+        """show current file in text box and file list, no widget rebuild"""
         length = len(self.File)
         if self.current >=  length or self.current < 0:
             self.current = 0
@@ -569,11 +670,12 @@ class UI(wx.Frame):
         if length == 0:
             self.textbox.SetValue("File 0 / 0")
 
-        choices = []
-        for entry in self.File:
-            choices.append(os.path.basename(entry.filename))
-        self.choice.SetItems(choices)
-        self.choice.SetSelection(self.current)
+        self.fileList.select(self.current)
+
+    def updateFiles(self):
+        """files were opened or closed: rebuild file list columns"""
+        self.fileList.setFiles(self.File)
+        self.updateIndex()
 
     def OnQuit(self, e):
         """Quit Event"""
@@ -616,6 +718,8 @@ class UI(wx.Frame):
                         else:
                             data = smp.Pnt(entry)
                             print data.ground
+                            if self.despike.IsChecked():
+                                self.removeSpikes(data)
                             data.surface = calc.GetSurface(data.data[:,0], data.data[:,1])
                             data.ground = calc.GetGround(data)
                             data.ylim = None
@@ -633,7 +737,7 @@ class UI(wx.Frame):
             self.statusbar.SetStatusText("Finished open files")
             self.ToggleItems(True)
             self.current = len(self.File)-1
-            self.updateIndex()
+            self.updateFiles()
             self.draw_figure()
 
         else:
@@ -656,7 +760,7 @@ class UI(wx.Frame):
                 self.canvas.draw()
             if self.current >= len(self.File):
                 self.current = len(self.File) - 1
-            self.updateIndex()
+            self.updateFiles()
 
             if len(self.File) > 0:
                 self.draw_figure()
@@ -673,16 +777,16 @@ class UI(wx.Frame):
             self.surface.SetValue(0.0)
             self.axes.clear()
             self.canvas.draw()
-            self.updateIndex()
+            self.updateFiles()
             self.ToggleItems(False)
             self.updateStatus()
 
         e.Skip()
 
     def OnNext(self,e):
+        """next file in the order of the file list"""
         self.saveZoom()
-        self.current += 1
-        self.current %= len(self.File)
+        self.current = self.fileList.step(self.current, 1)
         self.updateIndex()
         self.draw_figure()
         self.updateStatus("Selected File %s" %self.File[self.current].filename)
@@ -694,10 +798,9 @@ class UI(wx.Frame):
 
 
     def OnPrev(self,e):
+        """previous file in the order of the file list"""
         self.saveZoom()
-        self.current-=1
-        if self.current < 0:
-            self.current = len(self.File)-1
+        self.current = self.fileList.step(self.current, -1)
         self.updateIndex()
         self.draw_figure()
         self.updateStatus("Selected File %s" %self.File[self.current].filename)
@@ -728,13 +831,46 @@ class UI(wx.Frame):
 
         e.Skip()
 
+    def OnProfile(self, e):
+        profiler.enable(self.profile.IsChecked())
+        self.updateStatus("Profiling %s" %("enabled" if profiler.enabled else "disabled"))
+
+    def OnProfileReport(self, e):
+        dlg = wx.lib.dialogs.ScrolledMessageDialog(self, profiler.report(), "Profiling Report", size=(800,400))
+        dlg.ShowModal()
+        dlg.Destroy()
+
+    def OnProfileSave(self, e):
+
+        file_choices = "JSON (*.json)|*.json"
+
+        dlg = wx.FileDialog(
+            self,
+            message="Save profiling report as...",
+            defaultDir=os.getcwd(),
+            defaultFile="SnowMicroPyn_Profile.json",
+            wildcard=file_choices,
+            style=wx.SAVE|wx.OVERWRITE_PROMPT)
+
+        if dlg.ShowModal() == wx.ID_OK:
+            path = dlg.GetPath()
+            profiler.dump(path)
+            self.updateStatus("Saved profiling report to %s" %path)
+        dlg.Destroy()
+
+    def OnProfileReset(self, e):
+        profiler.reset()
+        self.updateStatus("Profiling timings reset")
+
     def OnMean(self,e):
+        from extensions import mean
         mean.Drift(self.File[self.current].data[:,0],self.File[self.current].data[:,1])
 
         e.Skip()
 
     def OnHist(self,e):
-        calc.forceDrops(self.File[self.current].data[:,0],self.File[self.current].data[:,1])
+        drops = calc.forceDrops(self.File[self.current].data[:,0],self.File[self.current].data[:,1], show=True)
+        self.updateStatus("%d force drops" %len(drops))
 
         e.Skip()
 
@@ -805,6 +941,7 @@ class UI(wx.Frame):
             self.draw_figure()
         e.Skip()
 
+    @profiler.timed("UI.SaveGraph", size=currentBytes)
     def SaveGraph(self,path = os.getcwd()):
 
         filename = self.File[self.current].filename
@@ -815,6 +952,7 @@ class UI(wx.Frame):
         self.canvas.print_figure(filename, dpi = self.dpi)
         self.updateStatus("Saved %s" %filename)
 
+    @profiler.timed("UI.SaveHeader", size=None)
     def SaveHeader(self,path = os.getcwd(),filename = ""):
         if filename == "":
             filename = self.File[self.current].filename
@@ -833,6 +971,7 @@ class UI(wx.Frame):
         file.close()
         self.updateStatus("Saved Header to %s" % path)
 
+    @profiler.timed("UI.SaveData", size=currentBytes)
     def SaveData(self,path=os.getcwd(),filename="", precision = 3):
 
         if filename == "":
@@ -851,6 +990,7 @@ class UI(wx.Frame):
 
         self.updateStatus("Saved Data to %s" % path)
 
+    @profiler.timed("UI.SaveShotNoise", size=currentBytes)
     def SaveShotNoise(self,path=os.getcwd(),filename="", window = 2.5, overlap = 50):
 
         if filename == "":
@@ -873,45 +1013,29 @@ class UI(wx.Frame):
 
         self.updateStatus("Saved Shot Noise Parameters to %s" % path)
 
+    @profiler.timed("UI.SaveMaxForce", size=allBytes)
     def SaveMaxForce(self,path=os.getcwd(),filename="_MaxForce.txt"):
 
         filename = os.path.join(path,filename)
 
         save=[]
-        for i in range(len(self.File)):
-            surface = "%0.2f" %self.File[i].surface
-            ground =  "%0.2f" %self.File[i].ground
-            y,x = self.GetMaxForce(i)
-            y = "%0.3f"%y
-            file = self.File[i].filename
-            file = os.path.basename(file)
-            save.append([file, surface, ground, y])
+        for row in profileSummary(self.File):
+            save.append([row.file, "%0.2f" %row.surface, "%0.2f" %row.ground, "%0.3f" %row.max_force])
         header = "Filename\tSurface [mm]\tGround [mm]\tForce [N]"
         numpy.savetxt(filename, save, "%s", "\t", "\n",header=header)
 
+    @profiler.timed("UI.SaveNoise", size=allBytes)
     def SaveNoise(self,path=os.getcwd(),filename="_Noise.txt"):
 
         filename = os.path.join(path,filename)
 
+        summary = profileSummary(self.File)
         save=[]
-        for i in range(len(self.File)):
-            x = self.File[i].data[:,0]
-            y = self.File[i].data[:,1]
-            surface = self.File[i].surface
-            x,y_fit,drift,offset,noise = calc.linFit(x, y, surface)
-            file = os.path.basename(self.File[i].filename)
-            save.append([file, "%.3g"%offset, "%.3g"%drift, "%.3g"%noise])
-
-        av = numpy.array(save)
-        av_offset = numpy.mean(av[:,1].astype(float))
-        sd_offset = numpy.std(av[:,1].astype(float))
-        av_drift = numpy.mean(av[:,2].astype(float))
-        sd_drift = numpy.std(av[:,2].astype(float))
-        av_noise = numpy.mean(av[:,3].astype(float))
-        sd_noise = numpy.std(av[:,3].astype(float))
-
-        save.append(["Average","%.3g"%av_offset,"%.3g"%av_drift,"%.3g"%av_noise])
-        save.append(["Deviation","%.3g"%sd_offset,"%.3g"%sd_drift,"%.3g"%sd_noise])
+        for row in summary:
+            save.append([row.file, "%.3g"%row.offset, "%.3g"%row.drift, "%.3g"%row.noise])
+
+        save.append(["Average","%.3g"%numpy.mean(summary.offset),"%.3g"%numpy.mean(summary.drift),"%.3g"%numpy.mean(summary.noise)])
+        save.append(["Deviation","%.3g"%numpy.std(summary.offset),"%.3g"%numpy.std(summary.drift),"%.3g"%numpy.std(summary.noise)])
 
         header = "Filename\tOffset [N]\tDrift [N/mm]\tNoise [N]"
         numpy.savetxt(filename, save, "%s", "\t", "\n",header=header)
@@ -927,66 +1051,40 @@ class UI(wx.Frame):
 
         max = numpy.argmax(y)
 
-        self.axes.axvline(x=x[max],color="r",ls="--")
+        return [y[max], x[max]-surface]
+
+    def drawMaxForce(self, fmax, xfmax):
+        x = xfmax + self.File[self.current].surface
+        self.axes.axvline(x=x,color="r",ls="--")
 
         xlim = self.axes.get_xlim()
         ylim = self.axes.get_ylim()
         dx = (xlim[1]-xlim[0])/40
         dy = (ylim[1]-ylim[0])*0.8
-        self.axes.text(x[max]-dx,dy,"Max Force",rotation="vertical")
-
-        #self.updateStatus("Maximum Force: %.2f N, Penetration Depth: %.2f mm" %(y[max], x[max]-surface))
-        self.updateStatus("Maximum Force: %.2f N" %y[max])
-
-        return [y[max], x[max]-surface]
+        self.axes.text(x-dx,dy,"Max Force",rotation="vertical")
 
-    def GetHardness(self, index=-1, df=0.05):
+        #self.updateStatus("Maximum Force: %.2f N, Penetration Depth: %.2f mm" %(fmax, xfmax))
+        self.updateStatus("Maximum Force: %.2f N" %fmax)
 
+    def GetHardness(self, index=-1):
+        """
+        return depths below surface and forces where the force first reaches self.hardness
+        """
         if index == -1:
             index = self.current
-        surface = self.File[index].surface
-
-        x = self.File[index].data[:,0]
-        y = self.File[index].data[:,1]
-
-        xHardness = []
-        yHardness = []
-
-        for force in self.hardness:
-            try:
-                index = numpy.where(y>=force+df)[0][0]
-                y_temp = y[:index]
-                delta = numpy.abs(y_temp-force)
-                minimum = numpy.argmin(delta)
-                xmin = x[minimum]
-                ymin = y[minimum]
-
-                self.axes.axvline(x=xmin,color="y",ls="--")
-
-            except:
-                xmin = None
-                ymin = None
-
-            if xmin != None:
-                xHardness.append(xmin-surface)
-            else:
-                xHardness.append(None)
-
-            yHardness.append(ymin)
-
-        return[xHardness,yHardness]
+        f = self.File[index]
+        return calc.hardnessDepths(f.data[:,0], f.data[:,1], self.hardness, f.surface)
 
+    @profiler.timed("UI.SaveHardness", size=allBytes)
     def SaveHardness(self,path=os.getcwd(),filename="_Hardness.txt"):
 
         filename = os.path.join(path,filename)
 
         save = []
-        for i in range(len(self.File)):
-            x,y = self.GetHardness(i)
-            file = self.File[i].filename
-            file = os.path.basename(file)
-            line = "\t".join((str(w) for w in x))
-            save.append([file,line])
+        depths = calc.hardnessDepthsFiles(self.File, self.hardness)[0]
+        for f, row in zip(self.File, depths):
+            line = "\t".join(("None" if numpy.isnan(w) else "%.2f" %w for w in row))
+            save.append([os.path.basename(f.filename),line])
 
         header = "Filename\tDistance [mm] " + numpy.array2string(self.hardness, max_line_width=200, separator="N\t")
         numpy.savetxt(filename, save, "%s", "\t", "\n", header = header)
@@ -1094,6 +1192,26 @@ class UI(wx.Frame):
             self.updateStatus("Wrote Forces to %s" %file)
         dlg.Destroy()
 
+    def OnExportHardness(self,e):
+
+        file_choices = "DAT (*.dat)|*.dat"
+
+        dlg = wx.FileDialog(
+            self,
+            message="Save Hardness Threshold Depths as...",
+            defaultDir=os.getcwd(),
+            defaultFile="Hardness.dat",
+            wildcard=file_choices,
+            style=wx.SAVE|wx.OVERWRITE_PROMPT)
+
+        if dlg.ShowModal() == wx.ID_OK:
+            file = dlg.GetPath()
+            filename = os.path.basename(file)
+            path = os.path.dirname(file)
+            self.SaveHardness(path,filename)
+            self.updateStatus("Wrote Hardness Threshold Depths to %s" %file)
+        dlg.Destroy()
+
     def OnExportGPS(self,e):
 
         file_choices = "COORD (*.coord)|*.COORD"
@@ -1150,12 +1268,18 @@ class UI(wx.Frame):
         self.updateIndex()
         self.draw_figure()
 
-    def OnChoice(self, e):
+    def OnSelectFile(self, e):
+        index = self.fileList.fileIndex(e.GetIndex())
+        if index == self.current: # selected by updateIndex
+            return
         self.saveZoom()
-        self.current = self.choice.GetCurrentSelection()
+        self.current = index
         self.updateIndex()
         self.draw_figure()
 
+    def OnFilterFiles(self, e):
+        self.fileList.setFilter(self.filterBox.GetValue())
+
     def OnSettings(self,e):
         self.saveZoom()
         self.plotOptions.Show()
@@ -1164,13 +1288,18 @@ class UI(wx.Frame):
         return float(search("\d+(\.\d+)?",string.group()))
 
     def OnShowMap(self,e):
+        import extensions.map as maps
         maps.Map(self,-1,self.File)
 
     def OnShowHeader(self,e):
         info = HeaderInfo(self,-1,self.File[self.current].header)
         info.Show()
 
+    def OnThumbnails(self,e):
+        ThumbnailGrid(self, self.File)
+
     def OnSuperpose(self,e):
+        from extensions.menus import SuperPosition
         SuperPosition(self,self.File)
 
     def OnSurface(self,e, surface = None):
@@ -1205,10 +1334,15 @@ class UI(wx.Frame):
 
     def OnFilter(self,e):
         """Filter Event. Call Low Pass Filter """
+        from extensions.residual_analysis import residual_analysis
         self.saveZoom()
         data = self.File[self.current].data
         f = 1/self.File[self.current].header["Samples Dist [mm]"]
-        residual_analysis(data[:,1], freq=f, show=True,)
+        fc_spectral = residual_analysis(data[:,1], freq=f, method="spectral")
+        fc_residual = residual_analysis(data[:,1], freq=f, show=True, method="fft")
+        estimate = lambda fc: "%.2f" %fc if fc else "not found"
+        self.updateStatus("Cutoff frequency [1/mm]: residual analysis %s, spectral %s"
+                          %(estimate(fc_residual), estimate(fc_spectral)))
         self.draw_figure(autozoom=False)
 
         e.Skip()
@@ -1227,13 +1361,15 @@ class UI(wx.Frame):
         self.dataMenu.Enable(203,enable)
         self.dataMenu.Enable(204,enable)
         self.dataMenu.Enable(205,enable)
+        self.dataMenu.Enable(206,enable)
         self.viewMenu.Enable(301,enable)
         self.viewMenu.Enable(302,enable)
         self.viewMenu.Enable(303,enable)
         self.viewMenu.Enable(304,enable)
         self.viewMenu.Enable(305,enable)
         self.viewMenu.Enable(306,enable)
-        self.viewMenu.Enable(307,enable)
+        self.viewMenu.Enable(308,enable)
+        self.viewMenu.Enable(309,enable)
         self.dataMenu.Enable(wx.ID_PREFERENCES,enable)
         #self.dataMenu.Enable(self.fft.GetId(),enable)
         self.plot_toolbar.Enable(enable)
@@ -1242,7 +1378,8 @@ class UI(wx.Frame):
         self.toolbar.EnableTool(wx.ID_CLOSE_ALL,enable)
         self.toolbar.EnableTool(wx.ID_SAVE,enable)
         self.toolbar.EnableTool(wx.ID_SAVEAS,enable)
-        self.choice.Enable(enable)
+        self.filterBox.Enable(enable)
+        self.fileList.Enable(enable)
         self.toolbar.EnableTool(wx.ID_FORWARD,enable)
         self.toolbar.EnableTool(wx.ID_BACKWARD,enable)
         self.toolbar.EnableTool(self.infoTool.GetId(),enable)
@@ -1286,7 +1423,7 @@ class UI(wx.Frame):
             self.statusbar.SetStatusText("Read %d .pnt files" %len(files))
             self.ToggleItems(True)
             self.current = len(self.File)-1
-            self.updateIndex()
+            self.updateFiles()
             self.draw_figure()
 
 def ask(question, caption = "Confirm"):
@@ -1321,6 +1458,13 @@ def fileDialog(self):
         pass
     return selected
 
+def reportStartup():
+    """
+    log time from start of script until main window is shown
+    """
+    now = time.time()
+    print "startup time: %.3f s to first window (imports %.3f s)" %(now - startup, imported - startup)
+
 def getVersions():
     """
     get numpy, matpltolib, wx, and SnowMicroPyn versions for debugging
@@ -1370,6 +1514,7 @@ def __initLogger__():
 
 if __name__ == "__main__":
     """main application"""
+    multiprocessing.freeze_support() # thumbnail workers of the frozen exe
     logger = __initLogger__()
 
     print "starting %s version %s" %(name, version)
@@ -1381,4 +1526,5 @@ if __name__ == "__main__":
     UI(sys.argv[1:])
     if "Darwin" in opsys:
         app.SetMacSupportPCMenuShortcuts(True)
+    wx.CallAfter(reportStartup)
     app.MainLoop()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+"""
+benchmark.py generates synthetic SnowMicroPen .pnt files and times the
+reading and analysis functions on them. Results are written as JSON, so
+runs of different versions can be compared to spot regressions.
+
+The synthetic force signal follows the Poisson shot noise model of
+Loewe and van Herwijnen, 2012: A Poisson shot noise model for
+micro-penetration of snow, CRST. Rupture events occur at a constant rate
+per mm within a layer, every element loads linearly over the deflection
+delta and then breaks. The profile consists of an air gap, several snow
+layers with random shot noise parameters and an overload at the ground.
+
+usage:
+
+python benchmark.py -n 10000 100000 1000000 -o results.json
+python benchmark.py -n 100000 -b results.json # compare against older run
+
+example:
+
+import benchmark
+
+benchmark.writeSynthetic("synthetic.pnt", 500000, seed=1) # write test file
+results = benchmark.run([10000, 100000], repeat=3)
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import numpy
+import pnt
+
+__author__ = "SasG"
+__date__ = "26/10/19"
+__version__ = "0.1.0"
+
+# stages in order of execution, see STAGES for implementation
+STAGE_NAMES = ["read", "header", "data", "surface", "ground", "linfit",
+			"shotnoise", "residual", "residualfft", "forcedrops", "plot"]
+
+# stages which are skipped above the given number of samples unless forced
+SLOW_STAGES = {"shotnoise": 1000000, "residual": 1000000}
+
+def template():
+	"""
+	return header dict with a default value for every PARAMTABLE entry
+	"""
+	header = {}
+	for (key, fmt, start, length, unit) in pnt.PARAMTABLE:
+		count = fmt.rstrip("HhilfdcsxL") or "1"
+		if "x" in fmt:
+			header[key] = None
+		elif fmt.endswith("s"):
+			header[key] = ""
+		elif fmt.endswith("c"):
+			header[key] = "\x00"
+		elif count != "1":
+			header[key] = (0,) * int(count)
+		else:
+			header[key] = 0
+
+	now = time.gmtime()
+	header.update({"Version": 400,
+				"Samples Dist [mm]": 0.00413223123178,
+				"CNV Force [N/mV]": 0.00131541281007,
+				"CNV Pressure [N/bar]": 6.42269151285e-05,
+				"Year": now.tm_year, "Month": now.tm_mon, "Day": now.tm_mday,
+				"Hour": now.tm_hour, "Min": now.tm_min, "Sec": now.tm_sec,
+				"Speed [mm/s]": 20.0,
+				"File Name": "SYNTH",
+				"Latitude": 99999.0, "Longitude": 99999.0, "Altitude [cm]": 99999.0,
+				"Northing": "N", "Easting": "E", "GPS State": "0",
+				"Kistler Range [pC]": 5000, "Amp Range [pC]": 10000,
+				"Sensitivity [pC/N]": 116, "Diameter [um]": 5000,
+				"Overload [N]": 41, "Sensor Type": "<", "Amp Type": "<",
+				"SMP Serial": 0, "Length [mm]": 1000})
+	return header
+
+def ramp(amplitude, m):
+	"""
+	superpose linear force ramps of length m samples starting at every
+	sample with the given amplitude, computed in O(n) from cumulative sums
+	"""
+	n = len(amplitude)
+	j = numpy.arange(n, dtype=float)
+	c0 = numpy.concatenate(([0.], numpy.cumsum(amplitude)))
+	c1 = numpy.concatenate(([0.], numpy.cumsum(j * amplitude)))
+	lo = numpy.maximum(numpy.arange(1, n + 1) - m, 0)
+	s0 = c0[1:] - c0[lo]
+	s1 = c1[1:] - c1[lo]
+	return (j * s0 - s1) / m
+
+def synthesize(samples, dx=0.00413223123178, air=50., ground=0.03, layers=8,
+			overload=41., offset=0.03, noise=0.005, seed=None):
+	"""
+	Create synthetic force profile.
+	Input:
+		-samples: number of samples
+		-dx: distance between samples [mm]
+		-air: distance in front of the surface [mm], at most 3/4 of the profile
+		-ground: fraction of profile after the ground, force rises to overload
+		-layers: number of snow layers with different shot noise parameters
+		-overload: overload force [N]
+		-offset: force offset [N]
+		-noise: standard deviation of electronic noise [N]
+		-seed: random seed
+	Returns:
+		-x: distance array [mm]
+		-y: force array [N]
+		-params: list of layer tuples (start [mm], rate [1/mm], f0 [N], delta [mm])
+	"""
+	rnd = numpy.random.RandomState(seed)
+	x = numpy.arange(samples) * dx
+	y = numpy.zeros(samples)
+
+	i_surface = int(min(air / dx, 0.75 * samples))
+	i_ground = int(samples * (1 - ground))
+	bounds = numpy.linspace(i_surface, i_ground, layers + 1).astype(int)
+
+	params = []
+	for start, end in zip(bounds[:-1], bounds[1:]):
+		rate = rnd.uniform(5, 40) # rupture events per mm
+		f0 = rnd.lognormal(numpy.log(0.1), 0.7) # mean rupture force [N]
+		delta = rnd.uniform(0.1, 0.5) # deflection at rupture [mm]
+		params.append((x[start], rate, f0, delta))
+
+		counts = rnd.poisson(rate * dx, end - start)
+		amplitude = numpy.zeros(end - start)
+		hit = counts > 0
+		amplitude[hit] = rnd.gamma(counts[hit], f0) # sum of exponential rupture forces
+		m = max(int(round(delta / dx)), 1)
+		stop = min(end + m, samples)
+		amplitude = numpy.concatenate((amplitude, numpy.zeros(stop - end)))
+		y[start:stop] += ramp(amplitude, m)
+
+	if i_ground < samples:
+		y[i_ground:] += numpy.linspace(0, 2 * overload, samples - i_ground)
+
+	y += offset + rnd.normal(0, noise, samples)
+	y = numpy.clip(y, 0, overload)
+
+	return x, y, params
+
+def writeSynthetic(fname, samples, seed=None, **kwargs):
+	"""
+	write synthetic .pnt file with given number of samples, see synthesize()
+	return fname
+	"""
+	header = template()
+	x, y, params = synthesize(samples, dx=header["Samples Dist [mm]"], seed=seed, **kwargs)
+	header["Tot Samples"] = samples
+	header["Length [mm]"] = min(int(x[-1]) + 1, 65535)
+	header["Comment"] = "synthetic, seed %s" %seed
+	with open(fname, "wb") as f:
+		f.write(pnt.pack(header, y))
+	return fname
+
+class Context():
+	def __init__(self, fname):
+		"""
+		Shared state of the benchmark stages for a single file,
+		including surface and ground of the profile.
+		"""
+		self.fname = fname
+		self.p = pnt.Pnt(fname)
+		self.raw = self.p.getRaw()
+		self.x = self.p.data[:,0]
+		self.y = self.p.data[:,1]
+		self.freq = 1. / self.p.header["Samples Dist [mm]"]
+		stageSurface(self) # stages can be run in any order
+		stageGround(self)
+
+def stageRead(c):
+	return c.p.getRaw()
+
+def stageHeader(c):
+	return c.p.getHeader(c.raw)
+
+def stageData(c):
+	return c.p.getData(c.raw)
+
+def stageSurface(c):
+	import extensions.mathematics as calc
+	c.p.surface = calc.GetSurface(c.x, c.y)
+	return c.p.surface
+
+def stageGround(c):
+	import extensions.mathematics as calc
+	c.p.ground = calc.GetGround(c.p)
+	return c.p.ground
+
+def stageLinFit(c):
+	import extensions.mathematics as calc
+	return calc.linFit(c.x, c.y, c.p.surface)
+
+def stageShotNoise(c):
+	import extensions.mathematics as calc
+	return calc.getSNParams(c.p)
+
+def stageResidual(c):
+	from extensions.residual_analysis import residual_analysis
+	return residual_analysis(c.y, freq=c.freq)
+
+def stageResidualFFT(c):
+	from extensions.residual_analysis import residual_analysis
+	return residual_analysis(c.y, freq=c.freq, method="fft")
+
+def stageForceDrops(c):
+	import extensions.mathematics as calc
+	return calc.forceDrops(c.x, c.y)
+
+def stagePlot(c):
+	from matplotlib.figure import Figure
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	import extensions.mathematics as calc
+	fig = Figure((8.0, 6.0), dpi=100)
+	canvas = FigureCanvasAgg(fig)
+	axes = fig.add_subplot(111)
+	axes.plot(calc.downsample(c.x, 10), calc.downsample(c.y, 10)) # default graph options
+	canvas.draw()
+	return canvas
+
+STAGES = {"read": stageRead, "header": stageHeader, "data": stageData,
+		"surface": stageSurface, "ground": stageGround, "linfit": stageLinFit,
+		"shotnoise": stageShotNoise, "residual": stageResidual,
+		"residualfft": stageResidualFFT,
+		"forcedrops": stageForceDrops, "plot": stagePlot}
+
+def timeit(function, context, repeat=3):
+	"""
+	return best wall time [s] of repeat calls of function(context)
+	"""
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		function(context)
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best
+
+def run(sizes, stages=STAGE_NAMES, repeat=3, force=False, seed=0, directory=None, verbose=True):
+	"""
+	Run benchmark stages on synthetic files.
+	Input:
+		-sizes: list of sample numbers
+		-stages: list of stage names, see STAGE_NAMES
+		-repeat: number of repetitions, the best time is reported
+		-force: run stages listed in SLOW_STAGES on large files as well
+		-seed: random seed of synthetic profiles
+		-directory: keep synthetic files in directory, temporary if None
+	Returns:
+		-list of result dicts {"stage", "samples", "bytes", "seconds"},
+		 failed stages contain "error" instead of "seconds"
+	"""
+	import matplotlib
+	matplotlib.use("Agg") # no windows from pyplot based functions
+
+	tmp = directory is None
+	if tmp:
+		directory = tempfile.mkdtemp(prefix="smp_benchmark_")
+	elif not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	results = []
+	try:
+		for samples in sizes:
+			fname = writeSynthetic(os.path.join(directory, "SYN%07d.pnt" %samples), samples, seed=seed)
+			context = Context(fname)
+			for stage in stages:
+				if not force and samples > SLOW_STAGES.get(stage, samples):
+					if verbose:
+						print "%-11s %9d samples: skipped" %(stage, samples)
+					continue
+				result = {"stage": stage, "samples": samples, "bytes": len(context.raw)}
+				try:
+					result["seconds"] = timeit(STAGES[stage], context, repeat)
+				except Exception as e:
+					result["error"] = repr(e)
+				results.append(result)
+				if verbose and "error" in result:
+					print "%-11s %9d samples: failed, %s" %(stage, samples, result["error"])
+				elif verbose:
+					print "%-11s %9d samples: %8.4f s" %(stage, samples, result["seconds"])
+	finally:
+		if tmp:
+			shutil.rmtree(directory)
+
+	return results
+
+def environment():
+	"""
+	return dict of versions and platform for the result file
+	"""
+	env = {"python": platform.python_version(),
+		"platform": platform.platform(),
+		"numpy": numpy.__version__,
+		"date": time.strftime("%Y-%m-%d %H:%M:%S")}
+	try:
+		import scipy, matplotlib
+		env["scipy"] = scipy.__version__
+		env["matplotlib"] = matplotlib.__version__
+	except ImportError:
+		pass
+	return env
+
+def compare(results, baseline, tolerance=0.2, minimum=0.01):
+	"""
+	compare results with baseline results
+	return list of (stage, samples, old seconds, new seconds) slower than
+	1 + tolerance and by more than minimum seconds (timer noise)
+	"""
+	old = dict(((r["stage"], r["samples"]), r["seconds"]) for r in baseline if "seconds" in r)
+	slower = []
+	for r in results:
+		key = (r["stage"], r["samples"])
+		if key not in old or "seconds" not in r:
+			continue
+		if r["seconds"] > old[key] * (1 + tolerance) and r["seconds"] - old[key] > minimum:
+			slower.append((r["stage"], r["samples"], old[key], r["seconds"]))
+	return slower
+
+def main(argv=None):
+	"""
+	parse command line, run benchmark and write/compare results
+	"""
+	parser = argparse.ArgumentParser(description="Benchmark SnowMicroPyn on synthetic .pnt files")
+	parser.add_argument("-n", "--samples", type=int, nargs="+", default=[10000, 100000, 1000000], help="number of samples per file")
+	parser.add_argument("-s", "--stages", nargs="+", default=STAGE_NAMES, choices=STAGE_NAMES, help="stages to run")
+	parser.add_argument("-r", "--repeat", type=int, default=3, help="repetitions per stage, best time is reported")
+	parser.add_argument("-o", "--output", help="write results to JSON file")
+	parser.add_argument("-b", "--baseline", help="compare with results of an older run")
+	parser.add_argument("-t", "--tolerance", type=float, default=0.2, help="relative slow down reported as regression")
+	parser.add_argument("-k", "--keep", help="keep synthetic files in directory")
+	parser.add_argument("--seed", type=int, default=0, help="random seed of synthetic profiles")
+	parser.add_argument("--all", action="store_true", help="run slow stages on large files as well")
+	args = parser.parse_args(argv)
+
+	results = run(args.samples, args.stages, args.repeat, args.all, args.seed, args.keep)
+
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump({"environment": environment(), "results": results}, f, indent=1)
+		print "wrote results to %s" %args.output
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)["results"]
+		slower = compare(results, baseline, args.tolerance)
+		for stage, samples, old, new in slower:
+			print "REGRESSION %-11s %9d samples: %.4f s -> %.4f s" %(stage, samples, old, new)
+		if slower:
+			return 1
+		print "no regressions against %s" %args.baseline
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
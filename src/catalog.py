@@ -0,0 +1,233 @@
+"""
+catalog.py contains the Catalog object which keeps the header catalog and
+the summary tables of processed SnowMicroPen .pnt files (see ingest.py).
+
+All tables are tab separated text files which are only ever appended to. A
+file which changed on disk gets a new row, readers use the last row of every
+file. The tables can therefore be followed with tail or opened in a spread
+sheet while the ingest daemon is still running.
+
+example:
+
+import catalog
+
+c = catalog.Catalog("/path/to/catalog") # open or create catalog directory
+
+for row in c.latest("summary").values(): # last summary row of every file
+	print row["File"], row["Max Force [N]"]
+"""
+
+import os
+import logging
+
+__author__ = "SasG"
+__date__ = "26/10/19"
+__version__ = "0.1.0"
+
+log = logging.getLogger("SnowMicroPynCatalog")
+
+# columns of the header catalog, entries after "Size [bytes]" are pnt header keys
+HEADER_COLUMNS = ["File", "Modified", "Size [bytes]",
+				"File Name", "Year", "Month", "Day", "Hour", "Min", "Sec",
+				"Latitude", "Longitude", "Altitude [cm]", "PDOP", "Num Sats",
+				"Force Samples", "Samples Dist [mm]", "Overload [N]",
+				"SMP Serial", "Length [mm]", "Speed [mm/s]", "Comment"]
+
+# columns of the summary table
+SUMMARY_COLUMNS = ["File", "Surface [mm]", "Ground [mm]", "Snow Depth [mm]",
+				"Max Force [N]", "Max Force Depth [mm]",
+				"Offset [N]", "Drift [N/mm]", "Noise [N]",
+				"SN Lambda [1/mm^3]", "SN f0 [N]", "SN Delta [mm]", "SN L [mm]"]
+
+# columns of the error log, files listed here are not processed again until they change
+ERROR_COLUMNS = ["File", "Modified", "Size [bytes]", "Error"]
+
+class Table():
+	def __init__(self, filename, columns, migrate=False):
+		"""
+		Append-only tab separated table.
+		Input:
+			-filename: path to table file, created with header line if missing
+			-columns: list of column names
+			-migrate: rewrite a table with other columns, see migrate(),
+			 otherwise it can be read but not appended to
+		"""
+		self.filename = filename
+		self.columns = list(columns)
+
+		if not os.path.exists(self.filename):
+			with open(self.filename, "w") as f:
+				f.write("#" + "\t".join(self.columns) + "\n")
+		elif self.outdated():
+			if migrate:
+				self.migrate()
+			else:
+				log.warning("%s has the columns of another version, migrate it to append rows" %self.filename)
+
+	def fileColumns(self):
+		"""
+		return list of column names in the header line of the file
+		"""
+		with open(self.filename, "r") as f:
+			return f.readline().lstrip("#").rstrip("\n").split("\t")
+
+	def outdated(self):
+		"""
+		return True if the file has other columns than the table
+		"""
+		return self.fileColumns() != self.columns
+
+	def migrate(self):
+		"""
+		rewrite table written with other columns (e.g. by an older version),
+		new columns stay empty, the old file is kept as filename.bak
+		"""
+		tmp = self.filename + ".tmp"
+		with open(tmp, "w") as f:
+			f.write("#" + "\t".join(self.columns) + "\n")
+			for row in self.read():
+				f.write("\t".join([row.get(key, "") for key in self.columns]) + "\n")
+		backup = self.filename + ".bak"
+		if os.path.exists(backup):
+			os.remove(backup)
+		os.rename(self.filename, backup)
+		os.rename(tmp, self.filename)
+
+	def append(self, rows):
+		"""
+		append list of row dicts {column:value} to table and flush them to disk
+		"""
+		if self.outdated():
+			raise ValueError("%s has the columns of another version, migrate it first" %self.filename)
+		with open(self.filename, "a") as f:
+			for row in rows:
+				values = [asString(row.get(key, "")) for key in self.columns]
+				f.write("\t".join(values) + "\n")
+			f.flush()
+			os.fsync(f.fileno())
+
+	def read(self):
+		"""
+		yield rows of table as dicts {column:value string}
+		"""
+		for offset, row in self.scan():
+			yield row
+
+	def scan(self):
+		"""
+		yield (byte offset, row dict) of every row, see readAt
+		"""
+		with open(self.filename, "r") as f:
+			columns = f.readline().lstrip("#").rstrip("\n").split("\t")
+			while True:
+				offset = f.tell()
+				line = f.readline()
+				if not line:
+					break
+				values = line.rstrip("\n").split("\t")
+				if len(values) == len(columns):
+					yield offset, dict(zip(columns, values))
+				else: # truncated by a crash or written by another version
+					log.warning("%s: skipped row at byte %d with %d instead of %d columns"
+								%(self.filename, offset, len(values), len(columns)))
+
+	def offsets(self, key="File"):
+		"""
+		return dict {key value:byte offset} of the last row of every key value,
+		far smaller than the rows themselves
+		"""
+		return dict((row[key], offset) for offset, row in self.scan())
+
+	def readAt(self, offsets):
+		"""
+		yield row dicts at byte offsets (sorted offsets read the file forward)
+		"""
+		with open(self.filename, "r") as f:
+			columns = f.readline().lstrip("#").rstrip("\n").split("\t")
+			for offset in offsets:
+				f.seek(offset)
+				yield dict(zip(columns, f.readline().rstrip("\n").split("\t")))
+
+def modifiedTime(text):
+	"""
+	return modification time string of the catalog as float, -inf if invalid
+	"""
+	try:
+		return float(text)
+	except ValueError:
+		return float("-inf")
+
+def asString(value):
+	"""
+	return value as string suitable for a tab separated table
+	"""
+	if value is None:
+		return ""
+	if isinstance(value, float):
+		return "%.10g" %value
+	return str(value).replace("\t", " ").replace("\n", " ")
+
+class Catalog():
+	def __init__(self, path, migrate=False):
+		"""
+		Open or create catalog in directory path, tables written by another
+		version are rewritten if migrate (see Table.migrate), read only otherwise.
+		Returns:
+			-self.path: catalog directory
+			-self.tables: dict of tables "header", "summary" and "errors"
+		"""
+		self.path = path
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+
+		self.tables = {"header": Table(os.path.join(self.path, "catalog.txt"), HEADER_COLUMNS, migrate),
+					"summary": Table(os.path.join(self.path, "summary.txt"), SUMMARY_COLUMNS, migrate),
+					"errors": Table(os.path.join(self.path, "errors.txt"), ERROR_COLUMNS, migrate)}
+
+	def outdated(self):
+		"""
+		return sorted names of the tables written by another version
+		"""
+		return sorted(name for name, table in self.tables.items() if table.outdated())
+
+	def processed(self):
+		"""
+		return dict {file:(modified, size)} of all files handled so far,
+		including the ones which could not be read. Of the last header and
+		the last error row of a file the newer one wins (header if equal),
+		e.g. a file which failed and was replaced and processed later.
+		"""
+		state = {}
+		for name in ("errors", "header"):
+			latest = {}
+			for row in self.tables[name].read():
+				latest[row["File"]] = (row["Modified"], row["Size [bytes]"])
+			for path, stamp in latest.items():
+				if path not in state or modifiedTime(stamp[0]) >= modifiedTime(state[path][0]):
+					state[path] = stamp
+		return state
+
+	def latest(self, name="header"):
+		"""
+		return dict {file:row} with the last row of every file in table name
+		"""
+		rows = {}
+		for row in self.tables[name].read():
+			rows[row["File"]] = row
+		return rows
+
+	def spatialIndex(self):
+		"""
+		return extensions.spatial.SpatialIndex over the GPS positions of the
+		latest header rows, for radius, bounding box and nearest queries
+		"""
+		from extensions.spatial import SpatialIndex
+		return SpatialIndex.fromCatalog(self)
+
+	def add(self, header=None, summary=None, error=None):
+		"""
+		append row dicts to the header, summary and error table
+		"""
+		for name, row in (("header", header), ("summary", summary), ("errors", error)):
+			if row is not None:
+				self.tables[name].append([row])
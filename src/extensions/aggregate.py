@@ -0,0 +1,229 @@
+"""
+Streaming depth-wise statistics over many SnowMicroPen profiles.
+
+DepthAggregator takes one profile at a time, averages its force in the bins
+of a fixed depth grid relative to the surface (or the ground) and updates
+per bin a running mean and variance (Welford) and a histogram with
+logarithmic force bins. Memory is bounded by the grid, not by the number of
+profiles, so the mean +- std and percentile envelopes of a whole campaign
+are computed without holding more than one profile. Percentiles are
+interpolated within the histogram bins, their relative error is below half
+the bin ratio (about 2 % with the default 250 bins over 5 decades).
+
+example:
+
+import aggregate
+
+agg = aggregate.DepthAggregator(stop=1500., step=1.)
+agg.addFiles(filenames) # read one by one with pnt.Pnt
+depth, mean, std = agg.depth, agg.mean(), agg.std()
+p = agg.envelope() # 5, 25, 50, 75, 95 % per depth bin
+aggregate.plotEnvelope(agg)
+"""
+
+import numpy
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+class DepthAggregator():
+    def __init__(self, start=0., stop=2000., step=1., fmin=1e-3, fmax=1e2, bins=250):
+        """
+        Empty aggregator, profile values outside start..stop are ignored.
+        Input:
+            -start, stop, step: depth grid relative to the reference [mm]
+            -fmin, fmax, bins: logarithmic force bins of the percentile
+                               histograms [N], forces below fmin and above
+                               fmax are counted in extra bins
+        Returns:
+            -self.depth: bin centers [mm]
+            -self.profiles: number of added profiles
+        """
+        if step <= 0:
+            raise ValueError("depth step must be positive")
+        if not 0 < fmin < fmax:
+            raise ValueError("force range must satisfy 0 < fmin < fmax")
+        self.start = float(start)
+        self.step = float(step)
+        n = max(int(numpy.ceil((stop - start) / self.step)), 1)
+        self.depth = self.start + (numpy.arange(n) + 0.5) * self.step
+        self.profiles = 0
+
+        self.count = numpy.zeros(n, dtype=numpy.int64)
+        self._mean = numpy.zeros(n)
+        self._m2 = numpy.zeros(n)
+        self.minimum = numpy.full(n, numpy.inf)
+        self.maximum = numpy.full(n, -numpy.inf)
+
+        self.edges = numpy.logspace(numpy.log10(fmin), numpy.log10(fmax), bins + 1)
+        self._log_edges = numpy.log10(self.edges)
+        self.hist = numpy.zeros((n, bins + 2), dtype=numpy.uint32)
+
+    def add(self, x, y, reference=0.):
+        """
+        add one profile
+        Input:
+            -x: depth [mm]
+            -y: force [N]
+            -reference: depth of the surface or ground, subtracted from x [mm]
+        """
+        x = numpy.asarray(x, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        n = self.depth.size
+        index = numpy.floor((x - reference - self.start) / self.step).astype(numpy.int64)
+        inside = (index >= 0) & (index < n)
+        samples = numpy.bincount(index[inside], minlength=n)
+        total = numpy.bincount(index[inside], weights=y[inside], minlength=n)
+        d = numpy.nonzero(samples)[0]
+        self.profiles += 1
+        if not d.size:
+            return
+        value = total[d] / samples[d]
+
+        # Welford update, one value per profile and bin
+        self.count[d] += 1
+        delta = value - self._mean[d]
+        self._mean[d] += delta / self.count[d]
+        self._m2[d] += delta * (value - self._mean[d])
+        self.minimum[d] = numpy.minimum(self.minimum[d], value)
+        self.maximum[d] = numpy.maximum(self.maximum[d], value)
+
+        # bins of d are unique, so plain fancy indexing counts correctly
+        self.hist[d, numpy.searchsorted(self.edges, value, side="right")] += 1
+
+    def addFile(self, f, reference="surface"):
+        """
+        add Pnt object f, aligned to its surface or ground (detected if
+        the attribute is missing or 0)
+        """
+        import mathematics as calc
+        x = f.data[:,0]
+        y = f.data[:,1]
+        if reference == "surface":
+            offset = getattr(f, "surface", 0.) or calc.GetSurface(x, y)
+        elif reference == "ground":
+            offset = getattr(f, "ground", None)
+            if offset is None:
+                offset = calc.GetGround(f)
+        else:
+            raise ValueError("reference must be surface or ground")
+        self.add(x, y, offset)
+
+    def addFiles(self, files, reference="surface", reader=None):
+        """
+        add profiles one by one
+        Input:
+            -files: iterable of Pnt objects or file names
+            -reader: callable reading a file name, default pnt.Pnt
+        Returns:
+            -number of added profiles, unreadable files are skipped
+        """
+        added = 0
+        for f in files:
+            if isinstance(f, basestring):
+                if reader is None:
+                    import pnt
+                    reader = pnt.Pnt
+                try:
+                    f = reader(f)
+                except (IOError, ValueError) as e:
+                    print "skipped %s: %s" %(f, e)
+                    continue
+            self.addFile(f, reference)
+            added += 1
+        return added
+
+    def merge(self, other):
+        """
+        add the statistics of an aggregator with the same grid, e.g. of
+        another process
+        """
+        if other.depth.shape != self.depth.shape or other.hist.shape != self.hist.shape:
+            raise ValueError("aggregators have different grids")
+        n = self.count + other.count
+        delta = other._mean - self._mean
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            weight = numpy.where(n > 0, other.count / n.astype(float), 0.)
+        self._mean += delta * weight
+        self._m2 += other._m2 + delta ** 2 * self.count * weight
+        self.count = n
+        self.minimum = numpy.minimum(self.minimum, other.minimum)
+        self.maximum = numpy.maximum(self.maximum, other.maximum)
+        self.hist += other.hist
+        self.profiles += other.profiles
+
+    def mean(self):
+        """mean force per depth bin, NaN for empty bins"""
+        return numpy.where(self.count > 0, self._mean, numpy.nan)
+
+    def std(self, ddof=1):
+        """standard deviation of the force per depth bin"""
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(self.count > ddof, numpy.sqrt(self._m2 / (self.count - ddof)), numpy.nan)
+
+    def quantile(self, q):
+        """
+        approximate quantiles q (0..1) per depth bin
+        Returns:
+            -array of shape (len(q), len(depth)), NaN for empty bins
+        """
+        q = numpy.atleast_1d(numpy.asarray(q, dtype=float))
+        cumulative = numpy.cumsum(self.hist, axis=1, dtype=numpy.int64)
+        rows = numpy.arange(self.depth.size)
+        result = numpy.full((q.size, self.depth.size), numpy.nan)
+        valid = self.count > 0
+        for i, qi in enumerate(q):
+            target = numpy.maximum(qi * self.count, 1e-9)
+            column = (cumulative < target[:, numpy.newaxis]).sum(axis=1)
+            column = numpy.minimum(column, self.hist.shape[1] - 1)
+            below = numpy.where(column > 0, cumulative[rows, column - 1], 0)
+            with numpy.errstate(invalid="ignore", divide="ignore"):
+                fraction = (target - below) / self.hist[rows, column]
+            # column 0 and the last column have no finite edges
+            inner = numpy.clip(column - 1, 0, self._log_edges.size - 2)
+            log_value = self._log_edges[inner] + fraction * (self._log_edges[inner + 1] - self._log_edges[inner])
+            value = 10 ** log_value
+            value = numpy.where(column == 0, self.minimum, value)
+            value = numpy.where(column == self.hist.shape[1] - 1, self.maximum, value)
+            value = numpy.clip(value, self.minimum, self.maximum)
+            result[i] = numpy.where(valid, value, numpy.nan)
+        return result
+
+    def envelope(self, percentiles=PERCENTILES):
+        """
+        percentile envelope per depth bin
+        Returns:
+            -dict percentile: array of forces [N]
+        """
+        values = self.quantile(numpy.asarray(percentiles, dtype=float) / 100.)
+        return dict(zip(percentiles, values))
+
+def plotEnvelope(agg, axes=None, show=True):
+    """
+    plot mean +- std, 5-95 % and 25-75 % bands and the median of a
+    DepthAggregator, depth on the x axis like the profile plots
+    """
+    if axes is None:
+        import matplotlib.pyplot as plt
+        axes = plt.figure("Envelope").add_subplot(111)
+    else:
+        show = False
+
+    mean = agg.mean()
+    std = agg.std()
+    p = agg.envelope((5, 25, 50, 75, 95))
+    valid = agg.count > 0
+    x = numpy.where(valid, agg.depth, numpy.nan)
+    axes.fill_between(agg.depth, p[5], p[95], where=valid, color="0.85", label="5-95 %")
+    axes.fill_between(agg.depth, p[25], p[75], where=valid, color="0.65", label="25-75 %")
+    axes.plot(x, p[50], color="k", label="median")
+    axes.plot(x, mean, color="r", label="mean")
+    axes.plot(x, mean - std, color="r", linestyle="--", label="mean +- std")
+    axes.plot(x, mean + std, color="r", linestyle="--")
+    axes.set_xlabel("Depth [mm]")
+    axes.set_ylabel("Force [N]")
+    axes.set_title("%d profiles" %agg.profiles)
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return axes
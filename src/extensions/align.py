@@ -0,0 +1,139 @@
+"""
+Depth alignment of SnowMicroPen profiles by FFT cross-correlation.
+
+Repeated measurements at one site show the same layers at slightly
+different depths, mostly because of errors of the surface detection.
+estimateShifts resamples the reference and all curves to a coarse regular
+grid, takes the logarithm of the force (layers differ by orders of
+magnitude) and finds the depth shift with the highest normalized cross
+correlation of every curve. The products of all lags of a batch come from
+one FFT over a 2-D array, the sums needed for the normalization over the
+overlap from prefix sums, so a hundred curves take a fraction of a second.
+The peak is refined to a fraction of the grid step by a parabola.
+
+example:
+
+import align
+
+shifts, scores = align.estimateShifts((x_ref, y_ref), [(x1, y1), (x2, y2)])
+x1_aligned = x1 + shifts[0]
+"""
+
+import numpy
+
+def resample(x, y, step):
+    """
+    block mean of y(x) on a regular grid, empty blocks are interpolated
+    Returns:
+        -depth of the first grid point [mm]
+        -resampled values
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    start = x[0]
+    index = numpy.floor((x - start) / step + 0.5).astype(numpy.int64)
+    n = index[-1] + 1
+    count = numpy.bincount(index, minlength=n)
+    total = numpy.bincount(index, weights=y, minlength=n)
+    filled = count > 0
+    values = numpy.empty(n)
+    values[filled] = total[filled] / count[filled]
+    if not filled.all():
+        grid = numpy.arange(n)
+        values[~filled] = numpy.interp(grid[~filled], grid[filled], values[filled])
+    return start, values
+
+def _prefix(values):
+    """cumulative sums of values and squared values with a leading 0"""
+    zero = numpy.zeros(values.shape[:-1] + (1,))
+    return (numpy.concatenate((zero, numpy.cumsum(values, axis=-1)), axis=-1),
+            numpy.concatenate((zero, numpy.cumsum(values ** 2, axis=-1)), axis=-1))
+
+def estimateShifts(ref, curves, step=0.1, max_shift=None, log=True, min_overlap=0.5, floor=1e-3):
+    """
+    depth shift of every curve which matches the reference best
+    Input:
+        -ref: (x, y) of the reference [mm], [N]
+        -curves: list of (x, y), x increasing
+        -step: grid step of the correlation [mm]
+        -max_shift: largest allowed shift [mm], unlimited if None
+        -log: correlate log10 of the force
+        -min_overlap: smallest overlap as fraction of the shorter profile
+        -floor: forces are clipped to floor before the logarithm [N]
+    Returns:
+        -shifts to add to the x of every curve [mm], NaN if no shift is allowed
+        -normalized cross correlation at the shift (-1..1)
+    """
+    def prepare(x, y):
+        start, values = resample(x, y, step)
+        if log:
+            values = numpy.log10(numpy.maximum(values, floor))
+        return start, values
+
+    r_start, r = prepare(*ref)
+    prepared = [prepare(x, y) for x, y in curves]
+    if not prepared:
+        return numpy.zeros(0), numpy.zeros(0)
+    nr = r.size
+    nc = max(values.size for start, values in prepared)
+    nfft = 1 << int(nr + nc - 1).bit_length()
+
+    # one row per curve, zero padded
+    c = numpy.zeros((len(prepared), nc))
+    for i, (start, values) in enumerate(prepared):
+        c[i, :values.size] = values
+    lengths = numpy.array([values.size for start, values in prepared])
+    starts = numpy.array([start for start, values in prepared])
+
+    # products of the overlap of every lag by FFT, corr[k] = sum_j r[j] * c[j + k]
+    lags = numpy.arange(-(nr - 1), nc)
+    k = lags % nfft
+    s_rc = numpy.fft.irfft(numpy.conj(numpy.fft.rfft(r, nfft)) * numpy.fft.rfft(c, nfft), nfft)[:, k]
+
+    # sums of the overlap by prefix sums: r[r0:r1] overlaps c[r0+lag:r1+lag]
+    lengths_ = lengths[:, numpy.newaxis]
+    r0 = numpy.maximum(-lags, 0)
+    r1 = numpy.maximum(numpy.minimum(nr, lengths_ - lags), r0)
+    n = r1 - r0
+    r_sum, r_squares = _prefix(r)
+    c_sum, c_squares = _prefix(c)
+    rows = numpy.arange(len(prepared))[:, numpy.newaxis]
+    s_r = r_sum[r1] - r_sum[r0]
+    s_rr = r_squares[r1] - r_squares[r0]
+    c0 = numpy.minimum(r0 + lags, lengths_)
+    c1 = numpy.minimum(r1 + lags, lengths_)
+    s_c = c_sum[rows, c1] - c_sum[rows, c0]
+    s_cc = c_squares[rows, c1] - c_squares[rows, c0]
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        covariance = s_rc - s_r * s_c / n
+        variance = (s_rr - s_r ** 2 / n) * (s_cc - s_c ** 2 / n)
+        ncc = covariance / numpy.sqrt(numpy.maximum(variance, 0.))
+
+    allowed = n >= min_overlap * numpy.minimum(lengths, nr)[:, numpy.newaxis]
+    shift = r_start - starts[:, numpy.newaxis] - lags * step
+    if max_shift is not None:
+        allowed &= numpy.abs(shift) <= max_shift
+    ncc = numpy.where(allowed & numpy.isfinite(ncc), ncc, -numpy.inf)
+
+    rows = numpy.arange(len(prepared))
+    best = numpy.argmax(ncc, axis=1)
+    score = ncc[rows, best]
+
+    # parabolic refinement with both neighbours allowed
+    left = ncc[rows, numpy.maximum(best - 1, 0)]
+    right = ncc[rows, numpy.minimum(best + 1, lags.size - 1)]
+    curvature = left - 2 * score + right
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        fraction = numpy.where(numpy.isfinite(left) & numpy.isfinite(right) & (curvature < 0),
+                               0.5 * (left - right) / curvature, 0.)
+    shifts = r_start - starts - (lags[best] + fraction) * step
+    shifts[~numpy.isfinite(score)] = numpy.nan
+    return shifts, score
+
+def estimateShift(x_ref, y_ref, x, y, **kwargs):
+    """
+    shift and score of a single curve, see estimateShifts
+    """
+    shifts, scores = estimateShifts((x_ref, y_ref), [(x, y)], **kwargs)
+    return shifts[0], scores[0]
@@ -0,0 +1,295 @@
+"""
+Virtual list of the open measurements for large sessions.
+
+The list control (wx.LC_VIRTUAL) holds no items, it asks FileTable for the
+text of the visible rows only. The columns (date, snow depth, max force, GPS
+position) are numpy arrays built once when files are opened or closed, so
+sorting and filtering are a single argsort or string search over all files
+and selecting a file is a change of the selection state of one row.
+
+ThumbnailGrid shows a sparkline thumbnail of every file (see thumbnails.py),
+taken from the catalog of the files or rendered from the data in memory in
+the background and filled in as they are done.
+
+example:
+
+import browser
+
+table = browser.FileTable(files)
+table.setFilter("S31M")
+table.sort(3, ascending=False) # largest max force first
+index = table.fileIndex(0)     # index into files of the first row
+"""
+
+import os
+import threading
+import numpy
+import wx
+from spatial import validFix
+import thumbnails
+
+# column name, width [px], format of the values
+COLUMNS = [("File", 110, "%s"), ("Date", 125, "%s"), ("Depth [mm]", 75, "%.1f"),
+           ("Max Force [N]", 90, "%.3f"), ("Latitude", 80, "%.5f"), ("Longitude", 80, "%.5f")]
+
+def fileStats(f):
+    """
+    date, snow depth [mm], max force between surface and ground [N],
+    latitude and longitude (NaN without fix) of a Pnt object, cached on
+    the object until surface, ground or data (version) change
+    """
+    key = (f.surface, f.ground, getattr(f, "version", 0))
+    cache = getattr(f, "stats", None)
+    if cache is not None and cache[0] == key:
+        return cache[1]
+
+    header = f.header
+    try:
+        date = "%04d-%02d-%02d %02d:%02d:%02d" %tuple(header[k] for k in ("Year", "Month", "Day", "Hour", "Min", "Sec"))
+    except (KeyError, TypeError):
+        date = ""
+    x = f.data[:,0]
+    start, end = numpy.searchsorted(x, (f.surface, f.ground))
+    fmax = f.data[start:max(end, start + 1),1].max() if x.size else numpy.nan
+    lat = header.get("Latitude", 0.)
+    lon = header.get("Longitude", 0.)
+    if not validFix(lat, lon):
+        lat = lon = numpy.nan
+    stats = (date, f.ground - f.surface, fmax, lat, lon)
+    f.stats = (key, stats)
+    return stats
+
+class FileTable():
+    def __init__(self, files=()):
+        """
+        Columns of the files and the rows shown of them.
+        Returns:
+            -self.order: file indices of the rows, filtered and sorted
+            -self.rows: row of every file, -1 if filtered
+        """
+        self.column = None
+        self.ascending = True
+        self.pattern = ""
+        self.setFiles(files)
+
+    def setFiles(self, files):
+        """rebuild columns of list of Pnt objects, keeps sorting and filter"""
+        stats = [fileStats(f) for f in files]
+        self.names = numpy.array([os.path.basename(f.filename) for f in files] or [""])[:len(files)]
+        self.lower = numpy.char.lower(self.names)
+        self.dates = numpy.array([s[0] for s in stats] or [""])[:len(files)]
+        self.values = numpy.array([s[1:] for s in stats], dtype=float).reshape(-1, 4)
+        self.update()
+
+    def setFile(self, index, f):
+        """
+        update columns of the file index, e.g. after surface or ground
+        changed, returns False if nothing changed
+        """
+        stats = numpy.array(fileStats(f)[1:], dtype=float)
+        if numpy.allclose(stats, self.values[index], rtol=0, atol=0, equal_nan=True):
+            return False
+        self.values[index] = stats
+        if self.column is not None and self.column > 1:
+            self.update()
+        return True
+
+    def __len__(self):
+        return len(self.order)
+
+    def key(self, column):
+        """sort key of all files"""
+        if column == 0:
+            return self.lower
+        if column == 1:
+            return self.dates
+        return self.values[:, column - 2]
+
+    def update(self):
+        """apply filter and sorting"""
+        index = numpy.arange(len(self.names))
+        if self.pattern:
+            index = index[numpy.char.find(self.lower, self.pattern) >= 0]
+        if self.column is not None:
+            key = self.key(self.column)[index]
+            if key.dtype.kind == "f" and not self.ascending:
+                key = -key # NaN stays last
+            order = numpy.argsort(key, kind="mergesort")
+            if key.dtype.kind != "f" and not self.ascending:
+                order = order[::-1]
+            index = index[order]
+        self.order = index
+        self.rows = numpy.full(len(self.names), -1, dtype=int)
+        self.rows[index] = numpy.arange(len(index))
+
+    def sort(self, column, ascending=True):
+        self.column = column
+        self.ascending = ascending
+        self.update()
+
+    def setFilter(self, pattern):
+        """show files with pattern in their name only (case insensitive)"""
+        self.pattern = pattern.strip().lower()
+        self.update()
+
+    def fileIndex(self, row):
+        return int(self.order[row])
+
+    def text(self, row, column):
+        """cell text, empty for missing values"""
+        i = self.order[row]
+        if column == 0:
+            return self.names[i]
+        if column == 1:
+            return self.dates[i]
+        value = self.values[i, column - 2]
+        return "" if numpy.isnan(value) else COLUMNS[column][2] %value
+
+    def step(self, index, offset):
+        """file index offset rows from file index (wrapping), index itself if no rows"""
+        if not len(self.order):
+            return index
+        row = self.rows[index] if 0 <= index < len(self.rows) else -1
+        if row < 0: # filtered: first or last row
+            row = -1 if offset > 0 else len(self.order)
+        return int(self.order[(row + offset) % len(self.order)])
+
+class FileList(wx.ListCtrl):
+    """virtual report list of the open files, click a column to sort"""
+    def __init__(self, parent, size=(-1, -1)):
+        wx.ListCtrl.__init__(self, parent, -1, size=size,
+                             style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL | wx.SUNKEN_BORDER)
+        self.table = FileTable()
+        self.selected = -1 # file index
+        for i, (name, width, fmt) in enumerate(COLUMNS):
+            self.InsertColumn(i, name, width=width)
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.OnColumn)
+
+    def OnGetItemText(self, item, column):
+        return self.table.text(item, column)
+
+    def OnColumn(self, e):
+        column = e.GetColumn()
+        ascending = not (self.table.column == column and self.table.ascending)
+        self.table.sort(column, ascending)
+        self.refresh()
+
+    def setFiles(self, files):
+        """files were opened or closed"""
+        self.table.setFiles(files)
+        self.refresh()
+
+    def setFile(self, index, f):
+        if self.table.setFile(index, f):
+            self.refresh()
+
+    def setFilter(self, pattern):
+        self.table.setFilter(pattern)
+        self.refresh()
+
+    def refresh(self):
+        """new row count, visible rows are redrawn from the table"""
+        self.SetItemCount(len(self.table))
+        # the selection belongs to rows, not files: select the file again
+        self.SetItemState(-1, 0, wx.LIST_STATE_SELECTED | wx.LIST_STATE_FOCUSED)
+        selected, self.selected = self.selected, -1
+        self.select(selected)
+        self.Refresh()
+
+    def select(self, index):
+        """select row of file index (if not filtered) and scroll to it"""
+        if index == self.selected:
+            return
+        rows = self.table.rows
+        if 0 <= self.selected < len(rows) and rows[self.selected] >= 0:
+            self.SetItemState(int(rows[self.selected]), 0, wx.LIST_STATE_SELECTED | wx.LIST_STATE_FOCUSED)
+        self.selected = index
+        if 0 <= index < len(rows) and rows[index] >= 0:
+            row = int(rows[index])
+            state = wx.LIST_STATE_SELECTED | wx.LIST_STATE_FOCUSED
+            self.SetItemState(row, state, state)
+            self.EnsureVisible(row)
+
+    def fileIndex(self, row):
+        return self.table.fileIndex(row)
+
+    def step(self, index, offset):
+        return self.table.step(index, offset)
+
+class ThumbnailGrid(wx.Frame):
+    """small multiples of the open files, double click shows a file in the main window"""
+    def __init__(self, parent, files, directory=thumbnails.cache_dir, size=thumbnails.SIZE):
+        wx.Frame.__init__(self, parent, -1, "Thumbnails", size=(800, 600))
+        self.parent = parent
+        self.files = list(files)
+        self.done = 0
+        self.stopped = False
+
+        # grey placeholders until the thumbnails are rendered
+        placeholder = wx.EmptyBitmap(*size)
+        dc = wx.MemoryDC(placeholder)
+        dc.SetBackground(wx.Brush(wx.Colour(230, 230, 230)))
+        dc.Clear()
+        dc.SelectObject(wx.NullBitmap)
+
+        self.images = wx.ImageList(*size)
+        self.list = wx.ListCtrl(self, -1, style=wx.LC_ICON | wx.LC_AUTOARRANGE | wx.LC_SINGLE_SEL)
+        self.list.SetImageList(self.images, wx.IMAGE_LIST_NORMAL)
+        for i, f in enumerate(self.files):
+            self.images.Add(placeholder)
+            self.list.InsertImageStringItem(i, os.path.basename(f.filename), i)
+
+        self.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnActivate, self.list)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+        self.updateTitle()
+        self.Show()
+
+        # current data, surface, ground and spike removal of the files
+        options = parent.plotOptions
+        despike = (options.spike_window, options.spike_threshold, options.spike_minimum)
+        profiles = [(f.filename, f.data[:,0], f.data[:,1], f.surface, f.ground,
+                     despike if getattr(f, "spikes", None) is not None else None) for f in self.files]
+
+        worker = threading.Thread(target=self.render, args=(profiles, directory, size))
+        worker.daemon = True
+        worker.start()
+
+    def render(self, profiles, directory, size):
+        """worker thread: pass thumbnails to the GUI thread as they are done"""
+        results = thumbnails.renderThumbnails(profiles, directory, size)
+        try:
+            for index, path in results:
+                if self.stopped:
+                    break
+                wx.CallAfter(self.onThumbnail, index, path)
+        finally:
+            results.close() # stops the pool if closed early
+
+    def onThumbnail(self, index, path):
+        if not self or self.stopped: # destroyed or closing
+            return
+        self.done += 1
+        if path is not None:
+            self.images.Replace(index, wx.Bitmap(path, wx.BITMAP_TYPE_PNG))
+            self.list.RefreshItem(index)
+        self.updateTitle()
+
+    def updateTitle(self):
+        if self.done < len(self.files):
+            self.SetTitle("Thumbnails (%d/%d)" %(self.done, len(self.files)))
+        else:
+            self.SetTitle("Thumbnails (%d files)" %len(self.files))
+
+    def OnActivate(self, e):
+        f = self.files[e.GetIndex()]
+        if f not in self.parent.File: # closed in the meantime
+            return
+        self.parent.saveZoom()
+        self.parent.current = self.parent.File.index(f)
+        self.parent.updateIndex()
+        self.parent.draw_figure()
+        self.parent.Raise()
+
+    def OnClose(self, e):
+        self.stopped = True
+        e.Skip()
@@ -0,0 +1,204 @@
+"""
+Common depth grid ("profile cube") of many SnowMicroPen profiles.
+
+ProfileCube resamples any number of profiles onto one regular depth grid
+relative to the surface (or the ground) and keeps them in a single 2-D
+array with one profile per row and a validity mask marking the grid points
+inside every profile. The array can be memory mapped to a file, so whole
+campaigns fit. Mean, difference, RMSE and quantiles are plain vectorized
+operations over the rows.
+
+example:
+
+import cube
+
+c = cube.ProfileCube.fromFiles(files, step=0.1, reference="surface")
+mean, count = c.mean()
+diff = c.subtract(0)     # all profiles minus profile 0
+rmse = c.rmse(0)         # RMSE of all profiles against profile 0
+q = c.quantile([0.25, 0.5, 0.75])
+"""
+
+import numpy
+
+class ProfileCube():
+    def __init__(self, start, stop, step, rows, filename=None, dtype=numpy.float32):
+        """
+        Empty cube of rows profiles on the grid start, start + step, ... <= stop.
+        Input:
+            -start, stop, step: depth grid [mm]
+            -rows: number of profiles
+            -filename: memory map data to this file (mask to filename.mask)
+            -dtype: data type of the resampled forces
+        Returns:
+            -self.depth: grid depths [mm]
+            -self.data: resampled forces, shape (rows, len(depth)), NaN outside
+             the profiles
+            -self.mask: True where data is valid
+        """
+        if step <= 0:
+            raise ValueError("grid step must be positive")
+        self.step = float(step)
+        n = max(int(numpy.floor((stop - start) / self.step + 1e-9)) + 1, 1)
+        self.depth = start + self.step * numpy.arange(n)
+        shape = (int(rows), n)
+        if filename:
+            self.data = numpy.memmap(filename, dtype=dtype, mode="w+", shape=shape)
+            self.mask = numpy.memmap(filename + ".mask", dtype=bool, mode="w+", shape=shape)
+        else:
+            self.data = numpy.empty(shape, dtype=dtype)
+            self.mask = numpy.empty(shape, dtype=bool)
+        self.data[:] = numpy.nan
+        self.mask[:] = False
+        self.names = [None] * shape[0]
+
+    @classmethod
+    def fromProfiles(cls, profiles, step=0.1, method="interp", start=None, stop=None,
+                     names=None, filename=None, dtype=numpy.float32):
+        """
+        resample profiles onto a common grid
+        Input:
+            -profiles: list of (x, y) pairs, x increasing and already aligned [mm]
+            -step: grid spacing [mm]
+            -method: "interp" (linear interpolation) or "block" (mean of the
+                     samples within +-step/2 of every grid point)
+            -start, stop: grid range [mm], default range of all profiles
+            -names: optional list of profile names
+        Returns:
+            -ProfileCube
+        """
+        profiles = [(numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float))
+                    for x, y in profiles]
+        filled = [x for x, y in profiles if x.size]
+        if not filled:
+            raise ValueError("no profiles to resample")
+        if start is None:
+            start = min(x[0] for x in filled)
+        if stop is None:
+            stop = max(x[-1] for x in filled)
+
+        cube = cls(start, stop, step, len(profiles), filename, dtype)
+        for i, (x, y) in enumerate(profiles):
+            if x.size:
+                cube.setRow(i, x, y, method)
+        if names is not None:
+            cube.names = list(names)
+        return cube
+
+    @classmethod
+    def fromFiles(cls, files, step=0.1, reference="surface", **kwargs):
+        """
+        resample Pnt objects with depth relative to their surface or ground
+        attribute, see fromProfiles for the other arguments
+        """
+        if reference not in ("surface", "ground"):
+            raise ValueError("reference must be surface or ground")
+        profiles = [(f.data[:,0] - (getattr(f, reference, 0.) or 0.), f.data[:,1]) for f in files]
+        names = [f.filename for f in files]
+        return cls.fromProfiles(profiles, step, names=names, **kwargs)
+
+    def setRow(self, i, x, y, method="interp"):
+        """
+        resample profile y(x) into row i
+        """
+        n = self.depth.size
+        first = max(int(numpy.ceil((x[0] - self.depth[0]) / self.step - 1e-9)), 0)
+        last = min(int(numpy.floor((x[-1] - self.depth[0]) / self.step + 1e-9)), n - 1)
+        self.data[i] = numpy.nan
+        self.mask[i] = False
+        if last < first:
+            return
+
+        if method == "interp":
+            self.data[i, first:last+1] = numpy.interp(self.depth[first:last+1], x, y)
+            self.mask[i, first:last+1] = True
+        elif method == "block":
+            index = numpy.floor((x - self.depth[0]) / self.step + 0.5).astype(int)
+            inside = (index >= 0) & (index < n)
+            count = numpy.bincount(index[inside], minlength=n)
+            total = numpy.bincount(index[inside], weights=y[inside], minlength=n)
+            valid = count > 0
+            self.data[i, valid] = total[valid] / count[valid]
+            self.mask[i] = valid
+        else:
+            raise ValueError("unknown resampling method %s" %method)
+
+    def rows(self, rows=None):
+        """data and mask of the selected rows (all if None)"""
+        if rows is None:
+            return self.data, self.mask
+        return self.data[rows], self.mask[rows]
+
+    def mean(self, rows=None, complete=False):
+        """
+        mean over the profiles at every grid point
+        Input:
+            -rows: indices of the profiles, all if None
+            -complete: only where all profiles are valid, NaN elsewhere
+        Returns:
+            -mean force, NaN without valid profiles
+            -number of valid profiles per grid point
+        """
+        data, mask = self.rows(rows)
+        count = mask.sum(axis=0)
+        total = numpy.where(mask, data, 0.).sum(axis=0, dtype=float)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+        mean[count == 0] = numpy.nan
+        if complete:
+            mean[count < len(mask)] = numpy.nan
+        return mean, count
+
+    def std(self, rows=None):
+        """standard deviation over the profiles at every grid point"""
+        data, mask = self.rows(rows)
+        mean, count = self.mean(rows)
+        squares = numpy.where(mask, (data - mean) ** 2, 0.).sum(axis=0, dtype=float)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return numpy.where(count > 0, numpy.sqrt(squares / count), numpy.nan)
+
+    def subtract(self, ref, rows=None):
+        """
+        difference of the profiles and profile ref (row index or array of
+        len(depth)), NaN where either is invalid
+        """
+        data, mask = self.rows(rows)
+        if numpy.ndim(ref) == 0:
+            ref = self.data[ref]
+        with numpy.errstate(invalid="ignore"):
+            return numpy.where(mask, data - numpy.asarray(ref, dtype=float), numpy.nan)
+
+    def rmse(self, ref, rows=None, root=True):
+        """
+        root mean squared difference of every profile and profile ref over
+        their common valid range, NaN without overlap; the plain mean
+        squared difference like calc.rsme if not root
+        """
+        diff = self.subtract(ref, rows)
+        valid = numpy.isfinite(diff)
+        count = valid.sum(axis=-1)
+        total = numpy.where(valid, diff ** 2, 0.).sum(axis=-1)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            mse = numpy.where(count > 0, total / count, numpy.nan)
+        return numpy.sqrt(mse) if root else mse
+
+    def quantile(self, q, rows=None):
+        """
+        quantiles q (0..1) over the profiles at every grid point
+        Returns:
+            -array of shape (len(q), len(depth)), NaN without valid profiles
+        """
+        data, mask = self.rows(rows)
+        values = numpy.where(mask, data, numpy.nan)
+        q = numpy.atleast_1d(q)
+        result = numpy.full((q.size, self.depth.size), numpy.nan)
+        valid = mask.any(axis=0)
+        if valid.any():
+            result[:, valid] = numpy.nanpercentile(values[:, valid], q * 100., axis=0)
+        return result
+
+    def flush(self):
+        """write memory mapped data to disk"""
+        for array in (self.data, self.mask):
+            if isinstance(array, numpy.memmap):
+                array.flush()
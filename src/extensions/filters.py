@@ -0,0 +1,74 @@
+"""
+Zero-phase Butterworth low pass filtering with cached filter designs.
+
+Designs are memoized by (order, cutoff, sampling frequency), so repeated
+calls with the same parameters (e.g. one per opened file, or the cutoff
+frequencies of a residual analysis) design every filter only once. Filters
+are applied as second-order sections, which stay numerically stable for
+low cutoff frequencies and higher orders where the b/a form breaks down.
+Older scipy versions without sosfiltfilt fall back to the b/a form.
+
+example:
+
+import filters
+
+y_filtered = filters.lowpass(y, cutoff=5, freq=242) # single signal
+Y_filtered = filters.lowpass(Y, cutoff=5, freq=242) # one signal per row
+"""
+
+import numpy
+
+_designs = {}
+
+def design(order, cutoff, freq):
+    """
+    return cached Butterworth low pass design
+    Input:
+        -order: filter order
+        -cutoff: cutoff frequency, same unit as freq
+        -freq: sampling frequency
+    Returns:
+        -tuple ("sos", sos) or ("ba", (b, a)) if scipy has no sosfiltfilt
+    """
+    key = (int(order), float(cutoff), float(freq))
+    try:
+        return _designs[key]
+    except KeyError:
+        pass
+
+    from scipy import signal
+    wn = key[1] / (key[2] / 2.)
+    if not 0 < wn < 1:
+        raise ValueError("cutoff frequency %g must be between 0 and the Nyquist frequency %g" %(cutoff, freq / 2.))
+
+    if hasattr(signal, "sosfiltfilt"):
+        filt = ("sos", signal.butter(key[0], wn, btype="low", output="sos"))
+    else:
+        filt = ("ba", signal.butter(key[0], wn, btype="low"))
+    _designs[key] = filt
+    return filt
+
+def lowpass(y, cutoff, freq, order=2):
+    """
+    zero-phase Butterworth low pass filter along the last axis of y
+    Input:
+        -y: 1-D signal or 2-D array with one signal per row
+        -cutoff: cutoff frequency, same unit as freq
+        -freq: sampling frequency
+        -order: filter order
+    Returns:
+        -filtered array, same shape as y, a copy of y for cutoff frequencies
+         at or above the Nyquist frequency which attenuate nothing
+    """
+    if cutoff >= freq / 2.:
+        return numpy.array(y, dtype=float)
+    from scipy import signal
+    kind, coefficients = design(order, cutoff, freq)
+    if kind == "sos":
+        return signal.sosfiltfilt(coefficients, y, axis=-1)
+    b, a = coefficients
+    return signal.filtfilt(b, a, y, axis=-1)
+
+def clear():
+    """forget all cached designs"""
+    _designs.clear()
@@ -1,13 +1,120 @@
 import wx
 from cStringIO import StringIO
-import os, string, urllib2
+import os, string, urllib2, hashlib, threading, time
 from menus import CheckListCtrl
+from spatial import SpatialIndex, validFix
 
 #globals
 map_types = ["Satellite","Road Map","Hybrid","Terrain"]
 slf_coords = [46.812151, 9.847202] 
 icon = "http://tinyurl.com/p93j947"
 
+#fetched images are cached here, offline maps use slippy map tiles
+#tile_dir/<maptype>/<zoom>/<x>/<y>.png (e.g. downloaded in advance) if present
+cache_dir = os.path.join(os.path.expanduser("~"), ".SnowMicroPyn", "mapcache")
+tile_dir = os.path.join(os.path.expanduser("~"), ".SnowMicroPyn", "tiles")
+
+#after a failed request maps are rendered offline for offline_retry [s]
+#without waiting for the timeout again, shared by all map windows
+offline_retry = 60.
+offline_since = None
+
+class ImageCache():
+    """disk cache of map images, least recently used images are removed
+    when the cache grows beyond max_bytes"""
+    def __init__(self, path=cache_dir, max_bytes=50*2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+            
+    def key(self, *parts):
+        return hashlib.md5(repr(parts)).hexdigest()
+    
+    def get(self, key):
+        """cached image data or None, a hit marks the image as recently used"""
+        path = os.path.join(self.path, key + ".png")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)
+            return data
+        except (IOError, OSError):
+            return None
+        
+    def put(self, key, data):
+        path = os.path.join(self.path, key + ".png")
+        tmp = "%s.%d.tmp" %(path, threading.current_thread().ident)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.rename(tmp, path)
+        self.evict()
+        
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".png"):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue #removed by another thread
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum([entry[1] for entry in entries])
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+def mercator(lat, lon, zoom):
+    """web mercator world pixel coordinates at zoom"""
+    import numpy
+    world = 256 * 2 ** zoom
+    lat = numpy.radians(numpy.clip(lat, -85.05, 85.05))
+    x = (numpy.asarray(lon) + 180.) / 360. * world
+    y = (1 - numpy.log(numpy.tan(lat) + 1 / numpy.cos(lat)) / numpy.pi) / 2. * world
+    return x, y
+
+def renderOffline(markers, center, zoom, size=250, maptype="satellite", scale=2, tiles=tile_dir):
+    """render markers [(label, lat, lon)] around center with matplotlib,
+    on local tiles if available, returns png data"""
+    import numpy
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.image import imread
+    
+    fig = Figure(figsize=(size * scale / 100., size * scale / 100.), dpi=100, facecolor="0.9")
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    cx, cy = mercator(center[0], center[1], zoom)
+    x0, x1 = cx - size / 2., cx + size / 2.
+    y0, y1 = cy - size / 2., cy + size / 2.
+    
+    for tx in range(int(x0 // 256), int(x1 // 256) + 1):
+        for ty in range(int(y0 // 256), int(y1 // 256) + 1):
+            path = os.path.join(tiles, maptype, str(zoom), str(tx % 2 ** zoom), "%d.png" %ty)
+            if os.path.exists(path):
+                ax.imshow(imread(path), extent=[tx * 256, (tx + 1) * 256, (ty + 1) * 256, ty * 256],
+                          interpolation="bilinear")
+    
+    if markers:
+        labels, lat, lon = zip(*markers)
+        x, y = mercator(numpy.array(lat), numpy.array(lon), zoom)
+        ax.scatter(x, y, s=60, c="red", edgecolors="k", zorder=3)
+        for label, xi, yi in zip(labels, x, y):
+            ax.annotate(label, (xi, yi), xytext=(4, 4), textcoords="offset points", zorder=4)
+    ax.text(0.02, 0.02, "offline, zoom %d" %zoom, transform=ax.transAxes, fontsize=8)
+    ax.set_xlim(x0, x1)
+    ax.set_ylim(y1, y0)
+    ax.set_axis_off()
+    
+    out = StringIO()
+    fig.canvas.print_png(out)
+    return out.getvalue()
+
 class Map(wx.Frame):
     """main Frame"""
     def __init__(self, parent, id, files=[], title="Measurement Locations"):
@@ -20,22 +127,24 @@ class Map(wx.Frame):
         self.label = []
         self.zoom = 14
         self.maptype = "satellite"
+        self.cache = ImageCache()
+        self.timer = None
+        self.request = 0
+        self.updating = False # OnCheckItem does nothing while True
         
-        
-        if self.internet_on():
-            self.createItems()
-            if  self.isListChecked():
-                self.bmp = self.getImage()
-                self.updatePicture()
-                self.createLayout()
-                self.Centre()
-                self.Show()
+        self.createItems()
+        if  self.isListChecked():
+            self.bmp = wx.EmptyBitmap(500, 500)
+            self.updatePicture()
+            self.createLayout()
+            self.Centre()
+            self.Show()
+            self.startRequest()
         else:
-            self.Destroy() 
-        
-    def getImage(self, resolution="250x250"):
-        """ capture image from google static api"""
+            self.Destroy()
         
+    def imageRequest(self, resolution="250x250"):
+        """parameters of a map image, read from the widgets on the GUI thread"""
         self.GetCenter()
         base = "http://maps.googleapis.com/maps/api/staticmap?"
         center = "center=" + str(self.center[0]) + "," + str(self.center[1])
@@ -46,11 +155,69 @@ class Map(wx.Frame):
         marker = self.GetLabel()
         sensor = "&sensor=false"
         url = base + center + size + zoom + scale + maptype + marker + sensor
-        imagedata = StringIO(urllib2.urlopen(url).read())
+        markers = self.getMarkers() or [("", slf_coords[0], slf_coords[1])]
+        return {"url": url, "key": self.cache.key(tuple(self.center), self.zoom, self.maptype, marker, resolution),
+                "markers": markers, "center": tuple(self.center), "zoom": self.zoom,
+                "maptype": self.maptype, "size": int(resolution.split("x")[0])}
+        
+    def loadImage(self, request):
+        """image data from cache, google static api or offline rendering,
+        runs on a worker thread"""
+        global offline_since
+        data = self.cache.get(request["key"])
+        if data is not None:
+            return data
+        if offline_since is None or time.time() - offline_since > offline_retry:
+            try:
+                data = urllib2.urlopen(request["url"], timeout=5).read()
+                self.cache.put(request["key"], data)
+                offline_since = None
+                return data
+            except Exception as e:
+                print "map offline (%s), rendering locally" %e
+                offline_since = time.time()
+        return renderOffline(request["markers"], request["center"], request["zoom"],
+                             request["size"], request["maptype"])
+        
+    def getImage(self, resolution="250x250"):
+        """ capture image (blocking)"""
+        imagedata = StringIO(self.loadImage(self.imageRequest(resolution)))
         self.stream = wx.ImageFromStream(imagedata)
         bmp = wx.BitmapFromImage(self.stream)
         return bmp
     
+    def requestImage(self, delay=300):
+        """update image after delay [ms] without further requests"""
+        if self.timer is not None and self.timer.IsRunning():
+            self.timer.Restart(delay)
+        else:
+            self.timer = wx.CallLater(delay, self.startRequest)
+            
+    def startRequest(self):
+        """load image on a worker thread, only the latest request is shown"""
+        self.request += 1
+        token = self.request
+        request = self.imageRequest()
+        def work():
+            try:
+                data = self.loadImage(request)
+            except Exception as e:
+                print "could not load map: %s" %e
+                return
+            wx.CallAfter(self.onImage, token, data)
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+        
+    def onImage(self, token, data):
+        """show loaded image if it belongs to the latest request"""
+        if not self or token != self.request:
+            return
+        self.stream = wx.ImageFromStream(StringIO(data))
+        self.bmp = wx.BitmapFromImage(self.stream)
+        self.updatePicture()
+        self.Layout()
+    
     def updatePicture(self):
         """update image"""
         self.picture.SetFocus()
@@ -65,6 +232,8 @@ class Map(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSave, qms)
         qec = self.fileMenu.Append(wx.ID_ANY, '&Export Coordinates')
         self.Bind(wx.EVT_MENU, self.OnExport, qec)
+        qsn = self.fileMenu.Append(wx.ID_ANY, 'Select &Nearby...')
+        self.Bind(wx.EVT_MENU, self.OnSelectNearby, qsn)
         qme = self.fileMenu.Append(wx.ID_EXIT, '&Quit')
         self.Bind(wx.EVT_MENU, self.OnQuit, qme)
         self.menubar.Append(self.fileMenu, '&File')
@@ -135,47 +304,72 @@ class Map(wx.Frame):
         
     def OnCheckItem(self, index, flag):
         """checking item event"""
-        if self.files[index].header["Latitude"] == 0.0 or self.files[index].header["Latitude"] > 180:
+        if self.updating:
+            return
+        header = self.files[index].header
+        if not validFix(header["Latitude"], header["Longitude"]):
             self.list.CheckItem(index, False)
         else:
-            self.zoom = self.slider.GetValue()
-            map = self.combo.GetValue()
-            "Satellite","Road Map","Hybrid","Terrain"
-            if map == "Satellite":  self.maptype = "satellite"
-            if map == "Road Map":   self.maptype = "roadmap"
-            if map == "Hybrid":     self.maptype = "hybrid"
-            if map == "Terrain":    self.maptype = "terrain"
-            
-            
-            self.bmp = self.getImage()
-            self.updatePicture()
-            self.createLayout()
-            self.Update()
+            self.OnEvent(None)
            
     def GetCenter(self): 
         """get center of active coordinates"""           
-        try:
-            sum_lat = 0
-            sum_long = 0
-            i = 0
-            for entry in range(len(self.files)):
-                if self.list.IsChecked(entry):
-                    sum_lat += self.files[entry].header["Latitude"]
-                    sum_long += self.files[entry].header["Longitude"]
-                    i += 1
-            self.center = [sum_lat/float(i),sum_long/float(i)]
-                    
-        except:
+        checked = [entry for entry in range(len(self.files)) if self.list.IsChecked(entry)]
+        center = self.getIndex().center(checked)
+        if center is None:
             self.center = slf_coords
-            pass
+        else:
+            self.center = list(center)
+            
+    def getIndex(self):
+        """spatial index of the files, built on first use"""
+        if getattr(self, "index", None) is None:
+            self.index = SpatialIndex.fromFiles(self.files)
+        return self.index
+        
+    def OnSelectNearby(self,e):
+        """check all files within a radius of the selected file"""
+        selected = self.list.GetFirstSelected()
+        if selected < 0 or not self.getIndex().valid[selected]:
+            wx.MessageBox("Select a file with GPS position in the list first.", "Info",
+                          wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        dlg = wx.TextEntryDialog(self, "Radius around %s [m]" %self.list.GetItemText(selected),
+                                 "Select Nearby", "50")
+        if dlg.ShowModal() == wx.ID_OK:
+            try:
+                radius = float(dlg.GetValue())
+            except ValueError:
+                radius = None
+            if radius is not None:
+                index = self.getIndex()
+                near, distance = index.radius(index.lat[selected], index.lon[selected], radius)
+                near = set(near)
+                #check all items first, the map is updated once
+                self.updating = True
+                try:
+                    for entry in range(len(self.files)):
+                        self.list.CheckItem(entry, entry in near)
+                finally:
+                    self.updating = False
+                self.OnCheckItem(selected, True)
+        dlg.Destroy()
+     
+    def getMarkers(self):
+        """list of (label, latitude, longitude) of the checked files"""
+        markers = []
+        for entry in range(len(self.files)):
+            if self.list.IsChecked(entry):
+                markers.append((self.label[entry], self.files[entry].header["Latitude"], self.files[entry].header["Longitude"]))
+        return markers
      
     def GetLabel(self):
         """create labels for google static api"""
         try:
             label = []
-            for entry in range(len(self.files)):
-                if self.list.IsChecked(entry):
-                    label.append("&markers=size:mid|color:red%7Clabel:" + self.label[entry] + "%7C" + str(self.files[entry].header["Latitude"]) + "," + str(self.files[entry].header["Longitude"]))                    
+            for name, lat, lon in self.getMarkers():
+                label.append("&markers=size:mid|color:red%7Clabel:" + name + "%7C" + str(lat) + "," + str(lon))
         except:
             label = "&markers=size:mid|color:red%7Clabel:" + "A" + "%7C" + str(slf_coords[0]) + "," + str(slf_coords[1])
             pass
@@ -205,20 +399,6 @@ class Map(wx.Frame):
         sizer.Add(rightbox)
         self.SetSizerAndFit(sizer)
 
-    def internet_on(self):
-        """check if internet connection can be established"""
-        try:
-            urllib2.urlopen('http://74.125.228.100',timeout=2)
-            return True
-        except urllib2.URLError:
-            message = """No Internet Connection established.
-                        Can't show google maps."""
-            caption = "Warning"
-            warning = wx.MessageDialog(self,message,caption,wx.OK) 
-            warning.ShowModal()
-            warning.Destroy()
-            return False
-    
     def OnEvent(self,e):
         """define user events"""
         self.zoom = self.slider.GetValue()
@@ -229,10 +409,7 @@ class Map(wx.Frame):
         if map == "Hybrid":     self.maptype = "hybrid"
         if map == "Terrain":    self.maptype = "terrain"
         
-        self.bmp = self.getImage()
-        self.updatePicture()
-        self.createLayout()
-        self.Update()
+        self.requestImage()
 
     def OnSave(self,e):
         """save button functionality"""
@@ -1,5 +1,11 @@
 import numpy
+import profiler
+from median import blockMedian, slidingMedian
+from filters import lowpass
+from ruptures import detectDrops, plotHistogram
+from transect import windowedLogMedian, buildTransect, plotTransect
 
+@profiler.timed("mathematics.downsample")
 def downsample(x,n=2):
     """downsample array x by factor n"""
     if n > 1:
@@ -11,6 +17,7 @@ def downsample(x,n=2):
             raise
     return x
     
+@profiler.timed("mathematics.smooth")
 def smooth(x,window_len=11,window='hanning'):
     """smooth the data using a window with requested size"""
 
@@ -36,6 +43,7 @@ def smooth(x,window_len=11,window='hanning'):
     y = numpy.convolve(w/w.sum(),s,mode='valid')
     return y
 
+@profiler.timed("mathematics.GetSurface")
 def GetSurface(x_orig, y_orig):
     """find surface of file[index]"""
 
@@ -45,11 +53,6 @@ def GetSurface(x_orig, y_orig):
     y = downsample(y, 20)
     x = downsample(x, 20)
     
-    try:
-        x,y = butterworth(x,y,c=1)
-    except:
-        print "Could not apply Butterworth filter"
-        
     y_grad = numpy.gradient(y)
     y_grad = downsample(y_grad, 3)
     x_grad = downsample(x, 3)
@@ -73,6 +76,7 @@ def GetSurface(x_orig, y_orig):
     print "surface: %0.2f mm"%surface
     return surface
  
+@profiler.timed("mathematics.GetGround", size=profiler.dataBytes)
 def GetGround(pnt):
     """find ground of pnt object"""
     x = pnt.data[:,0]
@@ -95,6 +99,7 @@ def GetGround(pnt):
     print "gound :%0.2f mm" %ground
     return ground
      
+@profiler.timed("mathematics.linFit")
 def linFit(x, y, surface=None):
     x = x[10:]
     y = y[10:]
@@ -110,63 +115,83 @@ def linFit(x, y, surface=None):
     return x,y_fit,m,c,std
 
 
-from scipy.signal import butter, filtfilt
-import matplotlib.pyplot as plt
-import scipy.fftpack
+@profiler.timed("mathematics.hardnessDepths")
+def hardnessDepths(x, y, thresholds, surface=0.):
+    """depth below surface and force where y first reaches every force threshold,
+    NaN for thresholds which are never reached"""
+    thresholds = numpy.atleast_1d(numpy.asarray(thresholds, dtype=float))
+    depths = numpy.full(thresholds.shape, numpy.nan)
+    forces = numpy.full(thresholds.shape, numpy.nan)
+    if len(y) == 0:
+        return depths, forces
+
+    y_max = numpy.maximum.accumulate(y) # first y >= t is first y_max >= t
+    i = numpy.searchsorted(y_max, thresholds, side="left")
+    reached = i < len(y)
+    depths[reached] = numpy.asarray(x)[i[reached]] - surface
+    forces[reached] = numpy.asarray(y)[i[reached]]
+    return depths, forces
+
+def hardnessDepthsFiles(files, thresholds):
+    """hardnessDepths for a list of Pnt objects, returns arrays (files x thresholds)"""
+    thresholds = numpy.atleast_1d(numpy.asarray(thresholds, dtype=float))
+    depths = numpy.full((len(files), thresholds.size), numpy.nan)
+    forces = numpy.full((len(files), thresholds.size), numpy.nan)
+    for n, f in enumerate(files):
+        depths[n], forces[n] = hardnessDepths(f.data[:,0], f.data[:,1], thresholds, getattr(f, "surface", 0.))
+    return depths, forces
+
+@profiler.timed("mathematics.butterworth")
 def butterworth(x,y,freq=242, c=5, o=2, show=False):
     """Filter signal y(x) with sampling frequency f using a o-order butterworth filter
-       and cutoff frequency c""" 
-    
-    # Butterworth filter
-    b, a = butter(o, (c/(freq/2)), btype = 'low')
-    y2 = filtfilt(b, a, y) # filter with phase shift correction
-    # plot
-    """    fig, ax1 = plt.subplots(1,1)
-    ax1.plot(x,  y, 'r.-', linewidth=1, label = 'raw data')
-    ax1.plot(x, y2, 'g.-', linewidth=1, label = 'filtfilt')
-    ax1.legend(frameon=False, fontsize=14)
-    ax1.set_xlabel("Dist [mm]"); ax1.set_ylabel("Force [N]");
+       and cutoff frequency c, y can hold one signal per row"""
+    y2 = lowpass(y, c, freq, o) # filter with phase shift correction
 
-    plt.show()"""
-    
     if show:
-    # 2nd derivative of the data
-        ydd = numpy.diff(y,2)*freq*freq   # raw data
-        y2dd = numpy.diff(y2,2)*freq*freq # filtered data
-        # frequency content 
-        yfft = numpy.abs(scipy.fftpack.fft(y))/(y.size/2);   # raw data
-        y2fft = numpy.abs(scipy.fftpack.fft(y2))/(y.size/2); # filtered data
-        freqs = scipy.fftpack.fftfreq(y.size, 1./freq)
-        yddfft = numpy.abs(scipy.fftpack.fft(ydd))/(ydd.size/2);
-        y2ddfft = numpy.abs(scipy.fftpack.fft(y2dd))/(ydd.size/2);
-        freqs2 = scipy.fftpack.fftfreq(ydd.size, 1./freq)
-    
-        fig, ((ax1,ax2),(ax3,ax4)) = plt.subplots(2, 2)
-        
-        ax1.set_title('Temporal domain', fontsize=14)
-        ax1.plot(x, y, 'r', linewidth=1, label = 'raw data')
-        ax1.plot(x, y2, 'b', linewidth=1, label = 'filtered @ %.2f per mm'%c)
-        ax1.set_ylabel('f')
-        ax1.legend(frameon=False, fontsize=12)
-        
-        ax2.set_title('Frequency domain', fontsize=14)
-        ax2.plot(freqs[:yfft.size/2], yfft[:yfft.size/2],'r',  linewidth=1,label='raw data')
-        ax2.plot(freqs[:yfft.size/2],y2fft[:yfft.size/2],'b--',linewidth=1,label='filtered @ %.2f per mm' %c)
-        ax2.set_ylabel('FFT(f)')
-        ax2.legend(frameon=False, fontsize=12)
-        
-        ax3.plot(x[:-2], ydd, 'r', linewidth=1, label = 'raw')
-        ax3.plot(x[:-2], y2dd, 'b', linewidth=1, label = 'filtered @ %.2f Hz'%c)
-        ax3.set_xlabel('Depth [mm]'); ax3.set_ylabel("f ''")
-        
-        ax4.plot(freqs[:yddfft.size/2], yddfft[:yddfft.size/2], 'r', linewidth=1, label = 'raw')
-        ax4.plot(freqs[:yddfft.size/2],y2ddfft[:yddfft.size/2],'b--',linewidth=1,label='filtered @ %.2f per mm'%c)
-        ax4.set_xlabel('Frequency [$mm^{-1}$]'); ax4.set_ylabel("FFT(f '')");
-        
-        plt.show()
-    
-    return x,y
+        plotButterworth(x, y, y2, freq, c)
 
+    return x,y2
+
+def plotButterworth(x, y, y2, freq, c):
+    """plot raw and filtered signal and their second derivatives in spatial and frequency domain"""
+    import matplotlib.pyplot as plt
+    import scipy.fftpack
+    # 2nd derivative of the data
+    ydd = numpy.diff(y,2)*freq*freq   # raw data
+    y2dd = numpy.diff(y2,2)*freq*freq # filtered data
+    # frequency content 
+    yfft = numpy.abs(scipy.fftpack.fft(y))/(y.size/2);   # raw data
+    y2fft = numpy.abs(scipy.fftpack.fft(y2))/(y.size/2); # filtered data
+    freqs = scipy.fftpack.fftfreq(y.size, 1./freq)
+    yddfft = numpy.abs(scipy.fftpack.fft(ydd))/(ydd.size/2);
+    y2ddfft = numpy.abs(scipy.fftpack.fft(y2dd))/(ydd.size/2);
+    freqs2 = scipy.fftpack.fftfreq(ydd.size, 1./freq)
+
+    fig, ((ax1,ax2),(ax3,ax4)) = plt.subplots(2, 2)
+    
+    ax1.set_title('Temporal domain', fontsize=14)
+    ax1.plot(x, y, 'r', linewidth=1, label = 'raw data')
+    ax1.plot(x, y2, 'b', linewidth=1, label = 'filtered @ %.2f per mm'%c)
+    ax1.set_ylabel('f')
+    ax1.legend(frameon=False, fontsize=12)
+    
+    ax2.set_title('Frequency domain', fontsize=14)
+    ax2.plot(freqs[:yfft.size/2], yfft[:yfft.size/2],'r',  linewidth=1,label='raw data')
+    ax2.plot(freqs[:yfft.size/2],y2fft[:yfft.size/2],'b--',linewidth=1,label='filtered @ %.2f per mm' %c)
+    ax2.set_ylabel('FFT(f)')
+    ax2.legend(frameon=False, fontsize=12)
+    
+    ax3.plot(x[:-2], ydd, 'r', linewidth=1, label = 'raw')
+    ax3.plot(x[:-2], y2dd, 'b', linewidth=1, label = 'filtered @ %.2f Hz'%c)
+    ax3.set_xlabel('Depth [mm]'); ax3.set_ylabel("f ''")
+    
+    ax4.plot(freqs[:yddfft.size/2], yddfft[:yddfft.size/2], 'r', linewidth=1, label = 'raw')
+    ax4.plot(freqs[:yddfft.size/2],y2ddfft[:yddfft.size/2],'b--',linewidth=1,label='filtered @ %.2f per mm'%c)
+    ax4.set_xlabel('Frequency [$mm^{-1}$]'); ax4.set_ylabel("FFT(f '')");
+    
+    plt.show()
+
+@profiler.timed("mathematics.rsme")
 def rsme(x_ref,x_sub, norm = False):
     rsme = ((x_ref - x_sub) ** 2).mean()
     if norm:
@@ -196,7 +221,6 @@ def rsme(x_ref,x_sub, norm = False):
 """#from numpy.fft import fft, ifft
 import numpy
 from numpy import  arange, isrealobj
-from pylab import rms_flat
 
 __all__ = ['CORRELATION', 'xcorr']
 
@@ -252,7 +276,7 @@ def CORRELATION(x, y=None, maxlags=None, norm='unbiased'):
     """
     assert norm in ['unbiased','biased', 'coeff', None]
     #transform lag into list if it is an integer
-    if y == None:
+    if y is None:
         y = x
     
     # N is the max of x and y
@@ -277,6 +301,7 @@ def CORRELATION(x, y=None, maxlags=None, norm='unbiased'):
         r = numpy.zeros(maxlags, dtype=complex)
 
     if norm == 'coeff':
+        from pylab import rms_flat
         rmsx = rms_flat(x)
         rmsy = rms_flat(y)
         
@@ -312,6 +337,7 @@ def CORRELATION(x, y=None, maxlags=None, norm='unbiased'):
     return r
  
 
+@profiler.timed("mathematics.xcorr")
 def xcorr(x, y=None, maxlags=None, norm='biased'):
     """Cross-correlation using numpy.correlate
     
@@ -361,7 +387,7 @@ def xcorr(x, y=None, maxlags=None, norm='biased'):
     .. seealso:: :func:`CORRELATION`.  
     """
     N = len(x)
-    if y == None:
+    if y is None:
         y = x
     assert len(x) == len(y), 'x and y must have the same length. Add zeros if needed'
     assert maxlags <= N, 'maxlags must be less than data length'
@@ -381,6 +407,7 @@ def xcorr(x, y=None, maxlags=None, norm='biased'):
     elif norm == 'unbiased':
         res = res[lags] / (float(N)-abs(arange(-N+1, N)))[lags]
     elif norm == 'coeff':        
+        from pylab import rms_flat
         Nf = float(N)
         rms = rms_flat(x) * rms_flat(y)
         res = res[lags] / rms / Nf
@@ -390,7 +417,6 @@ def xcorr(x, y=None, maxlags=None, norm='biased'):
     lags = arange(-maxlags, maxlags+1)        
     return res, lags
 
-from scipy.signal import detrend
 def shotnoise(dz,f_z,A_cone=19.6):
     """This functions calculates the shot noise parameters from the 
     SMP penetration force correlation function according to:
@@ -399,6 +425,7 @@ def shotnoise(dz,f_z,A_cone=19.6):
     d_z:
     f_z: array with force values
     A-cone: projected cone area [mm^2]"""
+    from scipy.signal import detrend
     
     N = len(f_z)
     
@@ -412,10 +439,44 @@ def shotnoise(dz,f_z,A_cone=19.6):
     delta = -3./2 * C_f[N-1] / ((C_f[N]) - C_f[N-1]) * dz # eq. 11 in Loewe and van Herwijnen, 2012  
     Lambda = 4./3 * (c1**2) / c2 / delta # eq. 12 in Loewe and van Herwijnen, 2012
     f_0 = 3./2 * c2 / c1 # eq. 12 in Loewe and van Herwijnen, 2012
-    L = (A_cone/Lambda)**1/3
+    L = (A_cone/Lambda)**(1./3) # cube root
     
     return Lambda, f_0, delta, L 
 
+def shotNoiseWindows(y, start, end, dz, A_cone=19.6):
+    """shot noise parameters (see shotnoise()) of all windows y[start:end] at once.
+    Only lag 0 and 1 of the autocovariance enter eq. 11, so every window needs a
+    linear detrend and two sums instead of a full correlation.
+    Returns array with one row (Lambda, f_0, delta, L) per window, NaN for windows
+    with less than 3 samples"""
+    y = numpy.asarray(y, dtype=float)
+    start = numpy.asarray(start, dtype=int)
+    size = numpy.asarray(end, dtype=int) - start
+    result = numpy.full((len(start), 4), numpy.nan)
+    for n in numpy.unique(size[size >= 3]):
+        chosen = numpy.nonzero(size == n)[0]
+        f_z = y[start[chosen, numpy.newaxis] + numpy.arange(n)]
+        c1 = f_z.mean(axis=1) #mean
+        c2 = f_z.var(axis=1, ddof=1) #variance
+        
+        #linear detrend of every window
+        t = numpy.arange(n) - (n - 1) / 2.
+        d = f_z - c1[:, numpy.newaxis]
+        d -= numpy.outer(d.dot(t) / t.dot(t), t)
+        
+        #unbiased autocovariance at lag 0 and 1, eq. 8 in Loewe and van Herwijnen, 2012
+        C0 = (d * d).sum(axis=1) / n
+        C1 = (d[:, 1:] * d[:, :-1]).sum(axis=1) / (n - 1)
+        
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            delta = -3./2 * C0 / (C1 - C0) * dz # eq. 11
+            Lambda = 4./3 * (c1**2) / c2 / delta # eq. 12
+            f_0 = 3./2 * c2 / c1 # eq. 12
+            L = (A_cone/Lambda)**(1./3) # cube root
+        result[chosen] = numpy.column_stack((Lambda, f_0, delta, L))
+    return result
+
+@profiler.timed("mathematics.getSNParams", size=profiler.dataBytes)
 def getSNParams(file, window=2.5,overlap=50):
     """get shot noise theory parameters, see function shotnoise()
     for details.
@@ -423,121 +484,62 @@ def getSNParams(file, window=2.5,overlap=50):
     y: force array in N
     windows: analysis windows in mm
     overlap: overlap of windows in %
+    returns array with one row (Lambda, f_0, delta, L) per window
     """
-    x = file.data[:,0]
-    y = file.data[:,1]
+    return shotNoiseProfile(file.data[:,0], file.data[:,1], file.surface, file.ground, window, overlap)
+
+def shotNoiseProfile(x, y, surface, ground, window=2.5, overlap=50):
+    """shot noise parameters of overlapping windows between surface and ground,
+    see getSNParams"""
     overlap = window * overlap / 100.
     dz = (x[-1]-x[0]) / len(x)
-    start = numpy.where(x >= file.surface)[0][0]
-    end = numpy.where(x >= file.ground)[0][0]
+    start, end = numpy.searchsorted(x, (surface, ground))
     x = x[start:end]
     y = y[start:end]
     
-    x0 = x[0]
     dx = window - overlap
-    data = []
-    while x0 + window <= x[-1]:
-        start = numpy.where(x >= x0)[0][0]
-        end = numpy.where(x >= x0 + window)[0][0]
-        data.append(shotnoise(dz,y[start:end]))
-        x0 += dx
-    
-    return data 
-
-def subtractMedian(x,y,window=200):
-    """subtract median of frame from original signal y """
-    start = 0
-    end = len(y)-1
-    y_out = []
-    
-    while start <= end:
-        median = numpy.median(y[start:start+window])
-        y_out[start:start+window] = y[start:start+window] - median
-        start += window
+    if not len(x) or x[0] + window > x[-1]:
+        return numpy.zeros((0, 4))
+    x0 = x[0] + dx * numpy.arange(int(numpy.floor((x[-1] - x[0] - window) / dx + 1e-9)) + 1)
+    return shotNoiseWindows(y, numpy.searchsorted(x, x0), numpy.searchsorted(x, x0 + window), dz)
+
+@profiler.timed("mathematics.subtractMedian")
+def subtractMedian(x,y,window=200,sliding=False):
+    """subtract median of frames (or running median if sliding) from original signal y,
+    y can hold one signal per row"""
+    window = max(int(window), 1)
+    if sliding:
+        median = slidingMedian(y, window)
+    else:
+        median = blockMedian(y, window, expand=True)
 
-    x_out = x[:len(y_out)]
-    return x_out, y_out   
+    y_out = numpy.asarray(y) - median
+    x_out = numpy.asarray(x)[:y_out.shape[-1]]
+    return x_out, y_out
 
 def transsectGetValues(x,y,window=2.5,overlap=50):
     """this function prepares 2d transect data.
     x = distance array
     y = force array f(x)
     window [mm] = alaysation window for log(median(f))
-    overlap [%] = overlap of analyzation windows"""
-    
-    x_out = []
-    y_out = []
-    while x[0] + window <= x[-1]:
-        i_end = numpy.where(x >=  x[0] + window)[0][0]
-        median = numpy.median(y[:i_end])   
-        i_start = numpy.where(x >= x[0] + window * overlap/100.)[0][0]
-        x_out.append(x[0])
-        y_out.append(numpy.log(median))
-        x = x[i_start:]
-        y = y[i_start:]        
-        
-    return x_out, y_out
-
-from scipy import interpolate
-def transsectFromFile(Files):
-    """Create 2d transsect from pnt Files"""
-    X = []
-    F = []
-    y = []
-    #appen x,y, and force data to 3 arrays
-    for file in Files:
-        x, f = transsectGetValues(file.data[:,0],file.data[:,1])
-        surface = numpy.where(x >= file.surface)[0][0]
-        ground = numpy.where(x >= file.ground)[0][0]
-        
-        X.append(x[surface:ground])
-        F.append(f[surface:ground])
-        y.append(len(y))
-            
-    # Set up a regular grid of interpolation points
-    xi, yi = numpy.linspace(X.min(), X.max(), len(X)/len(Files)), numpy.linspace(y.min(), y.max(), len(X)/len(Files))
-    xi, yi = numpy.meshgrid(xi, yi)
-    
-    # Interpolate
-    rbf = interpolate.Rbf(X, y, F, function='linear')
-    zi = rbf(xi, yi)
-    
-    plt.imshow(zi, vmin=F.min(), vmax=F.max(), origin='lower',
-               extent=[X.min(), X.max(), y.min(), y.max()])
-    plt.scatter(X, y, c=F)
-    plt.colorbar()
-    plt.show() 
-
-def forceDrops(x,y, max_dx = 0.020, min_dy = 0.050, dx_bins = 0.02):
-
-    dy = -min_dy
-    start = 0
-    end = 1
-    down = []
-    i_max = len(y)
-    
-    while end < i_max:
-                
-        delta = y[start] - y[end]
-        
-        if x[end] - x[start] > max_dx:
-            start += 1
-            end = start + 1        
-            continue
-
-        elif  delta > dy:
-            end += 1
-            continue
-        
-        down.append(delta)
-
-        start = end
-        end = start + 1
-
-    down = numpy.abs(down)
-    bin_down = (max(down)-min(down))/dx_bins
-
-    plt.hist(down, normed = True,  stacked = False, bins = bin_down)
-    plt.show()    
-
-    return down
+    overlap [%] = overlap of analyzation windows
+    see transect.windowedLogMedian"""
+    return windowedLogMedian(x, y, window, overlap)
+
+@profiler.timed("mathematics.transsectFromFile")
+def transsectFromFile(Files, window=2.5, overlap=50, positions="order", show=True):
+    """Create 2d transsect from pnt Files, see transect.buildTransect,
+    positions by "order" or "gps" """
+    distance, depth, grid, positions = buildTransect(Files, window, overlap, positions)
+    if show:
+        plotTransect(distance, depth, grid, positions)
+    return distance, depth, grid
+
+@profiler.timed("mathematics.forceDrops")
+def forceDrops(x,y, max_dx = 0.020, min_dy = 0.050, dx_bins = 0.02, show = False):
+    """force drops of at least min_dy within max_dx (see ruptures.detectDrops),
+    show plots their histogram"""
+    depth, drop, spacing = detectDrops(x, y, max_dx, min_dy)
+    if show:
+        plotHistogram(drop, dx_bins)
+    return drop
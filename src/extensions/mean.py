@@ -1,126 +1,165 @@
-import matplotlib.pyplot as plt
-import numpy as np
-
-class Drift(object):
-    def __init__(self,x,y):
-        self.dataX = x
-        self.dataY = y   
-        
-        self.fig, (self.ax, self.ax2) = plt.subplots(2, 1)
-        self.fig.canvas.set_window_title('SMP Mean Value, Drift and Noise Analysis Tool') 
-        
-        self.fig.subplots_adjust(hspace=0.4 )
-        
-        self.clicks = 0
-        self.mouseState = False
-        
-        self.v1  = self.ax.axvline(x = x[0], color = "red", visible = False, linewidth=3, alpha=0.6)
-        self.v2 = self.ax.axvline(x = x[-1], color = "red", visible = False, linewidth=3, alpha=0.6)
-
-        self.ax.set_title('Original Data')
-        self.ax.set_xlabel("Depth [mm]")
-        self.ax.set_ylabel("Force [N]")
-        self.ax2.set_title("Selected Range")
-        self.ax2.set_ylabel("Force [N]")
-        self.ax2.set_xlabel("Depth [mm]")
-        self.line, = self.ax.plot(self.dataX, self.dataY, picker=5)  # 5 points tolerance
-        
-        self.fig.canvas.mpl_connect('pick_event', self.onPick)
-        self.fig.canvas.mpl_connect('button_press_event', self.mouseDown)
-        self.fig.canvas.mpl_connect('motion_notify_event', self.mouseMotion)
-        self.fig.canvas.mpl_connect('button_release_event', self.mouseUp)
-        
-        plt.show()
-     
-    def mouseDown(self, event):
-        if self.v1 in self.fig.hitlist(event) or self.v2 in self.fig.hitlist(event):
-            self.mouseState = True
-    
-    def mouseMotion(self, event):
-        if self.mouseState:
-            x, y = event.xdata, event.ydata
-            if x is None or y is None:
-                self.picked = None
-                return
-            
-            if self.v1 in self.fig.hitlist(event):
-                self.picked = "v1"
-            
-            if self.v2 in self.fig.hitlist(event):
-                self.picked = "v2"
-            
-            self.update(event)
-            
-    def mouseUp(self, event):
-        self.mouseState = False
-        self.picked = None
-        
-    def onPick(self,event):
-        self.clicks += 1
-
-        x = event.mouseevent.xdata
-        y = event.mouseevent.ydata
-        
-        distances = np.hypot(x-self.dataX[event.ind], y-self.dataY[event.ind])
-        indmin = distances.argmin()
-        self.index = event.ind[indmin]
-        self.update(event)
-        
-    def update(self, event):
-
-        if self.index is None: return
-    
-        if self.clicks == 1:
-            v = ([self.dataX[self.index],self.dataX[self.index]],[0,10])
-            self.v1.set_data(v)
-            self.v1.set_visible(True)
-            
-        if self.clicks == 2:
-            self.clicks += 1
-            v = ([self.dataX[self.index],self.dataX[self.index]],[0,10]) 
-            self.v2.set_data(v) 
-            self.v2.set_visible(True)
-            
-        if self.clicks >= 2:
-            
-            self.ax2.clear()
-            self.ax2.set_title("Selected Range")
-            self.ax2.set_ylabel("Force [N]")
-            self.ax2.set_xlabel("Depth [mm]")
-            
-            if self.mouseState:
-                x = event.xdata
-                v = ([x,x],[0,10])
-                if self.picked == "v1":
-                    self.v1.set_data(v)
-                if self.picked == "v2":
-                    self.v2.set_data(v)
-                
-            args = [self.v1.get_data()[0][0],self.v2.get_data()[0][0]] 
-            
-            min = np.where(self.dataX >= np.amin(args))[0][0]
-            max = np.where(self.dataX >= np.amax(args))[0][0]
-            
-            x = self.dataX[min:max]
-            y = self.dataY[min:max]
-            
-            self.ax2.plot(x,y)
-            self.ax2.set_xlim((np.amin(x),np.amax(x)))
-            self.ax2.set_title("Selected Range")
-            self.ax2.set_ylim((np.amin(y),2*np.amax(y)))
-            
-            self.linFit(x,y)
-            
-        self.fig.canvas.draw()
-        
-    def linFit(self,x,y):
-        mean = np.mean(y)
-        dev = np.std(y)
-        m,c = np.polyfit(x, y, 1)
-        y_fit = x*m+c
-        std = np.sqrt(np.mean((y-y_fit)**2))
-        self.ax2.plot(x,y_fit, "r--",x,y_fit+std, "b:",x,y_fit-std,"b:")
-        self.ax2.text(0.05, 0.9, 'Mean: (%.2e +- %.2e) N\nSlope: %.2e N/m\nStd: %.2e N' %(mean, dev, m*1000, std), transform=self.ax2.transAxes, va='top')        
-
-if __name__ == "__main__":
-    test = Drift(np.arange(0,10000), np.random.normal(0,1,10000))
\ No newline at end of file
+import matplotlib.pyplot as plt
+import numpy as np
+
+class Drift(object):
+    def __init__(self,x,y):
+        self.dataX = np.asarray(x, dtype=float)
+        self.dataY = np.asarray(y, dtype=float)
+        self.prefixSums()
+
+        self.fig, (self.ax, self.ax2) = plt.subplots(2, 1)
+        self.fig.canvas.set_window_title('SMP Mean Value, Drift and Noise Analysis Tool')
+
+        self.fig.subplots_adjust(hspace=0.4 )
+
+        self.clicks = 0
+        self.picked = None
+        self.background = None
+
+        self.v1  = self.ax.axvline(x = x[0], color = "red", visible = False, linewidth=3, alpha=0.6)
+        self.v2 = self.ax.axvline(x = x[-1], color = "red", visible = False, linewidth=3, alpha=0.6)
+
+        self.ax.set_title('Original Data')
+        self.ax.set_xlabel("Depth [mm]")
+        self.ax.set_ylabel("Force [N]")
+        self.ax2.set_title("Selected Range")
+        self.ax2.set_ylabel("Force [N]")
+        self.ax2.set_xlabel("Depth [mm]")
+        self.line, = self.ax.plot(self.dataX, self.dataY)
+
+        #selected range, fit and fit +- std are updated in place
+        self.selection, = self.ax2.plot([], [])
+        self.fit, = self.ax2.plot([], [], "r--")
+        self.upper, = self.ax2.plot([], [], "b:")
+        self.lower, = self.ax2.plot([], [], "b:")
+        self.text = self.ax2.text(0.05, 0.9, "", transform=self.ax2.transAxes, va='top')
+        self.animated = [self.v1, self.v2, self.selection, self.fit, self.upper, self.lower, self.text]
+
+        self.fig.canvas.mpl_connect('button_press_event', self.mouseDown)
+        self.fig.canvas.mpl_connect('motion_notify_event', self.mouseMotion)
+        self.fig.canvas.mpl_connect('button_release_event', self.mouseUp)
+
+        plt.show()
+
+    def prefixSums(self):
+        """cumulative sums of x, y, xy, x^2 and y^2 for O(1) range statistics"""
+        #centered data keeps the differences of the sums accurate
+        self.x0 = self.dataX.mean() if self.dataX.size else 0.
+        self.y0 = self.dataY.mean() if self.dataY.size else 0.
+        x = self.dataX - self.x0
+        y = self.dataY - self.y0
+        self.sums = np.zeros((5, x.size + 1))
+        for row, values in enumerate((x, y, x * y, x * x, y * y)):
+            np.cumsum(values, out=self.sums[row, 1:])
+
+    def rangeStats(self, start, end):
+        """mean, std, slope, intercept and residual std of samples start:end"""
+        n = end - start
+        if n < 2:
+            return None
+        sx, sy, sxy, sxx, syy = self.sums[:, end] - self.sums[:, start]
+        mean = sy / n
+        dev = np.sqrt(max(syy / n - mean ** 2, 0.))
+        vxx = sxx - sx ** 2 / n
+        vxy = sxy - sx * sy / n
+        vyy = syy - sy ** 2 / n
+        m = vxy / vxx if vxx > 0 else 0.
+        c = (sy - m * sx) / n
+        std = np.sqrt(max(vyy - m * vxy, 0.) / n)
+        return mean + self.y0, dev, m, c + self.y0 - m * self.x0, std
+
+    def nearestIndex(self, x):
+        """index of the sample nearest to depth x"""
+        i = np.clip(np.searchsorted(self.dataX, x), 1, len(self.dataX) - 1)
+        return i - 1 if x - self.dataX[i - 1] < self.dataX[i] - x else i
+
+    def markerAt(self, event):
+        """marker within 5 pixels of the mouse, None otherwise"""
+        for name, marker in (("v1", self.v1), ("v2", self.v2)):
+            if marker.get_visible():
+                px = self.ax.transData.transform((marker.get_xdata()[0], 0))[0]
+                if abs(px - event.x) <= 5:
+                    return name
+        return None
+
+    def mouseDown(self, event):
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
+
+        if self.clicks >= 2:
+            self.picked = self.markerAt(event)
+            if self.picked:
+                #blit the animated artists on a saved background while dragging
+                for artist in self.animated:
+                    artist.set_animated(True)
+                self.fig.canvas.draw()
+                self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+            return
+
+        self.clicks += 1
+        x = self.dataX[self.nearestIndex(event.xdata)]
+        marker = self.v1 if self.clicks == 1 else self.v2
+        marker.set_xdata([x, x])
+        marker.set_visible(True)
+        if self.clicks == 2:
+            self.update(rescale=True)
+        self.fig.canvas.draw()
+
+    def mouseMotion(self, event):
+        if not self.picked or event.xdata is None or event.inaxes is not self.ax:
+            return
+        x = event.xdata
+        marker = self.v1 if self.picked == "v1" else self.v2
+        marker.set_xdata([x, x])
+        self.update()
+
+        self.fig.canvas.restore_region(self.background)
+        for artist in self.animated:
+            artist.axes.draw_artist(artist)
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def mouseUp(self, event):
+        if self.picked:
+            for artist in self.animated:
+                artist.set_animated(False)
+            self.update(rescale=True)
+            self.fig.canvas.draw()
+        self.picked = None
+        self.background = None
+
+    def update(self, rescale=False):
+        """show selected range and its statistics, new axis limits if rescale"""
+        args = [self.v1.get_xdata()[0],self.v2.get_xdata()[0]]
+        start, end = np.searchsorted(self.dataX, [np.amin(args), np.amax(args)])
+
+        stats = self.rangeStats(start, end)
+        if stats is None:
+            return
+        mean, dev, m, c, std = stats
+
+        x, y = self.decimate(self.dataX[start:end], self.dataY[start:end])
+        self.selection.set_data(x, y)
+        xs = self.dataX[[start, end - 1]]
+        y_fit = xs * m + c
+        self.fit.set_data(xs, y_fit)
+        self.upper.set_data(xs, y_fit + std)
+        self.lower.set_data(xs, y_fit - std)
+        self.text.set_text('Mean: (%.2e +- %.2e) N\nSlope: %.2e N/m\nStd: %.2e N' %(mean, dev, m*1000, std))
+
+        if rescale:
+            self.ax2.set_xlim((xs[0], xs[1]))
+            self.ax2.set_ylim((np.amin(y), 2*np.amax(y)))
+
+    def decimate(self, x, y, points=2000):
+        """minimum and maximum of buckets, keeps the look of long ranges at few points"""
+        n = len(x) // points
+        if n < 2:
+            return x, y
+        size = n * points
+        x = x[:size].reshape(points, n)[:, [0, -1]].ravel()
+        blocks = y[:size].reshape(points, n)
+        y = np.column_stack((blocks.min(axis=1), blocks.max(axis=1))).ravel()
+        return x, y
+
+if __name__ == "__main__":
+    test = Drift(np.arange(0,10000), np.random.normal(0,1,10000))
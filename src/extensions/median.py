@@ -0,0 +1,171 @@
+"""
+Median engine for SnowMicroPen force signals.
+
+blockMedian computes the median of consecutive, non overlapping blocks by
+reshaping the signal, slidingMedian computes the true running median of a
+centered window. Both work on single profiles (1-D) and on many profiles of
+equal length at once (2-D, one profile per row).
+
+slidingMedian answers all windows together with a wavelet matrix over the
+ranks of the samples: every bit of the rank halves the candidates of all
+windows in a few vectorized numpy operations, so the run time is
+O(n log m) for m distinct values and independent of the window size.
+
+example:
+
+import median
+
+y_block = median.blockMedian(y, 200) # one median per 200 samples
+y_run = median.slidingMedian(y, 201) # running median, same length as y
+"""
+
+import numpy
+
+def blockMedian(y, window, expand=False):
+    """
+    median of consecutive blocks along the last axis of y, a shorter last
+    block gets its own median
+    Input:
+        -y: 1-D signal or 2-D array with one signal per row
+        -window: block length [samples]
+        -expand: repeat every median over its block
+    Returns:
+        -array of block medians, same length as y if expand
+    """
+    y = numpy.asarray(y, dtype=float)
+    window = int(window)
+    if window < 1:
+        raise ValueError("window must be at least one sample")
+
+    n = y.shape[-1]
+    full = n // window * window
+    medians = numpy.median(y[..., :full].reshape(y.shape[:-1] + (-1, window)), axis=-1)
+    if full < n:
+        rest = numpy.median(y[..., full:], axis=-1)
+        medians = numpy.concatenate((medians, rest[..., numpy.newaxis]), axis=-1)
+
+    if expand:
+        medians = numpy.repeat(medians, window, axis=-1)[..., :n]
+    return medians
+
+def slidingMedian(y, window):
+    """
+    running median of a centered window along the last axis of y, windows
+    are truncated at the ends of the signal
+    Input:
+        -y: 1-D signal or 2-D array with one signal per row
+        -window: window length [samples]
+    Returns:
+        -array of medians, same shape as y
+    """
+    y = numpy.asarray(y, dtype=float)
+    window = int(window)
+    if window < 1:
+        raise ValueError("window must be at least one sample")
+
+    n = y.shape[-1]
+    rows = y.size // n if n else 0
+    if n == 0 or rows == 0:
+        return y.copy()
+
+    # window bounds per row, rows are concatenated and offset
+    i = numpy.arange(n)
+    start = numpy.maximum(i - window // 2, 0)
+    end = numpy.minimum(i - window // 2 + window, n)
+    offset = (numpy.arange(rows) * n)[:, numpy.newaxis]
+    start = (start + offset).ravel()
+    end = (end + offset).ravel()
+
+    return rangeMedian(y.ravel(), start, end).reshape(y.shape)
+
+def rangeMedian(values, start, end):
+    """
+    median of every range values[start:end], ranges must not be empty
+    Input:
+        -values: 1-D array
+        -start, end: integer arrays of equal length, one entry per range
+    Returns:
+        -array of medians
+    """
+    start = numpy.asarray(start)
+    end = numpy.asarray(end)
+    size = end - start
+    sizes = numpy.unique(size)
+    if sizes.size <= 8 and size.sum() <= 4 * len(values):
+        # ranges overlap little: gather them into rows and partition
+        values = numpy.asarray(values, dtype=float)
+        medians = numpy.empty(size.shape)
+        for n in sizes:
+            chosen = numpy.nonzero(size == n)[0]
+            rows = values[start[chosen, numpy.newaxis] + numpy.arange(n)]
+            medians[chosen] = numpy.median(rows, axis=1)
+        return medians
+
+    medians = select(values, start, end, (size - 1) // 2)
+    even = numpy.nonzero(size % 2 == 0)[0]
+    if even.size:
+        upper = select(values, start[even], end[even], size[even] // 2)
+        medians[even] = (medians[even] + upper) / 2.
+    return medians
+
+def select(values, start, end, k):
+    """
+    k-th smallest value (starting at 0) of every range values[start:end]
+    Input:
+        -values: 1-D array
+        -start, end, k: integer arrays of equal length, one entry per range
+    Returns:
+        -array of selected values
+    """
+    # equal values share a rank, force signals are quantized by the A/D
+    # converter and have far less distinct values than samples
+    levels, rank = numpy.unique(numpy.asarray(values).ravel(), return_inverse=True)
+    n = rank.size
+    dtype = numpy.int32 if n < 2**31 else numpy.int64
+    rank = rank.astype(dtype)
+
+    start = numpy.array(start, dtype=dtype)
+    end = numpy.array(end, dtype=dtype)
+    k = numpy.array(k, dtype=dtype)
+    result = numpy.zeros(k.shape, dtype=dtype)
+    zeros_before = numpy.zeros(n + 1, dtype=dtype)
+
+    # wavelet matrix: per bit, stable partition of the ranks into 0 and 1
+    for level in range(max(int(levels.size - 1).bit_length(), 1) - 1, -1, -1):
+        zero = (rank >> level) & 1 == 0
+        numpy.cumsum(zero, out=zeros_before[1:])
+        n_zeros = zeros_before[-1]
+
+        start0 = zeros_before[start]
+        end0 = zeros_before[end]
+        count = end0 - start0
+        one = k >= count
+        k -= numpy.where(one, count, 0)
+        start = numpy.where(one, n_zeros + start - start0, start0)
+        end = numpy.where(one, n_zeros + end - end0, end0)
+        result |= one.astype(dtype) << level
+
+        rank = numpy.concatenate((rank[zero], rank[~zero]))
+
+    return levels[result]
+
+def hampel(y, window=15, threshold=3., minimum=0.):
+    """
+    Hampel filter, replace samples deviating from the running median by
+    more than threshold robust standard deviations with the median
+    Input:
+        -y: 1-D signal or 2-D array with one signal per row
+        -window: window length [samples]
+        -threshold: allowed deviation [scaled median absolute deviations]
+        -minimum: smallest deviation treated as spike, avoids flagging
+                  quantization steps in flat sections where the MAD is 0
+    Returns:
+        -filtered signal, same shape as y
+        -boolean mask of replaced samples
+    """
+    y = numpy.asarray(y, dtype=float)
+    median = slidingMedian(y, window)
+    deviation = numpy.abs(y - median)
+    sigma = 1.4826 * slidingMedian(deviation, window) # MAD of normal distribution
+    mask = (deviation > threshold * sigma) & (deviation > minimum)
+    return numpy.where(mask, median, y), mask
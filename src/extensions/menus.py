@@ -1,6 +1,5 @@
 import wx, wx.lib.dialogs
 from wx.lib.mixins.listctrl import CheckListCtrlMixin, ListCtrlAutoWidthMixin
-from wx.lib.agw import ultimatelistctrl as ulc
 from wx.lib.agw.floatspin import FloatSpin
 from matplotlib.figure import Figure
 from matplotlib.ticker import MaxNLocator
@@ -317,6 +316,11 @@ class GraphOptions(wx.Dialog):
         self.median_style = styles[0]
         self.median_width = 1
         self.median_sampling = 200
+        self.median_sliding = False
+        #spikes
+        self.spike_window = 15
+        self.spike_threshold = 3.
+        self.spike_minimum = 0.05
         
         panel = wx.Panel(self)
 
@@ -417,6 +421,14 @@ class GraphOptions(wx.Dialog):
         self.median_style_ctrl = wx.ComboBox(notebook.tabGraph, -1, size=(150, -1), choices=styles, style=wx.CB_READONLY,value=self.median_style)
         label_median_width = wx.StaticText(notebook.tabGraph,-1, 'Line Width')
         self.median_width_ctrl = wx.SpinCtrl(notebook.tabGraph, -1,name="Width",initial=1,min=0.5,max=10,pos=(325,135),size=(50,-1))
+        self.box_median_sliding = wx.CheckBox(notebook.tabGraph, -1 ,'Sliding Window')
+        self.box_median_sliding.SetValue(self.median_sliding)
+        label_spike_window = wx.StaticText(notebook.tabGraph,-1, 'Spike Window')
+        self.spike_window_ctrl = wx.SpinCtrl(notebook.tabGraph,-1,size=(100,-1),min=3,max=1000,initial=self.spike_window)
+        label_spike_threshold = wx.StaticText(notebook.tabGraph,-1, 'Spike Threshold [MAD]')
+        self.spike_threshold_ctrl = FloatSpin(notebook.tabGraph,-1,size=(100,-1),value=self.spike_threshold,min_val=0.5,max_val=100,increment=0.5,digits=1)
+        label_spike_minimum = wx.StaticText(notebook.tabGraph,-1, 'Minimum Spike [N]')
+        self.spike_minimum_ctrl = FloatSpin(notebook.tabGraph,-1,size=(100,-1),value=self.spike_minimum,min_val=0,max_val=100,increment=0.01,digits=3)
             
         vert1 = wx.BoxSizer(wx.VERTICAL)
         vert2 = wx.BoxSizer(wx.VERTICAL)
@@ -483,12 +495,19 @@ class GraphOptions(wx.Dialog):
         vert3.Add(label_median,0,wx.ALIGN_CENTER|wx.ALL,20)
         vert3.Add(label_median_sampling,0,wx.ALIGN_CENTER|wx.RIGHT,10)
         vert3.Add(self.median_sampling_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
+        vert3.Add(self.box_median_sliding,0,wx.ALIGN_CENTER|wx.ALL,10)
         vert3.Add(label_median_color,0,wx.ALIGN_CENTER|wx.RIGHT,10)
         vert3.Add(self.median_color_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
         vert3.Add(label_median_width,0,wx.ALIGN_CENTER|wx.RIGHT,10)
         vert3.Add(self.median_width_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
         vert3.Add(label_median_style,0,wx.ALIGN_CENTER|wx.RIGHT,10)
         vert3.Add(self.median_style_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
+        vert3.Add(label_spike_window,0,wx.ALIGN_CENTER|wx.RIGHT,10)
+        vert3.Add(self.spike_window_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
+        vert3.Add(label_spike_threshold,0,wx.ALIGN_CENTER|wx.RIGHT,10)
+        vert3.Add(self.spike_threshold_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
+        vert3.Add(label_spike_minimum,0,wx.ALIGN_CENTER|wx.RIGHT,10)
+        vert3.Add(self.spike_minimum_ctrl,0,wx.ALIGN_CENTER|wx.ALL,10)
         
         label_data.SetFont(font)
         label_grad.SetFont(font)
@@ -545,6 +564,15 @@ class GraphOptions(wx.Dialog):
         self.median_style = self.median_style_ctrl.GetValue()
         self.median_width = self.median_width_ctrl.GetValue()
         self.median_sampling = self.median_sampling_ctrl.GetValue()
+        self.median_sliding = self.box_median_sliding.GetValue()
+        spikes = (self.spike_window, self.spike_threshold, self.spike_minimum)
+        self.spike_window = self.spike_window_ctrl.GetValue()
+        self.spike_threshold = self.spike_threshold_ctrl.GetValue()
+        self.spike_minimum = self.spike_minimum_ctrl.GetValue()
+        if self.parent.despike.IsChecked() and spikes != (self.spike_window, self.spike_threshold, self.spike_minimum):
+            for file in self.parent.File:
+                self.parent.removeSpikes(file)
+            self.parent.fileList.setFiles(self.parent.File)
         
         self.parent.draw_figure(autozoom=False)
         
@@ -577,6 +605,10 @@ class GraphOptions(wx.Dialog):
         self.median_style_ctrl.SetValue(self.median_style)
         self.median_width_ctrl.SetValue(self.median_width)
         self.median_sampling_ctrl.SetValue(self.median_sampling)  
+        self.box_median_sliding.SetValue(self.median_sliding)
+        self.spike_window_ctrl.SetValue(self.spike_window)
+        self.spike_threshold_ctrl.SetValue(self.spike_threshold)
+        self.spike_minimum_ctrl.SetValue(self.spike_minimum)
         
         self.Hide()
       
@@ -601,7 +633,6 @@ class CheckListCtrl(wx.ListCtrl, CheckListCtrlMixin, ListCtrlAutoWidthMixin):
 
 import os
 import mathematics as calc
-from scipy.interpolate import interp1d
 import numpy as np
 class SuperPosition(wx.Frame):
     """main user interface for super position"""
@@ -634,6 +665,11 @@ class SuperPosition(wx.Frame):
         self.Bind(wx.EVT_MENU, self.OnSubtract, subtract)
         mean = self.plotMenu.Append(wx.ID_ANY, "Average Plots")
         self.Bind(wx.EVT_MENU, self.OnMean, mean)
+        envelope = self.plotMenu.Append(wx.ID_ANY, "Envelope Plots")
+        self.Bind(wx.EVT_MENU, self.OnEnvelope, envelope)
+        autoalign = self.plotMenu.Append(101, "Auto Align")
+        self.Bind(wx.EVT_MENU, self.OnAutoAlign, autoalign)
+        self.warpDepths = self.plotMenu.Append(wx.ID_ANY, "Warp Depths (Subtract, Average)", kind=wx.ITEM_CHECK)
         self.plotMenu.AppendSeparator()
         
         self.showLegend = self.plotMenu.Append(wx.ID_ANY,"Show &Legend",kind=wx.ITEM_CHECK)
@@ -661,6 +697,7 @@ class SuperPosition(wx.Frame):
         self.Show()
         
     def createPanel(self):
+        from wx.lib.agw import ultimatelistctrl as ulc
         
         self.panelPlot = wx.Panel(self)
         self.panelPlot.SetFocus()
@@ -761,23 +798,56 @@ class SuperPosition(wx.Frame):
         """draw active files"""
         
         self.setPlotOptions(autozoom) 
-        active = 0
-        for i in range(len(self.files)):
-            current = self.files[i]
+        for current in self.files:
+            current.line = None
             if current.box.GetValue():
-                    active += 1
-                    x,y = self.adaptData(current)
-                    self.axes.plot(x, y,
-                                   color = current.color.GetValue(),
-                                   linestyle = current.style.GetValue(),
-                                   linewidth = current.width.GetValue(),
-                                   label = basename(current.filename)
-                                   )                       
-           
+                self.plotCurve(current)
         
+        self.updateLegend()
         self.canvas.draw()
-        
+        self.enableActions()
+        
+    def plotCurve(self, current):
+        """plot file as new line, kept in current.line"""
+        x,y = self.adaptData(current)
+        current.line, = self.axes.plot(x, y,
+                                       color = current.color.GetValue(),
+                                       linestyle = current.style.GetValue(),
+                                       linewidth = current.width.GetValue(),
+                                       label = basename(current.filename)
+                                       )
+        
+    def updateCurve(self, current, source=None):
+        """update line of file after a change of widget source, all data if None"""
+        line = getattr(current, "line", None)
+        if line is None or line not in self.axes.lines:
+            if current.box.GetValue():
+                self.plotCurve(current)
+            return
+        
+        if source is current.box:
+            line.set_visible(current.box.GetValue())
+            #hidden lines stay out of the legend
+            line.set_label(("" if current.box.GetValue() else "_") + basename(current.filename))
+        elif source is current.color:
+            line.set_color(current.color.GetValue())
+        elif source is current.style:
+            line.set_linestyle(current.style.GetValue())
+        elif source is current.width:
+            line.set_linewidth(current.width.GetValue())
+        else:
+            line.set_data(*self.adaptData(current))
+            
+    def updateLegend(self):
+        if self.showLegend.IsChecked():
+            self.axes.legend(loc = "upper left")
+        elif self.axes.get_legend() is not None:
+            self.axes.get_legend().remove()
+            
+    def enableActions(self):
+        active = len([current for current in self.files if current.box.GetValue()])
         self.plotMenu.Enable(100,active >= 2)
+        self.plotMenu.Enable(101,active >= 2)
         
     def setPlotOptions(self, autozoom=False):  
     
@@ -814,6 +884,16 @@ class SuperPosition(wx.Frame):
             self.axes.legend(loc = "upper left")
         
     def OnUpdatePlot(self,e):      
+        source = e.GetEventObject()
+        for current in self.files:
+            if source in (current.box, current.dx, current.dy, current.stretch,
+                          current.smooth, current.color, current.style, current.width):
+                #only the changed curve, one redraw
+                self.updateCurve(current, source)
+                self.updateLegend()
+                self.enableActions()
+                self.canvas.draw_idle()
+                return
         self.draw_figure(True)
         
     def OnAddItem(self,e):
@@ -896,6 +976,7 @@ class SuperPosition(wx.Frame):
         self.Options.Show()
             
     def OnSubtract(self,e):
+        from cube import ProfileCube
         choices = []
         files = []
         for entry in self.files:
@@ -910,80 +991,140 @@ class SuperPosition(wx.Frame):
                                     )
         
         if dlg.ShowModal() == wx.ID_OK:
-            ref = files[dlg.GetSelection()]
-            files.pop(dlg.GetSelection())
-            xref, yref = self.adaptData(ref)
-            fref = interp1d(xref,yref)
-            xref_min = np.min(xref)
-            xref_max = np.max(xref)
+            index = dlg.GetSelection()
+            ref = files[index]
+            data = self.warpData([self.adaptData(entry) for entry in files], index)
+            cube = ProfileCube.fromProfiles(data, step = 0.1)
+            y_new = -cube.subtract(index)
+            rsme = cube.rmse(index, root = False)
             
-            for entry in files:
-                xsub, ysub = self.adaptData(entry)
-                fsub = interp1d(xsub,ysub)
-                xsub_min = np.min(xsub)
-                xsub_max = np.max(xsub)
-                
-                if xsub_min >= xref_min: xmin = xsub_min
-                else:                    xmin = xref_min
-                if xsub_max >= xref_max: xmax = xref_max
-                else:                    xmax = xsub_max                              
-                
-                x_new = np.arange(xmin,xmax,0.1)
-                f_ref = fref(x_new)
-                f_sub = fsub(x_new)
-                y_new =  f_ref - f_sub
-                
-                rsme = calc.rsme(f_ref, f_sub)
-                                              
-                self.axes.plot(x_new, y_new,
+            for i, entry in enumerate(files):
+                if i == index:
+                    continue
+                self.axes.plot(cube.depth, y_new[i],
                                linestyle = "--",
                                color = entry.color.GetValue(),
-                               label = basename(entry.filename) + " - " + basename(ref.filename) + ", rsme = %0.3g" %rsme)
+                               label = basename(entry.filename) + " - " + basename(ref.filename) + ", rsme = %0.3g" %rsme[i])
                               
         self.axes.legend(loc = "upper left")
         self.axes.autoscale(False)
         self.canvas.draw()
         dlg.Destroy()
         
+    def OnAutoAlign(self,e):
+        from align import estimateShifts
+        choices = []
+        files = []
+        for entry in self.files:
+            if entry.box.GetValue():
+                choices.append(os.path.basename(entry.filename))
+                files.append(entry)
+                
+        dlg = wx.SingleChoiceDialog(parent = self,
+                                    message = "select reference",
+                                    caption = "Auto Align",
+                                    choices = choices,
+                                    )
+        
+        if dlg.ShowModal() == wx.ID_OK:
+            ref = files.pop(dlg.GetSelection())
+            shifts, scores = estimateShifts(self.adaptData(ref),
+                                            [self.adaptData(entry) for entry in files],
+                                            max_shift = 50)
+            
+            #shift is in stretched depth, dx is applied before stretching
+            for entry, shift, score in zip(files, shifts, scores):
+                if np.isfinite(shift):
+                    entry.dx.SetValue(entry.dx.GetValue() + shift / entry.stretch.GetValue())
+                    print "%s: shift %.2f mm, correlation %.3f" %(basename(entry.filename), shift, score)
+                    self.updateCurve(entry)
+            self.updateLegend()
+            self.canvas.draw_idle()
+        dlg.Destroy()
+        
     def OnMean(self,e):
+            from cube import ProfileCube
             #get prepared data
             data = []
             for entry in self.files:
                 if entry.box.GetValue():
                     data.append(self.adaptData(entry))
-                    
+            if not data:
+                return
             
-            #find common range
-            xmins = []
-            xmaxs = []               
-            for entry in data:
-                xmins.append(entry[0][0])
-                xmaxs.append(entry[0][-1])
-                
-            xmin = np.amax(xmins)
-            xmax = np.amin(xmaxs)
-            x_new = np.arange(xmin,xmax,0.004)
-            y_new = []
-            #interpolate data to get same number of data points
-            for entry in data:
-                fint = interp1d(entry[0],entry[1])
-                y_new.append(fint(x_new)) 
-            y_new = np.transpose(np.array(y_new))
-            y_mean = np.mean(y_new,1)        
+            #resample to a common grid, mean of the common range
+            data = self.warpData(data, 0)
+            cube = ProfileCube.fromProfiles(data, step = 0.004)
+            y_mean = cube.mean(complete = True)[0]
             
             #plot average
             self.setPlotOptions()
             
-            self.axes.plot(x_new, y_mean,
+            self.axes.plot(cube.depth, y_mean,
                                linestyle = "-",
                                color = "r",
                                label = "mean")
                               
             self.canvas.draw()
   
+    def OnEnvelope(self,e):
+            from aggregate import DepthAggregator
+            data = []
+            for entry in self.files:
+                if entry.box.GetValue():
+                    data.append(self.adaptData(entry))
+            if not data:
+                return
+            
+            #stream curves into depth bins of 0.5 mm
+            start = min([entry[0][0] for entry in data])
+            stop = max([entry[0][-1] for entry in data])
+            agg = DepthAggregator(start, stop, 0.5)
+            for x, y in data:
+                agg.add(x, y)
+            mean = agg.mean()
+            std = agg.std()
+            p = agg.envelope((5, 50, 95))
+            
+            self.setPlotOptions()
+            self.axes.fill_between(agg.depth, p[5], p[95], where = agg.count > 0,
+                                   color = "0.8", label = "5-95 %")
+            self.axes.plot(agg.depth, p[50], linestyle = "-", color = "k", label = "median")
+            self.axes.plot(agg.depth, mean, linestyle = "-", color = "r", label = "mean")
+            self.axes.plot(agg.depth, mean - std, linestyle = "--", color = "r", label = "mean +- std")
+            self.axes.plot(agg.depth, mean + std, linestyle = "--", color = "r")
+            
+            self.canvas.draw()
+  
+    def warpData(self, data, ref):
+        """map depths of all curves onto curve ref if Warp Depths is checked"""
+        if not self.warpDepths.IsChecked():
+            return data
+        from warp import depthMapping, applyMapping
+        warped = []
+        for i, (x, y) in enumerate(data):
+            if i != ref:
+                x = applyMapping(x, depthMapping(data[ref], (x, y)))
+            warped.append((x, y))
+        return warped
+    
     def adaptData(self, pnt):
-        x_corrected = (calc.downsample(pnt.data[:,0],pnt.smooth.GetValue()) + pnt.dx.GetValue()) * pnt.stretch.GetValue()
-        y_corrected = calc.downsample(pnt.data[:,1],pnt.smooth.GetValue()) + pnt.dy.GetValue()
+        #version is increased whenever the data is changed in place (UI.removeSpikes)
+        version = getattr(pnt, "version", 0)
+        smooth, dx, dy, stretch = pnt.smooth.GetValue(), pnt.dx.GetValue(), pnt.dy.GetValue(), pnt.stretch.GetValue()
+        key = (version, smooth, dx, dy, stretch)
+        cached = getattr(pnt, "adapted", None)
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        
+        #downsampled data only depends on the data and smooth
+        downsampled = getattr(pnt, "downsampled", None)
+        if downsampled is None or downsampled[0] != (version, smooth):
+            downsampled = ((version, smooth), calc.downsample(pnt.data[:,0],smooth), calc.downsample(pnt.data[:,1],smooth))
+            pnt.downsampled = downsampled
+        x_corrected = (downsampled[1] + dx) * stretch
+        y_corrected = downsampled[2] + dy
+        pnt.adapted = (key, x_corrected, y_corrected)
         return x_corrected,y_corrected
     
     def OnQuit(self,e):
@@ -0,0 +1,117 @@
+"""
+Opt-in timing instrumentation of the hot paths (file reading, mathematics,
+plotting and exporters). Decorated functions record call counts, wall time
+and processed bytes while profiling is enabled. When disabled, a decorated
+function costs a single flag check.
+
+Profiling is enabled with the environment variable SMP_PROFILE=1, from
+Help -> Diagnostics or by calling enable().
+
+example:
+
+import profiler
+
+@profiler.timed("mathematics.GetSurface")
+def GetSurface(x, y):
+    ...
+
+profiler.enable()
+GetSurface(x, y)
+print profiler.report()
+profiler.dump("profile.json")
+"""
+
+import os
+import time
+import json
+import functools
+import numpy
+
+enabled = os.environ.get("SMP_PROFILE", "") not in ("", "0")
+
+# {name: [calls, total seconds, max seconds, bytes]}
+stats = {}
+
+clock = time.clock if os.name == "nt" else time.time
+
+def enable(on=True):
+    """switch profiling on or off"""
+    global enabled
+    enabled = bool(on)
+
+def reset():
+    """forget all recorded timings"""
+    stats.clear()
+
+def arrayBytes(args, kwargs, result):
+    """return total size of numpy array arguments [bytes]"""
+    n = 0
+    for value in list(args) + kwargs.values():
+        if isinstance(value, numpy.ndarray):
+            n += value.nbytes
+    return n
+
+def dataBytes(args, kwargs, result):
+    """return size of the data array of the Pnt object passed first [bytes]"""
+    return args[0].data.nbytes
+
+def timed(name=None, size=arrayBytes):
+    """
+    decorator recording calls, wall time and bytes of a function
+    Input:
+        -name: entry name in the report, default module.function
+        -size: function (args, kwargs, result) returning processed bytes
+    """
+    def decorator(f):
+        key = name or "%s.%s" %(f.__module__.split(".")[-1], f.__name__)
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return f(*args, **kwargs)
+            start = clock()
+            try:
+                result = f(*args, **kwargs)
+            except:
+                record(key, clock() - start) # failed calls count as well
+                raise
+            record(key, clock() - start, size(args, kwargs, result) if size else 0)
+            return result
+        return wrapper
+    return decorator
+
+def record(name, seconds, nbytes=0):
+    """add a single measurement to entry name"""
+    entry = stats.setdefault(name, [0, 0., 0., 0])
+    entry[0] += 1
+    entry[1] += seconds
+    entry[2] = max(entry[2], seconds)
+    entry[3] += nbytes
+
+def results():
+    """return list of dicts with the recorded timings, slowest first"""
+    rows = []
+    for name, (calls, total, longest, nbytes) in stats.items():
+        rows.append({"name": name,
+                     "calls": calls,
+                     "seconds": total,
+                     "mean [s]": total / calls,
+                     "max [s]": longest,
+                     "bytes": nbytes,
+                     "MB/s": nbytes / total / 1e6 if total > 0 else 0.})
+    return sorted(rows, key=lambda r: r["seconds"], reverse=True)
+
+def report():
+    """return recorded timings as text table"""
+    if not stats:
+        return "No timings recorded%s." %("" if enabled else ", profiling is disabled")
+    lines = ["%-32s %8s %10s %10s %10s %12s %10s" %("Function", "Calls", "Total [s]", "Mean [s]", "Max [s]", "Bytes", "MB/s")]
+    for r in results():
+        lines.append("%-32s %8d %10.4f %10.4f %10.4f %12d %10.1f" %(r["name"], r["calls"], r["seconds"],
+                     r["mean [s]"], r["max [s]"], r["bytes"], r["MB/s"]))
+    return "\n".join(lines)
+
+def dump(filename):
+    """write recorded timings to JSON file"""
+    with open(filename, "w") as f:
+        json.dump({"enabled": enabled, "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results()}, f, indent=1)
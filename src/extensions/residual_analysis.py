@@ -4,13 +4,14 @@
 
 from __future__ import division, print_function
 import numpy as np
-from scipy.signal import butter, filtfilt
+from filters import lowpass
 
 __author__ = 'Marcos Duarte <duartexyz@gmail.com>' #mod by Sascha Grimm
 __version__ = 'residual_analysis.py v.1 2013/08/10'
 
 
-def residual_analysis(y, freq=1, fclim=[], show=False):
+def residual_analysis(y, freq=1, fclim=[], show=False, method='filtfilt',
+                      processes=1):
     """ Automatic search of filter cutoff frequency based on residual analysis.
 
     This method was proposed by Winter in his book [1]_.
@@ -33,6 +34,15 @@ def residual_analysis(y, freq=1, fclim=[], show=False):
     show   : bool, optional (default = False)
              True (1) plots data in a matplotlib figure
              False (0) to not plot
+    method : string, optional (default = 'filtfilt')
+             'filtfilt' filters the signal with every cutoff frequency
+             'fft' evaluates the residuals of all cutoff frequencies from a
+             single spectrum of the signal (much faster, approximate)
+             'spectral' skips the residual analysis and returns the
+             frequency where the Welch power spectrum reaches the white
+             noise floor, see spectral_cutoff
+    processes : int, optional (default = 1)
+             number of worker processes for method 'filtfilt'
 
     Returns
     -------
@@ -90,14 +100,18 @@ def residual_analysis(y, freq=1, fclim=[], show=False):
 
     from scipy.interpolate import UnivariateSpline
 
+    y = np.asarray(y, dtype=float)
+    if method == 'spectral':
+        return spectral_cutoff(y, freq, show=show)
+
     # signal filtering
     freqs = np.linspace((freq / 2) / 101, freq / 2, 101)
-    res = []
-    for fc in freqs:
-        b, a = butter(2, fc / (freq / 2))
-        yf = filtfilt(b, a, y)
-        # residual between filtered and unfiltered signals
-        res = np.hstack((res, np.sqrt(np.mean((yf - y) ** 2))))
+    if method == 'filtfilt':
+        res = _residuals_filtfilt(y, freq, freqs, processes)
+    elif method == 'fft':
+        res = _residuals_fft(y, freq, freqs)
+    else:
+        raise ValueError("unknown method %s" % method)
 
     # find the optimal cutoff frequency by fitting an exponential curve
     # y = A*exp(B*x)+C to the residual data and consider that the tail part
@@ -118,6 +132,7 @@ def residual_analysis(y, freq=1, fclim=[], show=False):
                  np.nonzero(freqs >= fclim[1])[0][0]]
 
     # find fc_opt with linear fit y=A+Bx of the noisy part of the residuals
+    B = A = None
     if len(fclim) and fclim[0] < fclim[1]:
         B, A = np.polyfit(freqs[fclim[0]:fclim[1]], res[fclim[0]:fclim[1]], 1)
         # optimal cutoff frequency is the frequency where y[fc_opt] = A
@@ -132,6 +147,181 @@ def residual_analysis(y, freq=1, fclim=[], show=False):
     return fc_opt
 
 
+def spectral_cutoff(y, freq=1, factor=2, nperseg=4096, show=False):
+    """Estimate the low pass cutoff frequency from the Welch power spectrum.
+
+    The upper half of the spectrum is taken as white noise floor (its
+    median power). The cutoff is the frequency above which the spectrum,
+    smoothed with a running median, stays below factor times the floor,
+    i.e. where the signal power drops into the noise. Only one spectrum
+    is computed, which is much faster than the residual analysis.
+
+    Parameters
+    ----------
+    y       : 1D array_like
+    freq    : float, sampling frequency of the signal y
+    factor  : float, optional (default = 2, 3 dB above the noise floor)
+    nperseg : int, optional (default = 4096), Welch segment length
+    show    : bool, optional (default = False), plot the spectrum
+
+    Returns
+    -------
+    fc_opt : float
+             cutoff frequency (None if the spectrum has no noise floor)
+    """
+
+    from scipy.signal import welch
+    from median import slidingMedian
+
+    y = np.asarray(y, dtype=float)
+    f, pxx = welch(y, fs=freq, nperseg=min(nperseg, y.size), detrend='linear')
+    f, pxx = f[1:], pxx[1:]  # DC
+    if f.size < 8:
+        return None
+
+    psd = slidingMedian(pxx, max(f.size // 64, 1) * 2 + 1)
+    floor = np.median(psd[f >= freq / 4])
+    above = np.nonzero(psd > factor * floor)[0]
+    if not above.size or above[-1] >= f.size - 1 or floor <= 0:
+        fc_opt = None
+    else:
+        # interpolate crossing of the threshold in log power
+        i = above[-1]
+        p0, p1 = np.log(psd[i]), np.log(psd[i + 1])
+        t = (p0 - np.log(factor * floor)) / (p0 - p1) if p0 != p1 else 0
+        fc_opt = f[i] + t * (f[i + 1] - f[i])
+
+    if show:
+        _plot_spectral(f, pxx, psd, floor * factor, fc_opt)
+
+    return fc_opt
+
+
+def residual_analysis_batch(signals, freq=1, fclim=[], method='filtfilt',
+                            processes=None):
+    """Optimal cutoff frequencies of many signals, e.g. all profiles of a
+    campaign, computed in parallel worker processes.
+
+    Parameters
+    ----------
+    signals   : list of 1D array_like
+    freq      : float or list of floats, sampling frequency of every signal
+    fclim     : see residual_analysis
+    method    : see residual_analysis
+    processes : int, optional (default = number of CPUs)
+
+    Returns
+    -------
+    list of fc_opt, None where no optimal cutoff frequency was found
+    """
+
+    import multiprocessing
+
+    if np.isscalar(freq):
+        freq = [freq] * len(signals)
+    jobs = [(y, f, fclim, method) for y, f in zip(signals, freq)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_batch_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _batch_job(job):
+    """residual_analysis of a single signal in a worker process."""
+    y, freq, fclim, method = job
+    return residual_analysis(y, freq, fclim, method=method)
+
+
+def _residuals_filtfilt(y, freq, freqs, processes=1):
+    """RMSE between y and y filtered with every cutoff frequency in freqs."""
+    if processes > 1:
+        import multiprocessing
+        chunks = np.array_split(freqs, processes)
+        pool = multiprocessing.Pool(processes)
+        try:
+            parts = pool.map(_residuals_job, [(y, freq, c) for c in chunks])
+        finally:
+            pool.close()
+            pool.join()
+        return np.concatenate(parts)
+
+    res = np.zeros(len(freqs))
+    for i, fc in enumerate(freqs):
+        if fc >= freq / 2:
+            continue  # no attenuation at the Nyquist frequency, residual 0
+        yf = lowpass(y, fc, freq)  # designs are cached per (fc, freq)
+        # residual between filtered and unfiltered signals
+        res[i] = np.sqrt(np.mean((yf - y) ** 2))
+    return res
+
+
+def _residuals_job(job):
+    """_residuals_filtfilt of a chunk of cutoff frequencies in a worker."""
+    return _residuals_filtfilt(*job)
+
+
+def _residuals_fft(y, freq, freqs, order=2, bins=4096):
+    """RMSE between y and y filtered with every cutoff frequency in freqs,
+    evaluated in the frequency domain.
+
+    A zero-phase (forward-backward) Butterworth filter attenuates the
+    spectrum by |H|^2 = 1 / (1 + r) with r = (tan(w/2) / tan(wc/2))^(2 order),
+    the residual y - yf therefore by r / (1 + r). By Parseval the RMSE of
+    the residual follows from the power spectrum of y, a single FFT serves
+    all cutoff frequencies. The signal is mirrored to avoid a jump at the
+    ends of the periodic extension; edge effects of filtfilt are ignored.
+    The power is summed in logarithmic frequency bins, the attenuation is
+    evaluated once per bin instead of once per frequency.
+    """
+    ext = np.concatenate((y, y[::-1]))
+    n = ext.size
+    power = np.abs(np.fft.rfft(ext)) ** 2
+    power[1:(n + 1) // 2] *= 2  # negative frequencies
+    power = power[1:]  # DC passes every low pass filter
+    w = np.pi * np.arange(1, power.size + 1) / (n / 2)  # [rad/sample]
+
+    edges = np.logspace(np.log10(w[0]), np.log10(np.pi), bins + 1)
+    index = np.clip(np.searchsorted(edges, w, 'right') - 1, 0, bins - 1)
+    power_bin = np.bincount(index, weights=power, minlength=bins)
+    used = power_bin > 0
+    w_bin = np.bincount(index, weights=power * w, minlength=bins)[used] / power_bin[used]
+    power_bin = power_bin[used]
+    # cutoffs at the Nyquist frequency do not attenuate, keep residual 0
+    tan_w = np.tan(np.minimum(w_bin, np.pi * (1 - 1e-12)) / 2) ** 2
+
+    res = np.zeros(len(freqs))
+    for i, fc in enumerate(freqs):
+        if fc >= freq / 2:
+            continue
+        r = (tan_w / np.tan(np.pi * fc / freq) ** 2) ** order
+        res[i] = np.sqrt(np.sum(power_bin * (r / (1 + r)) ** 2)) / n
+    return res
+
+
+def _plot_spectral(f, pxx, psd, threshold, fc_opt):
+    """Plot results of the spectral_cutoff function, see its help."""
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not available.')
+    else:
+        plt.figure("Spectral Cutoff Estimate", figsize=(10, 6))
+        ax = plt.subplot(111)
+        ax.semilogy(f, pxx, 'b', linewidth=1, label='Welch PSD')
+        ax.semilogy(f, psd, 'k', linewidth=2, label='running median')
+        ax.axhline(threshold, color='r', linestyle='--', label='noise floor')
+        if fc_opt:
+            ax.axvline(fc_opt, color='r', linewidth=2,
+                       label='$Fc_{opt}$ = %.1f $mm^{-1}$' % fc_opt)
+        ax.set_xlabel('Frequency [$mm^{-1}$]')
+        ax.set_ylabel('PSD')
+        ax.legend(fontsize=12, loc='best')
+        ax.grid()
+        plt.show()
+
+
 def _plot(y, freq, freqs, res, fclim, fc_opt, B, A):
     """Plot results of the residual_analysis function, see its help."""
     try:
@@ -180,8 +370,7 @@ def _plot(y, freq, freqs, res, fclim, fc_opt, B, A):
             ax1.plot(fc_opt, 0, 'ro', markersize=7, clip_on=False,
                      zorder=9, label='$Fc_{opt}$ = %.1f $mm^{-1}$' % fc_opt)
             ax1.legend(fontsize=12, loc='best', numpoints=1)
-            b, a = butter(2, fc_opt / (freq / 2))
-            yf = filtfilt(b, a, y)
+            yf = lowpass(y, fc_opt, freq)
             ax2.plot(x, yf, color=[1, 0, 0, .5],
                      linewidth=2, label='filtered')
             ax2.legend(fontsize=12, loc='best')
@@ -0,0 +1,304 @@
+"""
+Detection of force drops (rupture events) in SnowMicroPen force signals.
+
+A rupture shows up as a steep, monotonic decrease of the force between a
+local maximum and the following local minimum. detectDrops finds all
+extrema at once from the signs of the nonzero force differences and keeps
+the decreasing runs which drop by at least min_dy within at most max_dx.
+
+example:
+
+import ruptures
+
+depth, drop, spacing = ruptures.detectDrops(x, y)
+center, count, mean_drop, density = ruptures.windowStats(depth, drop, window=2.5)
+ruptures.plotHistogram(drop)
+
+RuptureStore keeps the drops of a whole campaign in flat columns:
+
+store = ruptures.RuptureStore.fromFiles(files)
+store.save("/path/to/store")
+store = ruptures.RuptureStore.load("/path/to/store") # memory mapped
+counts, edges = store.histogram(bins=50, depth=(200, 400), months=[2])
+"""
+
+import numpy
+
+def detectDrops(x, y, max_dx=0.020, min_dy=0.050):
+    """
+    find force drops of a profile
+    Input:
+        -x: depth [mm]
+        -y: force [N]
+        -max_dx: maximum length of a drop [mm]
+        -min_dy: minimum force drop [N]
+    Returns:
+        -depth of the local maximum at the start of every drop [mm]
+        -force drop [N], positive
+        -spacing to the previous drop [mm], NaN for the first drop
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+
+    d = numpy.diff(y)
+    steps = numpy.nonzero(d)[0] # plateaus belong to the surrounding run
+    down = d[steps] < 0
+    if not down.any():
+        empty = numpy.zeros(0)
+        return empty, empty.copy(), empty.copy()
+
+    # first and last step of every decreasing run
+    before = numpy.concatenate(([False], down[:-1]))
+    after = numpy.concatenate((down[1:], [False]))
+    top = steps[down & ~before]
+    bottom = steps[down & ~after] + 1
+
+    drop = y[top] - y[bottom]
+    keep = (drop >= min_dy) & (x[bottom] - x[top] <= max_dx)
+    depth = x[top][keep]
+    drop = drop[keep]
+
+    spacing = numpy.empty(depth.size)
+    spacing[:1] = numpy.nan
+    spacing[1:] = numpy.diff(depth)
+    return depth, drop, spacing
+
+def windowStats(depth, drop, window=2.5, start=None, end=None):
+    """
+    statistics of force drops in consecutive depth windows
+    Input:
+        -depth, drop: arrays returned by detectDrops
+        -window: window length [mm]
+        -start, end: depth range [mm], default range of the drops
+    Returns:
+        -window centers [mm]
+        -number of drops per window
+        -mean drop per window [N], NaN for windows without drops
+        -drops per mm
+    """
+    depth = numpy.asarray(depth, dtype=float)
+    drop = numpy.asarray(drop, dtype=float)
+    if start is None:
+        start = depth.min() if depth.size else 0.
+    if end is None:
+        end = depth.max() if depth.size else start
+
+    n = max(int(numpy.ceil((end - start) / window)), 1)
+    inside = (depth >= start) & (depth <= end)
+    index = numpy.minimum(((depth[inside] - start) / window).astype(int), n - 1)
+
+    count = numpy.bincount(index, minlength=n)
+    total = numpy.bincount(index, weights=drop[inside], minlength=n)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        mean = numpy.where(count > 0, total / count, numpy.nan)
+
+    center = start + (numpy.arange(n) + 0.5) * window
+    return center, count, mean, count / float(window)
+
+def detectDropsFiles(files, max_dx=0.020, min_dy=0.050, surface=True):
+    """
+    detectDrops for many Pnt objects
+    Input:
+        -files: list of Pnt objects
+        -surface: measure depth from the surface of every file
+    Returns:
+        -list of (depth, drop, spacing) tuples, one per file
+    """
+    results = []
+    for f in files:
+        depth, drop, spacing = detectDrops(f.data[:,0], f.data[:,1], max_dx, min_dy)
+        if surface:
+            depth = depth - getattr(f, "surface", 0.)
+        results.append((depth, drop, spacing))
+    return results
+
+def plotHistogram(drop, dx_bins=0.02, axes=None, show=True):
+    """
+    plot density histogram of force drops
+    Input:
+        -drop: force drops [N]
+        -dx_bins: bin width [N]
+        -axes: matplotlib axes, new pyplot figure if None
+    """
+    drop = numpy.asarray(drop, dtype=float)
+    if axes is None:
+        import matplotlib.pyplot as plt
+        axes = plt.figure("Force Drops").add_subplot(111)
+    else:
+        show = False
+
+    if drop.size:
+        bins = max(int(numpy.ceil((drop.max() - drop.min()) / dx_bins)), 1)
+        density, edges = numpy.histogram(drop, bins=bins, density=True)
+        axes.bar(edges[:-1], density, width=numpy.diff(edges), align="edge")
+    axes.set_xlabel("Force Drop [N]")
+    axes.set_ylabel("Density")
+    axes.set_title("%d force drops" %drop.size)
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return axes
+
+class RuptureStore():
+    def __init__(self):
+        """
+        Columnar store of force drops of many profiles.
+        Returns:
+            -self.files: list of file names, index is the file id
+            -self.meta: dict of per file arrays "year", "month", "day", "surface"
+            -self.file_id, self.depth, self.magnitude, self.interval: per event arrays,
+             depth relative to the surface [mm], magnitude [N], interval [mm]
+            -self.offsets: events of file i are at offsets[i]:offsets[i+1]
+        """
+        self.files = []
+        self._meta = []
+        self._chunks = []
+        self._consolidate()
+
+    @classmethod
+    def fromFiles(cls, files, max_dx=0.020, min_dy=0.050):
+        """
+        detect force drops of Pnt objects and collect them in a new store
+        """
+        store = cls()
+        for f, (depth, drop, spacing) in zip(files, detectDropsFiles(files, max_dx, min_dy)):
+            store.add(f.filename, depth, drop, spacing, f.header, getattr(f, "surface", 0.))
+        return store
+
+    def add(self, filename, depth, magnitude, interval, header=None, surface=0.):
+        """
+        append the drops of one file, depth relative to the surface
+        """
+        header = header or {}
+        self.files.append(filename)
+        self._meta.append((header.get("Year", 0), header.get("Month", 0), header.get("Day", 0), surface))
+        self._chunks.append((numpy.asarray(depth, dtype=numpy.float32),
+                             numpy.asarray(magnitude, dtype=numpy.float32),
+                             numpy.asarray(interval, dtype=numpy.float32)))
+
+    def _consolidate(self):
+        """merge added files into the columns"""
+        if hasattr(self, "offsets") and not self._chunks:
+            return
+        if not hasattr(self, "offsets"):
+            self.file_id = numpy.zeros(0, dtype=numpy.int32)
+            self.depth = numpy.zeros(0, dtype=numpy.float32)
+            self.magnitude = numpy.zeros(0, dtype=numpy.float32)
+            self.interval = numpy.zeros(0, dtype=numpy.float32)
+            self.offsets = numpy.zeros(1, dtype=numpy.int64)
+            self.meta = dict((key, numpy.zeros(0)) for key in ("year", "month", "day", "surface"))
+
+        first = len(self.offsets) - 1
+        counts = [len(c[0]) for c in self._chunks]
+        ids = numpy.repeat(numpy.arange(first, first + len(counts), dtype=numpy.int32), counts)
+        self.file_id = numpy.concatenate([self.file_id, ids])
+        for i, name in enumerate(("depth", "magnitude", "interval")):
+            setattr(self, name, numpy.concatenate([getattr(self, name)] + [c[i] for c in self._chunks]))
+        self.offsets = numpy.concatenate([self.offsets, self.offsets[-1] + numpy.cumsum(counts, dtype=numpy.int64)])
+        meta = numpy.array(self._meta, dtype=float).reshape(-1, 4)
+        for i, key in enumerate(("year", "month", "day", "surface")):
+            self.meta[key] = numpy.concatenate([self.meta[key], meta[:,i]])
+        self._chunks = []
+        self._meta = []
+
+    def __len__(self):
+        self._consolidate()
+        return len(self.depth)
+
+    def fileEvents(self, index):
+        """
+        return (depth, magnitude, interval) of file index without copying
+        """
+        self._consolidate()
+        s = slice(self.offsets[index], self.offsets[index+1])
+        return self.depth[s], self.magnitude[s], self.interval[s]
+
+    def select(self, depth=None, years=None, months=None, files=None, magnitude=None):
+        """
+        return boolean mask of the events matching all given conditions
+        Input:
+            -depth: (min, max) depth below the surface [mm]
+            -years, months: lists of years and months of the measurements
+            -files: list of file ids
+            -magnitude: (min, max) force drop [N]
+        """
+        self._consolidate()
+        keep = numpy.ones(len(self.files), dtype=bool)
+        if years is not None:
+            keep &= numpy.in1d(self.meta["year"], years)
+        if months is not None:
+            keep &= numpy.in1d(self.meta["month"], months)
+        if files is not None:
+            chosen = numpy.zeros(len(self.files), dtype=bool)
+            chosen[numpy.asarray(files, dtype=int)] = True
+            keep &= chosen
+
+        mask = keep[self.file_id]
+        if depth is not None:
+            mask &= (self.depth >= depth[0]) & (self.depth <= depth[1])
+        if magnitude is not None:
+            mask &= (self.magnitude >= magnitude[0]) & (self.magnitude <= magnitude[1])
+        return mask
+
+    def histogram(self, bins=50, range=None, column="magnitude", density=False, **query):
+        """
+        return (counts, edges) of column "magnitude", "depth" or "interval"
+        of the events selected by query (see select)
+        """
+        mask = self.select(**query)
+        values = getattr(self, column)[mask]
+        values = values[numpy.isfinite(values)]
+        return numpy.histogram(values, bins=bins, range=range, density=density)
+
+    def quantile(self, q, column="magnitude", **query):
+        """
+        return quantiles q (0..1) of column of the events selected by query
+        """
+        mask = self.select(**query)
+        values = getattr(self, column)[mask]
+        values = values[numpy.isfinite(values)]
+        if not values.size:
+            return numpy.full(numpy.shape(q), numpy.nan)
+        return numpy.percentile(values, numpy.asarray(q) * 100.)
+
+    def perFile(self, column="magnitude", **query):
+        """
+        return number and mean of column per file of the events selected by query
+        """
+        mask = self.select(**query)
+        count = numpy.bincount(self.file_id[mask], minlength=len(self.files))
+        total = numpy.bincount(self.file_id[mask], weights=getattr(self, column)[mask], minlength=len(self.files))
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return count, numpy.where(count > 0, total / count, numpy.nan)
+
+    def save(self, path):
+        """
+        write store to directory path (one .npy file per column)
+        """
+        import os, json
+        self._consolidate()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in ("file_id", "depth", "magnitude", "interval", "offsets"):
+            numpy.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        for key, values in self.meta.items():
+            numpy.save(os.path.join(path, "meta_%s.npy" %key), values)
+        with open(os.path.join(path, "files.json"), "w") as f:
+            json.dump(self.files, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        read store from directory path, columns are memory mapped if mmap
+        """
+        import os, json
+        store = cls()
+        mode = "r" if mmap else None
+        for name in ("file_id", "depth", "magnitude", "interval", "offsets"):
+            setattr(store, name, numpy.load(os.path.join(path, name + ".npy"), mmap_mode=mode))
+        for key in store.meta:
+            store.meta[key] = numpy.load(os.path.join(path, "meta_%s.npy" %key))
+        with open(os.path.join(path, "files.json"), "r") as f:
+            store.files = json.load(f)
+        return store
@@ -1,6 +1,6 @@
 import struct, numpy
-import matplotlib.pyplot as plt
 import menus as gui
+import profiler
 
 ##########################################################
 # Author:	Sascha Grimm
@@ -54,6 +54,7 @@ class Pnt(object):
 		return filename
 	
 	########################################################### 
+	@profiler.timed("smp.getData", size=lambda args, kwargs, data: 0 if data is None else data.nbytes)
 	def getData(self):
 		"""Read Force Data from .pnt file x=way, y=force"""
 		try:
@@ -74,6 +75,7 @@ class Pnt(object):
 			print 'Read %d data points in %s' %(len(data_y),self.filename)
 			return data
 		
+	@profiler.timed("smp.getRaw", size=lambda args, kwargs, raw: len(raw))
 	def getRaw(self):
 		"""Get raw data from binary"""
 		try:
@@ -86,6 +88,7 @@ class Pnt(object):
 		return raw
 	
 	###########################################################  
+	@profiler.timed("smp.getHeader", size=None)
 	def getHeader(self):
 		"""Read Header from raw data"""
 			
@@ -194,6 +197,7 @@ class Pnt(object):
 ###########################################################
 def plotData(self):
 	"""plot force against penetration depth"""
+	import matplotlib.pyplot as plt
 	plt.figure('Snow Micro Pen')
 	plt.ylabel('Force [N]')
 	plt.xlabel('Depth [mm]')
@@ -0,0 +1,159 @@
+"""
+Spatial index over the GPS positions of SnowMicroPen measurements.
+
+Positions are converted to points on a sphere with the radius of the earth
+and kept in a scipy cKDTree, so radius and nearest neighbour queries are
+exact great circle queries without any projection and take microseconds
+even for hundreds of thousands of profiles. Files without GPS fix (0/0 or
+the 99999 sentinel of the SMP) are skipped.
+
+example:
+
+import spatial
+
+index = spatial.SpatialIndex.fromFiles(files) # or fromCatalog(catalog)
+near, distance = index.radius(46.8121, 9.8472, 50.) # within 50 m
+print index.names(near)
+nearest, distance = index.nearest(46.8121, 9.8472, k=5)
+inside = index.bbox(46.80, 46.82, 9.83, 9.86)
+"""
+
+import numpy
+
+EARTH_RADIUS = 6371000. # [m]
+
+def validFix(lat, lon):
+    """
+    boolean mask of valid GPS positions (plain bool for two floats), no fix
+    is 0/0 or the 99999 sentinel of the SMP
+    """
+    if isinstance(lat, float) and isinstance(lon, float):
+        return abs(lat) <= 90 and abs(lon) <= 180 and (lat != 0 or lon != 0)
+    lat = numpy.asarray(lat, dtype=float)
+    lon = numpy.asarray(lon, dtype=float)
+    with numpy.errstate(invalid="ignore"):
+        return (numpy.abs(lat) <= 90) & (numpy.abs(lon) <= 180) & ((lat != 0) | (lon != 0))
+
+def toXYZ(lat, lon):
+    """cartesian coordinates [m] of positions on the earth sphere"""
+    lat = numpy.radians(numpy.asarray(lat, dtype=float))
+    lon = numpy.radians(numpy.asarray(lon, dtype=float))
+    cos_lat = numpy.cos(lat)
+    return EARTH_RADIUS * numpy.column_stack((cos_lat * numpy.cos(lon), cos_lat * numpy.sin(lon), numpy.sin(lat)))
+
+def toChord(distance):
+    """straight line distance of a great circle distance [m]"""
+    return 2 * EARTH_RADIUS * numpy.sin(numpy.minimum(numpy.asarray(distance, dtype=float), numpy.pi * EARTH_RADIUS) / (2 * EARTH_RADIUS))
+
+def fromChord(chord):
+    """great circle distance of a straight line distance [m]"""
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.minimum(numpy.asarray(chord, dtype=float) / (2 * EARTH_RADIUS), 1.))
+
+class SpatialIndex():
+    def __init__(self, names, lat, lon):
+        """
+        Index of the positions lat, lon [deg] of the files names.
+        Returns:
+            -self.files: all names, query results are indices into this list
+            -self.lat, self.lon: positions of all files, NaN without fix
+            -self.valid: boolean mask of the files with fix
+        Without any fix all queries return empty results.
+        """
+        from scipy.spatial import cKDTree
+        self.files = list(names)
+        lat = numpy.asarray(lat, dtype=float)
+        lon = numpy.asarray(lon, dtype=float)
+        self.valid = validFix(lat, lon)
+        self.lat = numpy.where(self.valid, lat, numpy.nan)
+        self.lon = numpy.where(self.valid, lon, numpy.nan)
+        self._index = numpy.nonzero(self.valid)[0]
+        self._tree = None # cKDTree of no points fails
+        if self.valid.any():
+            self._tree = cKDTree(toXYZ(lat[self.valid], lon[self.valid]))
+
+    @classmethod
+    def fromFiles(cls, files):
+        """index of Pnt objects, names are their file names"""
+        return cls([f.filename for f in files],
+                   [f.header.get("Latitude", 0.) for f in files],
+                   [f.header.get("Longitude", 0.) for f in files])
+
+    @classmethod
+    def fromCatalog(cls, catalog):
+        """index of the latest header rows of a catalog.Catalog"""
+        rows = catalog.latest("header")
+        names = sorted(rows)
+        def value(row, key):
+            try:
+                return float(row[key])
+            except ValueError: # empty cell
+                return numpy.nan
+        return cls(names, [value(rows[n], "Latitude") for n in names],
+                   [value(rows[n], "Longitude") for n in names])
+
+    def __len__(self):
+        return len(self._index)
+
+    def names(self, indices):
+        """file names of query results"""
+        return [self.files[i] for i in indices]
+
+    def radius(self, lat, lon, distance):
+        """
+        files within distance [m] of lat, lon [deg]
+        Returns:
+            -indices of the files, nearest first
+            -great circle distances [m]
+        """
+        if self._tree is None:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0)
+        point = toXYZ(lat, lon)[0]
+        found = numpy.array(self._tree.query_ball_point(point, toChord(distance)), dtype=int)
+        chord = numpy.sqrt(((self._tree.data[found] - point) ** 2).sum(axis=1))
+        order = numpy.argsort(chord, kind="mergesort")
+        return self._index[found[order]], fromChord(chord[order])
+
+    def nearest(self, lat, lon, k=1, distance=numpy.inf):
+        """
+        k nearest files of lat, lon [deg], optionally within distance [m]
+        Returns:
+            -indices of the files, nearest first
+            -great circle distances [m]
+        """
+        k = min(int(k), len(self))
+        if k < 1 or self._tree is None:
+            return numpy.zeros(0, dtype=int), numpy.zeros(0)
+        chord, found = self._tree.query(toXYZ(lat, lon)[0], k=k, distance_upper_bound=float(toChord(distance)))
+        chord = numpy.atleast_1d(chord)
+        found = numpy.atleast_1d(found)
+        hit = numpy.isfinite(chord)
+        return self._index[found[hit]], fromChord(chord[hit])
+
+    def bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        indices of the files inside a latitude/longitude box [deg], boxes
+        across the date line have lon_min > lon_max
+        """
+        if self._tree is None:
+            return numpy.zeros(0, dtype=int)
+        with numpy.errstate(invalid="ignore"):
+            inside = (self.lat >= lat_min) & (self.lat <= lat_max)
+            if lon_min <= lon_max:
+                inside &= (self.lon >= lon_min) & (self.lon <= lon_max)
+            else:
+                inside &= (self.lon >= lon_min) | (self.lon <= lon_max)
+        return numpy.nonzero(inside)[0]
+
+    def center(self, indices=None):
+        """mean position (lat, lon) of files indices (all with fix if None), None without fix"""
+        if self._tree is None:
+            return None
+        if indices is None:
+            indices = self._index
+        indices = numpy.asarray(indices, dtype=int)
+        indices = indices[self.valid[indices]]
+        if not indices.size:
+            return None
+        # mean of the unit vectors, safe across the date line
+        x, y, z = toXYZ(self.lat[indices], self.lon[indices]).mean(axis=0)
+        return numpy.degrees(numpy.arctan2(z, numpy.hypot(x, y))), numpy.degrees(numpy.arctan2(y, x))
@@ -0,0 +1,111 @@
+"""
+Per profile summary metrics of SnowMicroPen measurements.
+
+profileSummary computes all scalars of a profile (surface, ground, snow
+depth, maximum force, offset, drift, noise, hardness depths, mean and
+median force, overload flag, mean shot noise parameters) in one function
+without drawing anything and returns them as numpy record array with one
+row per file.
+
+example:
+
+import summary
+
+s = summary.profileSummary(files, thresholds=[0.1, 1., 10.])
+print s.max_force, s.snow_depth
+print s[0].hardness # depths below surface of the thresholds of file 0
+"""
+
+import os
+import numpy
+import mathematics as calc
+
+FIELDS = [("file", object), ("surface", float), ("ground", float),
+          ("snow_depth", float), ("max_force", float), ("max_force_depth", float),
+          ("offset", float), ("drift", float), ("noise", float),
+          ("mean_force", float), ("median_force", float), ("overload", bool),
+          ("sn_lambda", float), ("sn_f0", float), ("sn_delta", float), ("sn_length", float)]
+
+def profileSummary(files, thresholds=()):
+    """
+    summary metrics of Pnt objects
+    Input:
+        -files: list of Pnt objects (or a single one), surface and ground
+                attributes are used if set, detected otherwise
+        -thresholds: force thresholds [N] for the hardness depths
+    Returns:
+        -record array with one row per file, fields see FIELDS plus
+         "hardness" holding the depths below surface of all thresholds
+    """
+    if not isinstance(files, (list, tuple)):
+        files = [files]
+    thresholds = numpy.atleast_1d(numpy.asarray(thresholds, dtype=float))
+    dtype = FIELDS + [("hardness", float, (thresholds.size,))]
+    result = numpy.recarray(len(files), dtype=dtype)
+    for i, f in enumerate(files):
+        result[i] = summarize(f, thresholds)
+    return result
+
+def summarize(f, thresholds=()):
+    """
+    return tuple of summary metrics of Pnt object f, see profileSummary
+    """
+    x = f.data[:,0]
+    y = f.data[:,1]
+    n = len(y)
+
+    surface = getattr(f, "surface", 0.)
+    if not surface:
+        surface = calc.GetSurface(x, y)
+    ground = getattr(f, "ground", None)
+    if ground is None:
+        ground = calc.GetGround(f)
+
+    i_max = numpy.argmax(y)
+    overload = bool(y[i_max] >= f.header.get("Overload [N]", numpy.inf))
+
+    # air in front of the surface: linear fit of offset and drift
+    i_surface, i_ground = numpy.searchsorted(x, (surface, ground))
+    drift, offset, noise = lineFit(x[10:i_surface], y[10:i_surface])
+
+    snow = y[i_surface:max(i_ground, i_surface)]
+    if snow.size:
+        mean, median = snow.mean(), numpy.median(snow)
+    else:
+        mean = median = numpy.nan
+
+    hardness = calc.hardnessDepths(x, y, thresholds, surface)[0]
+
+    # mean of the 2.5 mm windows, undefined windows (e.g. zero force) are ignored
+    sn = calc.shotNoiseProfile(x, y, surface, ground)
+    sn = numpy.where(numpy.isfinite(sn), sn, numpy.nan)
+    if numpy.isfinite(sn).any():
+        with numpy.errstate(invalid="ignore"):
+            sn = tuple(numpy.nanmean(sn, axis=0))
+    else:
+        sn = (numpy.nan,) * 4
+
+    return (os.path.basename(f.filename), surface, ground, ground - surface,
+            y[i_max], x[i_max] - surface, offset, drift, noise,
+            mean, median, overload) + sn + (hardness,)
+
+def lineFit(x, y):
+    """
+    least squares line through y(x) from centered sums
+    Returns:
+        -slope, intercept and standard deviation of the residuals, NaN if
+         less than two points
+    """
+    n = len(x)
+    if n < 2:
+        return numpy.nan, numpy.nan, numpy.nan
+    xm = x.mean()
+    ym = y.mean()
+    dx = x - xm
+    dy = y - ym
+    sxx = numpy.dot(dx, dx)
+    sxy = numpy.dot(dx, dy)
+    syy = numpy.dot(dy, dy)
+    slope = sxy / sxx
+    sse = max(syy - slope * sxy, 0.)
+    return slope, ym - slope * xm, numpy.sqrt(sse / n)
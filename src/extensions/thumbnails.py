@@ -0,0 +1,188 @@
+"""
+Sparkline thumbnails of SnowMicroPen profiles for overviews of many files.
+
+Every profile is reduced to the minimum and maximum force of one depth
+interval per pixel column, so a thumbnail keeps the spikes and the envelope
+of the full profile at a few hundred points, and drawn with the Agg backend
+into a small png, air and ground shaded grey. Thumbnails are cached under
+the name of a hash of the file path, modification time and size and of the
+state of the profile (surface, ground, spike removal), so a changed file or
+profile gets a new thumbnail.
+
+ingest.py --thumbnails draws them into the directory thumbnails of the
+catalog, renderThumbnails looks there first (catalogThumbnails). Missing
+thumbnails are drawn from the data in memory by a pool of worker processes,
+only the sparklines (a few hundred points) are sent to the workers.
+
+example:
+
+import thumbnails
+
+profiles = [(f.filename, f.data[:,0], f.data[:,1], f.surface, f.ground, None) for f in files]
+for index, path in thumbnails.renderThumbnails(profiles): # completion order
+    print files[index].filename, path # None if the file does not exist any more
+"""
+
+import os
+import hashlib
+import multiprocessing
+import numpy
+
+SIZE = (120, 60) # [px]
+COLOR = "#1f5fa8"
+
+#thumbnails drawn by the GUI
+cache_dir = os.path.join(os.path.expanduser("~"), ".SnowMicroPyn", "thumbnails")
+
+def sparkline(x, y, columns):
+    """
+    minimum and maximum force of columns equal depth intervals
+    Input:
+        -x: depth [mm], increasing
+        -y: force [N]
+        -columns: number of intervals, e.g. width of the image [px]
+    Returns:
+        -start depth, minimum and maximum force of the non-empty intervals
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    if x.size <= 2 * columns:
+        return x, y, y
+    starts = numpy.unique(numpy.searchsorted(x, numpy.linspace(x[0], x[-1], columns, endpoint=False)))
+    return x[starts], numpy.minimum.reduceat(y, starts), numpy.maximum.reduceat(y, starts)
+
+def thumbnailState(surface, ground, despike=None):
+    """state of a profile which changes its thumbnail, see thumbnailName"""
+    if despike is not None:
+        despike = tuple(float(v) for v in despike)
+    return ("%.2f" %surface, "%.2f" %ground, despike)
+
+def thumbnailName(filename, size=SIZE, state=None):
+    """
+    cache file name of the thumbnail of filename with state (see
+    thumbnailState), raises OSError if the file does not exist
+    """
+    st = os.stat(filename)
+    key = (os.path.abspath(filename), "%.3f" %st.st_mtime, st.st_size, tuple(size), state)
+    return hashlib.md5(repr(key)).hexdigest() + ".png"
+
+def catalogThumbnails(filename, found=None):
+    """
+    thumbnail directories of catalogs (see ingest.py) in the directory of
+    filename or above it: catalog.txt or catalog/catalog.txt next to a
+    thumbnails directory, found caches the result per directory
+    """
+    if found is None:
+        found = {}
+    directory = os.path.dirname(os.path.abspath(filename))
+    visited = []
+    while directory not in found:
+        visited.append(directory)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            found[parent] = []
+        directory = parent
+    # from the top down: the catalogs of a directory and of its parents
+    for directory in reversed(visited):
+        own = []
+        for path in (directory, os.path.join(directory, "catalog")):
+            if os.path.isfile(os.path.join(path, "catalog.txt")) and os.path.isdir(os.path.join(path, "thumbnails")):
+                own.append(os.path.join(path, "thumbnails"))
+        found[directory] = own + found[os.path.dirname(directory)]
+    return found[os.path.dirname(os.path.abspath(filename))]
+
+#one figure per size and process, creating the axes takes longer than drawing
+_axes = {}
+
+def thumbnailAxes(size):
+    """empty axes filling a figure of size [px] with Agg canvas"""
+    if size not in _axes:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(size[0] / 100., size[1] / 100.), dpi=100, facecolor="white")
+        FigureCanvasAgg(fig)
+        axes = fig.add_axes([0, 0, 1, 1])
+        axes.axis("off")
+        _axes[size] = axes
+    axes = _axes[size]
+    for artist in list(axes.collections) + list(axes.patches):
+        artist.remove()
+    return axes
+
+def drawSparkline(xs, lo, hi, path, size=SIZE, color=COLOR, surface=None, ground=None):
+    """draw sparkline (see sparkline) into the png path, returns path"""
+    size = tuple(size)
+    axes = thumbnailAxes(size)
+    fig = axes.figure
+    if len(xs):
+        x0, x1 = xs[0], max(xs[-1], xs[0] + 1e-9)
+        # air in front of the surface and ground
+        if surface is not None and surface > x0:
+            axes.axvspan(x0, surface, facecolor="0.88", edgecolor="none")
+        if ground is not None and ground < x1:
+            axes.axvspan(ground, x1, facecolor="0.88", edgecolor="none")
+        axes.fill_between(xs, lo, hi, facecolor=color, edgecolor=color, linewidth=0.8)
+        axes.set_xlim(x0, x1)
+        axes.set_ylim(min(numpy.min(lo), 0.), max(numpy.max(hi) * 1.05, 1e-3))
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError: # created by another process
+            pass
+    tmp = "%s.%d.tmp" %(path, os.getpid())
+    fig.canvas.print_png(tmp)
+    os.rename(tmp, path)
+    return path
+
+def drawThumbnail(x, y, path, size=SIZE, color=COLOR, surface=None, ground=None):
+    """draw sparkline of a profile into the png path, returns path"""
+    xs, lo, hi = sparkline(x, y, size[0])
+    return drawSparkline(xs, lo, hi, path, size, color, surface, ground)
+
+def drawJob(job):
+    """draw job (index, (sparkline, path, size, color, surface, ground)) in a worker process"""
+    index, args = job
+    return index, drawSparkline(*(tuple(args[0]) + tuple(args[1:])))
+
+def renderThumbnails(profiles, directory=cache_dir, size=SIZE, processes=None, catalogs=True):
+    """
+    yield (index, thumbnail path) of profiles, cached thumbnails first, the
+    others in order of completion by a pool of processes workers (default
+    one per CPU)
+    Input:
+        -profiles: list of (filename, x, y, surface, ground, despike) with
+         the data in memory and despike None or the spike removal parameters
+        -directory: cache of new thumbnails
+        -catalogs: look for the thumbnails in catalogs first, see catalogThumbnails
+    Returns:
+        -generator of (index, path), path is None if the file does not exist
+    """
+    found = {}
+    jobs = []
+    for index, (filename, x, y, surface, ground, despike) in enumerate(profiles):
+        try:
+            name = thumbnailName(filename, size, thumbnailState(surface, ground, despike))
+        except OSError:
+            yield index, None
+            continue
+        search = (catalogThumbnails(filename, found) if catalogs else []) + [directory]
+        for d in search:
+            if os.path.exists(os.path.join(d, name)):
+                yield index, os.path.join(d, name)
+                break
+        else:
+            # only the sparkline is sent to the worker
+            jobs.append((index, (sparkline(x, y, size[0]), os.path.join(directory, name), size, COLOR, surface, ground)))
+    if not jobs:
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(drawJob, jobs, chunksize=8):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate() # stopped early
+        pool.join()
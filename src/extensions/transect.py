@@ -0,0 +1,160 @@
+"""
+2-D transects of SnowMicroPen profiles.
+
+Every profile is reduced to the log median force of overlapping depth
+windows (all windows of a profile at once with median.rangeMedian), placed
+along the transect by its GPS position or by its order and rasterised on a
+depth x distance grid. Every grid column is a linear interpolation of its two
+neighbouring profiles only, so building the raster is a few array operations
+on a (profiles x depth) matrix.
+
+example:
+
+import transect
+
+distance, depth, grid, positions = transect.buildTransect(files, positions="gps")
+transect.plotTransect(distance, depth, grid, positions)
+"""
+
+import numpy
+from median import rangeMedian
+from spatial import EARTH_RADIUS, validFix
+
+def windowedLogMedian(x, y, window=2.5, overlap=50):
+    """
+    natural logarithm of the median force of overlapping windows
+    Input:
+        -x: depth [mm]
+        -y: force [N]
+        -window: window length [mm]
+        -overlap: overlap of consecutive windows [%]
+    Returns:
+        -window starts [mm]
+        -log median force, NaN for medians <= 0
+    """
+    x = numpy.asarray(x, dtype=float)
+    y = numpy.asarray(y, dtype=float)
+    if not 0 <= overlap < 100:
+        raise ValueError("overlap must be between 0 and 100 %")
+    if x.size == 0 or x[0] + window > x[-1]:
+        return numpy.zeros(0), numpy.zeros(0)
+
+    step = window * (1 - overlap / 100.)
+    starts = x[0] + step * numpy.arange(int(numpy.floor((x[-1] - x[0] - window) / step + 1e-9)) + 1)
+    lo = numpy.searchsorted(x, starts)
+    hi = numpy.maximum(numpy.searchsorted(x, starts + window), lo + 1)
+    median = rangeMedian(y, lo, hi)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        values = numpy.where(median > 0, numpy.log(median), numpy.nan)
+    return x[lo], values
+
+def gpsPositions(files):
+    """
+    distance of the profiles along the straight line through their GPS
+    positions [m], profiles without fix (0 or 99999) are placed by order
+    between their neighbours
+    """
+    lat = numpy.array([f.header.get("Latitude", 0.) for f in files], dtype=float)
+    lon = numpy.array([f.header.get("Longitude", 0.) for f in files], dtype=float)
+    valid = validFix(lat, lon)
+    if valid.sum() < 2:
+        raise ValueError("less than two profiles with GPS position")
+
+    # local plane around the mean position, direction of largest extent
+    lat0 = numpy.radians(lat[valid].mean())
+    east = EARTH_RADIUS * numpy.radians(lon[valid] - lon[valid].mean()) * numpy.cos(lat0)
+    north = EARTH_RADIUS * numpy.radians(lat[valid] - lat[valid].mean())
+    points = numpy.column_stack((east, north))
+    direction = numpy.linalg.svd(points, full_matrices=False)[2][0]
+    along = points.dot(direction)
+    if along[-1] < along[0]:
+        along = -along
+
+    index = numpy.arange(len(files))
+    positions = numpy.interp(index, index[valid], along)
+    return positions - positions.min()
+
+def buildTransect(files, window=2.5, overlap=50, positions="order", depth_step=None, columns=500):
+    """
+    raster of the log median force of profiles between surface and ground
+    Input:
+        -files: list of Pnt objects with surface and ground attributes
+        -window, overlap: see windowedLogMedian
+        -positions: "order", "gps" (see gpsPositions) or array of distances
+        -depth_step: raster resolution in depth [mm], default half a window
+        -columns: number of raster columns along the transect
+    Returns:
+        -distance of the columns (profile number or m)
+        -depth below surface of the rows [mm]
+        -raster (rows x columns), NaN outside the profiles
+        -positions of the profiles
+    """
+    if isinstance(positions, basestring):
+        if positions == "gps":
+            positions = gpsPositions(files)
+        elif positions == "order":
+            positions = numpy.arange(len(files), dtype=float)
+        else:
+            raise ValueError("unknown positions %s" %positions)
+    positions = numpy.asarray(positions, dtype=float)
+    if len(positions) != len(files) or not len(files):
+        raise ValueError("one position per profile required")
+    if depth_step is None:
+        depth_step = window / 2.
+
+    profiles = []
+    for f in files:
+        x = f.data[:,0]
+        surface = getattr(f, "surface", 0.)
+        ground = getattr(f, "ground", x[-1])
+        inside = slice(*numpy.searchsorted(x, (surface, ground)))
+        start, values = windowedLogMedian(x[inside], f.data[inside,1], window, overlap)
+        profiles.append((start + window / 2. - surface, values))
+
+    bottom = max([depth[-1] for depth, values in profiles if depth.size] or [window])
+    depth = numpy.arange(0, bottom + depth_step, depth_step)
+    matrix = numpy.full((len(files), depth.size), numpy.nan)
+    for i, (d, values) in enumerate(profiles):
+        if d.size:
+            matrix[i] = numpy.interp(depth, d, values, left=numpy.nan, right=numpy.nan)
+
+    # linear interpolation between the two neighbouring profiles of every column
+    order = numpy.argsort(positions, kind="mergesort")
+    p = positions[order]
+    matrix = matrix[order]
+    distance = numpy.linspace(p[0], p[-1], columns)
+    right = numpy.clip(numpy.searchsorted(p, distance, side="right"), 1, max(len(p) - 1, 1))
+    left = right - 1
+    if len(p) == 1:
+        left = right = numpy.zeros(columns, dtype=int)
+    span = p[right] - p[left]
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        weight = numpy.where(span > 0, (distance - p[left]) / span, 0.)
+    a = matrix[left].T
+    b = matrix[right].T
+    # one missing neighbour: the other one
+    grid = numpy.where(numpy.isnan(a), b, numpy.where(numpy.isnan(b), a, a + (b - a) * weight))
+    return distance, depth, grid, positions
+
+def plotTransect(distance, depth, grid, positions=None, axes=None, show=True):
+    """
+    plot transect raster, depth downwards, profile positions as ticks
+    """
+    if axes is None:
+        import matplotlib.pyplot as plt
+        axes = plt.figure("Transect").add_subplot(111)
+    else:
+        show = False
+
+    image = axes.imshow(numpy.ma.masked_invalid(grid), aspect="auto", origin="upper",
+                        extent=[distance[0], distance[-1], depth[-1], depth[0]])
+    if positions is not None:
+        axes.plot(positions, numpy.zeros(len(positions)), "kv", clip_on=False)
+    axes.set_xlabel("Distance")
+    axes.set_ylabel("Depth [mm]")
+    axes.figure.colorbar(image, ax=axes, label="log(median force [N])")
+
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+    return axes
@@ -0,0 +1,177 @@
+"""
+Stretch aware matching of SnowMicroPen profiles by dynamic time warping.
+
+A single stretch factor per curve cannot follow profiles which are
+compressed unevenly. warpPath finds the monotonic alignment of two profiles
+with the smallest total difference of their log forces. The warping is
+constrained to a Sakoe-Chiba band around the diagonal and computed on a
+pyramid of coarser resolutions: the path of every level, widened by radius
+cells, is the search window of the next finer level, so the cost grows
+about linearly with the length instead of quadratically.
+
+Every row of the dynamic program is solved at once: the recurrence
+D[j] = c[j] + min(a[j], D[j-1]) is D = C + running minimum of (a - C) with
+C the cumulative cost of the row.
+
+example:
+
+import warp
+
+mapping = warp.depthMapping((x_ref, y_ref), (x, y))
+x_warped = warp.applyMapping(x, mapping) # depth of x in the reference
+"""
+
+import numpy
+from align import resample
+
+def _pyramid(values, min_size):
+    """list of values averaged over 1, 2, 4, ... samples"""
+    levels = [values]
+    while levels[-1].size > 2 * min_size:
+        v = levels[-1]
+        n = v.size // 2 * 2
+        coarse = 0.5 * (v[:n:2] + v[1:n:2])
+        if n < v.size:
+            coarse = numpy.append(coarse, v[-1])
+        levels.append(coarse)
+    return levels
+
+def _dtw(r, c, lo, hi):
+    """
+    dynamic time warping of r and c with the cells lo[i] <= j <= hi[i] of
+    every row i, returns the path as arrays of row and column indices
+    """
+    n = r.size
+    rows = []
+    inf = numpy.inf
+    previous = numpy.zeros(1) # virtual cell before (0, 0)
+    p_lo, p_hi = -1, -1
+    for i in range(n):
+        j = numpy.arange(lo[i], hi[i] + 1)
+        cost = numpy.abs(r[i] - c[lo[i]:hi[i] + 1])
+        # best predecessor of the previous row: (i-1, j-1) or (i-1, j)
+        diagonal = numpy.full(j.size, inf)
+        vertical = numpy.full(j.size, inf)
+        k = j - 1 - p_lo
+        valid = (k >= 0) & (k <= p_hi - p_lo)
+        diagonal[valid] = previous[k[valid]]
+        k = j - p_lo
+        valid = (k >= 0) & (k <= p_hi - p_lo)
+        vertical[valid] = previous[k[valid]]
+        a = numpy.minimum(diagonal, vertical)
+        # horizontal steps: D[j] = min over k <= j of a[k] + sum(cost[k:j+1])
+        total = numpy.cumsum(cost)
+        current = total + numpy.minimum.accumulate(a - (total - cost))
+        rows.append(current)
+        previous, p_lo, p_hi = current, lo[i], hi[i]
+
+    def value(i, j):
+        if i < 0 or j < lo[i] or j > hi[i]:
+            return inf
+        return rows[i][j - lo[i]]
+
+    # backtracking from the last cell
+    i, j = n - 1, c.size - 1
+    path_i = [i]
+    path_j = [j]
+    while i > 0 or j > 0:
+        steps = ((value(i - 1, j - 1), i - 1, j - 1), (value(i - 1, j), i - 1, j), (value(i, j - 1), i, j - 1))
+        best, i, j = min(steps)
+        if best == inf:
+            raise ValueError("no warping path within the search window")
+        path_i.append(i)
+        path_j.append(j)
+    return numpy.array(path_i[::-1]), numpy.array(path_j[::-1])
+
+def warpPath(r, c, band=0.1, radius=2, min_size=64):
+    """
+    warping path of the sequences r and c
+    Input:
+        -r, c: 1-D arrays
+        -band: half width of the Sakoe-Chiba band as fraction of the longer sequence
+        -radius: widening of the projected path on every finer level [cells]
+        -min_size: length of the coarsest level
+    Returns:
+        -row (r) and column (c) indices of the path, both increasing
+    """
+    r_levels = _pyramid(numpy.asarray(r, dtype=float), min_size)
+    c_levels = _pyramid(numpy.asarray(c, dtype=float), min_size)
+    depth = min(len(r_levels), len(c_levels))
+    r_levels = r_levels[:depth]
+    c_levels = c_levels[:depth]
+
+    # Sakoe-Chiba band around the diagonal of the coarsest level
+    r0, c0 = r_levels[-1], c_levels[-1]
+    n, m = r0.size, c0.size
+    width = max(int(numpy.ceil(band * max(n, m))), 1)
+    diagonal = numpy.arange(n) * (m - 1) / float(max(n - 1, 1))
+    lo = numpy.clip(numpy.floor(diagonal).astype(int) - width, 0, m - 1)
+    hi = numpy.clip(numpy.ceil(diagonal).astype(int) + width, 0, m - 1)
+    lo[0] = 0
+    hi[-1] = m - 1
+    path = _dtw(r0, c0, lo, hi)
+
+    for level in range(depth - 2, -1, -1):
+        r1, c1 = r_levels[level], c_levels[level]
+        n, m = r1.size, c1.size
+        lo = numpy.full(n, m, dtype=int)
+        hi = numpy.full(n, -1, dtype=int)
+        for di in (0, 1):
+            i = numpy.minimum(2 * path[0] + di, n - 1)
+            numpy.minimum.at(lo, i, numpy.minimum(2 * path[1], m - 1))
+            numpy.maximum.at(hi, i, numpy.minimum(2 * path[1] + 1, m - 1))
+        # widen by radius cells in every direction
+        wide_lo = lo.copy()
+        wide_hi = hi.copy()
+        for shift in range(1, radius + 1):
+            wide_lo[shift:] = numpy.minimum(wide_lo[shift:], lo[:-shift])
+            wide_lo[:-shift] = numpy.minimum(wide_lo[:-shift], lo[shift:])
+            wide_hi[shift:] = numpy.maximum(wide_hi[shift:], hi[:-shift])
+            wide_hi[:-shift] = numpy.maximum(wide_hi[:-shift], hi[shift:])
+        lo = numpy.clip(wide_lo - radius, 0, m - 1)
+        hi = numpy.clip(wide_hi + radius, 0, m - 1)
+        path = _dtw(r1, c1, lo, hi)
+    return path
+
+def depthMapping(ref, curve, step=0.5, band=0.1, radius=2, log=True, floor=1e-3):
+    """
+    depth mapping of a curve onto a reference profile
+    Input:
+        -ref, curve: (x, y) of the profiles [mm], [N], x increasing
+        -step: grid step of the matching [mm]
+        -band, radius: see warpPath
+        -log: match log10 of the force
+        -floor: forces are clipped to floor before the logarithm [N]
+    Returns:
+        -(x_curve, x_ref): increasing knots, curve depth x_curve corresponds
+         to reference depth x_ref, see applyMapping
+    """
+    def prepare(x, y):
+        start, values = resample(x, y, step)
+        if log:
+            values = numpy.log10(numpy.maximum(values, floor))
+        return start, values
+
+    r_start, r = prepare(*ref)
+    c_start, c = prepare(*curve)
+    i, j = warpPath(r, c, band, radius)
+
+    # several reference cells per curve cell: take their mean
+    count = numpy.bincount(j, minlength=c.size)
+    x_ref = r_start + step * numpy.bincount(j, weights=i, minlength=c.size) / count
+    x_curve = c_start + step * numpy.arange(c.size)
+    return x_curve, x_ref
+
+def applyMapping(x, mapping):
+    """
+    reference depths of curve depths x, linear interpolation between the
+    knots of depthMapping and constant offset beyond them
+    """
+    x_curve, x_ref = mapping
+    x = numpy.asarray(x, dtype=float)
+    result = numpy.interp(x, x_curve, x_ref)
+    before = x < x_curve[0]
+    after = x > x_curve[-1]
+    result[before] = x_ref[0] + x[before] - x_curve[0]
+    result[after] = x_ref[-1] + x[after] - x_curve[-1]
+    return result
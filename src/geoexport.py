@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+geoexport.py writes the measurement locations of a whole catalog (see
+catalog.py and ingest.py) as GeoJSON, KML or CSV. Every profile with GPS
+fix becomes a point with the header infos and the summary metrics (snow
+depth, max force, mean shot noise parameters, ...) as properties.
+
+The catalog tables are streamed: only the byte offset of the last row of
+every file is kept in memory, header and summary rows are read on demand
+and every feature is written as soon as it is complete.
+
+usage:
+
+python geoexport.py /path/to/catalog locations.geojson
+python geoexport.py /path/to/catalog locations.kml
+python geoexport.py /path/to/catalog locations.csv
+
+example:
+
+import geoexport
+
+written, skipped = geoexport.export("/path/to/catalog", "locations.geojson")
+"""
+
+import os
+import csv
+import json
+import codecs
+import argparse
+from itertools import izip
+from xml.sax.saxutils import escape, quoteattr
+from catalog import Catalog, SUMMARY_COLUMNS
+from extensions.spatial import validFix
+
+__author__ = "SasG"
+__date__ = "26/10/19"
+__version__ = "0.1.0"
+
+# header infos exported as properties
+HEADER_PROPERTIES = ["Altitude [cm]", "PDOP", "Num Sats", "SMP Serial", "Comment"]
+
+FORMATS = {".geojson": "geojson", ".json": "geojson", ".kml": "kml", ".csv": "csv"}
+
+def value(text):
+	"""
+	return catalog cell as float if possible, None if empty, unicode text otherwise
+	"""
+	if text is None or text == "":
+		return None
+	try:
+		return float(text)
+	except ValueError:
+		return decode(text)
+
+def decode(text):
+	"""
+	return unicode of byte string text, UTF-8 or else latin-1 (e.g. the
+	comment of a .pnt header, which is never decoded)
+	"""
+	try:
+		return text.decode("utf-8")
+	except UnicodeDecodeError:
+		return text.decode("latin-1")
+
+def profiles(catalog):
+	"""
+	yield (file, latitude, longitude, properties) of the latest rows of all
+	files in catalog, properties without fix get latitude and longitude None
+	"""
+	if not isinstance(catalog, Catalog):
+		catalog = Catalog(catalog)
+	header = catalog.tables["header"]
+	summary = catalog.tables["summary"]
+	header_offsets = header.offsets()
+	summary_offsets = summary.offsets()
+
+	# header order, both tables are appended in the same order by ingest
+	files = sorted(header_offsets, key=header_offsets.get)
+	summaries = summary.readAt([summary_offsets[f] for f in files if f in summary_offsets])
+	for name, row in izip(files, header.readAt([header_offsets[f] for f in files])):
+		properties = {"File": decode(name)}
+		if all(row.get(key) for key in ("Year", "Month", "Day")):
+			try:
+				properties["Date"] = "%04d-%02d-%02d %02d:%02d:%02d" %tuple(int(float(row.get(key) or 0))
+					for key in ("Year", "Month", "Day", "Hour", "Min", "Sec"))
+			except ValueError:
+				pass
+		for key in HEADER_PROPERTIES:
+			properties[key] = value(row.get(key))
+		if name in summary_offsets:
+			metrics = next(summaries)
+			for key in SUMMARY_COLUMNS[1:]:
+				properties[key] = value(metrics.get(key))
+
+		lat, lon = value(row.get("Latitude")), value(row.get("Longitude"))
+		if not isinstance(lat, float) or not isinstance(lon, float) or not validFix(lat, lon):
+			lat = lon = None
+		yield name, lat, lon, properties
+
+class GeoJSONWriter():
+	"""FeatureCollection of points, one feature per line"""
+	def __init__(self, f):
+		self.f = f
+		self.first = True
+		self.f.write('{"type": "FeatureCollection", "features": [\n')
+
+	def write(self, lat, lon, properties):
+		feature = {"type": "Feature",
+				"geometry": {"type": "Point", "coordinates": [lon, lat]},
+				"properties": properties}
+		self.f.write(("" if self.first else ",\n") + json.dumps(feature, allow_nan=False))
+		self.first = False
+
+	def close(self):
+		self.f.write("\n]}\n")
+
+class KMLWriter():
+	"""placemarks with the properties as extended data"""
+	def __init__(self, f):
+		self.f = f
+		self.names = {}
+		self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+					'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+					'<name>SnowMicroPen measurements</name>\n')
+
+	def write(self, lat, lon, properties):
+		data = []
+		for key, v in sorted(properties.items()):
+			if v is None:
+				continue
+			if key not in self.names: # few distinct keys, quote them once
+				self.names[key] = "<Data name=%s><value>" %quoteattr(key)
+			data.append(self.names[key] + (repr(v) if isinstance(v, float) else escape(v)) + "</value></Data>")
+		data = "".join(data)
+		self.f.write("<Placemark><name>%s</name><ExtendedData>%s</ExtendedData>"
+					"<Point><coordinates>%r,%r</coordinates></Point></Placemark>\n"
+					%(escape(os.path.basename(properties["File"])), data, lon, lat))
+
+	def close(self):
+		self.f.write("</Document></kml>\n")
+
+class CSVWriter():
+	"""comma separated table with latitude and longitude columns"""
+	def __init__(self, f):
+		self.columns = ["File", "Latitude", "Longitude", "Date"] + HEADER_PROPERTIES + SUMMARY_COLUMNS[1:]
+		self.writer = csv.writer(f)
+		self.writer.writerow(self.columns)
+
+	def write(self, lat, lon, properties):
+		properties = dict(properties, Latitude=lat, Longitude=lon)
+		row = ["" if properties.get(key) is None else properties[key] for key in self.columns]
+		self.writer.writerow([v.encode("utf-8") if isinstance(v, unicode) else v for v in row])
+
+	def close(self):
+		pass
+
+WRITERS = {"geojson": GeoJSONWriter, "kml": KMLWriter, "csv": CSVWriter}
+
+def export(catalog, filename, format=None):
+	"""
+	write all profiles of catalog with GPS fix to filename
+	Input:
+		-catalog: catalog directory or Catalog object
+		-filename: output file
+		-format: "geojson", "kml" or "csv", default from the file extension
+	Returns:
+		-number of written and skipped (no GPS fix) profiles
+	"""
+	if format is None:
+		format = FORMATS.get(os.path.splitext(filename)[1].lower())
+	if format not in WRITERS:
+		raise ValueError("unknown export format %s" %format)
+
+	written = skipped = 0
+	# csv writes bytes, the other writers unicode
+	with (open(filename, "wb") if format == "csv" else codecs.open(filename, "w", "utf-8")) as f:
+		writer = WRITERS[format](f)
+		for name, lat, lon, properties in profiles(catalog):
+			if lat is None:
+				skipped += 1
+				continue
+			# NaN is not valid JSON and meaningless elsewhere
+			for key, v in properties.items():
+				if isinstance(v, float) and v != v:
+					properties[key] = None
+			writer.write(lat, lon, properties)
+			written += 1
+		writer.close()
+	return written, skipped
+
+def main(argv=None):
+	"""
+	parse command line and export catalog
+	"""
+	parser = argparse.ArgumentParser(description="Export measurement locations and metrics of a catalog")
+	parser.add_argument("catalog", help="catalog directory")
+	parser.add_argument("output", help="output file (.geojson, .kml or .csv)")
+	parser.add_argument("-f", "--format", choices=sorted(WRITERS), help="output format, default from the file extension")
+	args = parser.parse_args(argv)
+
+	written, skipped = export(args.catalog, args.output, args.format)
+	print "exported %d profiles to %s, skipped %d without GPS fix" %(written, args.output, skipped)
+
+if __name__ == "__main__":
+	main()
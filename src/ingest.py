@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+ingest.py watches one or more directories for new or changed SnowMicroPen
+.pnt files and appends their header and summary metrics to a catalog
+(see catalog.py). Directories are polled, so network shares and synced
+folders work as well.
+
+Every file runs through the pipeline load -> surface -> ground -> metrics
+in a bounded pool of worker processes. Results are written to the catalog
+as soon as a file is done, and the catalog is the only state: after a
+restart, files with unchanged modification time and size are skipped.
+
+usage:
+
+python ingest.py /path/to/field/data [/other/dir ...] -c /path/to/catalog [--thumbnails] [--migrate]
+
+example:
+
+import ingest
+
+daemon = ingest.Ingest(["/path/to/field/data"], "/path/to/catalog", processes=4)
+daemon.runOnce() # process all pending files and return
+daemon.run() # poll forever
+"""
+
+import os
+import time
+import logging
+import argparse
+import functools
+import multiprocessing
+import numpy
+import pnt
+from catalog import Catalog
+from extensions.median import hampel
+from extensions.summary import profileSummary
+from extensions.thumbnails import drawThumbnail, thumbnailName, thumbnailState
+
+__author__ = "SasG"
+__date__ = "26/10/19"
+__version__ = "0.1.0"
+
+log = logging.getLogger("SnowMicroPynIngest")
+
+# summary table columns and profileSummary fields
+SUMMARY_FIELDS = [("Surface [mm]", "surface"), ("Ground [mm]", "ground"),
+				("Snow Depth [mm]", "snow_depth"), ("Max Force [N]", "max_force"),
+				("Max Force Depth [mm]", "max_force_depth"), ("Offset [N]", "offset"),
+				("Drift [N/mm]", "drift"), ("Noise [N]", "noise"),
+				("SN Lambda [1/mm^3]", "sn_lambda"), ("SN f0 [N]", "sn_f0"),
+				("SN Delta [mm]", "sn_delta"), ("SN L [mm]", "sn_length")]
+
+def stamp(st):
+	"""
+	return (modified, size) strings of os.stat result st as stored in the catalog
+	"""
+	return ("%.3f" %st.st_mtime, str(st.st_size))
+
+def process(job, despike=None, thumbnails=None):
+	"""
+	run load -> (despike) -> surface -> ground -> metrics pipeline on a single file
+	Input:
+		-job: tuple (path, modified, size)
+		-despike: None or tuple (window, threshold, minimum) of the Hampel filter
+		-thumbnails: None or directory to draw a sparkline thumbnail to
+	Returns:
+		-tuple (header row, summary row, error row), unused rows are None
+	"""
+	path, modified, size = job
+	try:
+		p = pnt.Pnt(path)
+		if despike is not None:
+			p.data[:,1], spikes = hampel(p.data[:,1], *despike)
+			log.debug("replaced %d spikes in %s" %(spikes.sum(), path))
+		row = profileSummary(p)[0]
+		if thumbnails is not None: # named like the ones of the GUI, see thumbnails.renderThumbnails
+			name = thumbnailName(path, state=thumbnailState(row["surface"], row["ground"], despike))
+			drawThumbnail(p.data[:,0], p.data[:,1], os.path.join(thumbnails, name), surface=row["surface"], ground=row["ground"])
+
+		header = dict(p.header)
+		header["File"] = path
+		header["Modified"] = modified
+		header["Size [bytes]"] = size
+
+		summary = {"File": path}
+		for column, field in SUMMARY_FIELDS:
+			value = float(row[field])
+			if not numpy.isnan(value): # e.g. no air gap in front of surface
+				summary[column] = value
+
+		return header, summary, None
+
+	except Exception as e:
+		error = {"File": path, "Modified": modified, "Size [bytes]": size, "Error": repr(e)}
+		return None, None, error
+
+class Ingest():
+	def __init__(self, directories, catalog, processes=2, interval=10., settle=5., despike=None, thumbnails=False, migrate=False):
+		"""
+		Create ingest daemon.
+		Input:
+			-directories: list of directories to watch (recursively)
+			-catalog: catalog directory or Catalog object
+			-processes: number of worker processes
+			-interval: polling interval [s]
+			-settle: minimum file age [s], younger files might still be synced
+			-despike: None or tuple (window, threshold, minimum) to remove spikes before processing
+			-thumbnails: draw sparkline thumbnails to the directory thumbnails of the catalog
+			-migrate: rewrite catalog tables of an older version with the current columns
+		"""
+		self.directories = [os.path.abspath(d) for d in directories]
+		if not isinstance(catalog, Catalog):
+			catalog = Catalog(catalog, migrate)
+		if catalog.outdated():
+			raise ValueError("tables %s of catalog %s were written by another version, migrate them (--migrate)"
+							%(", ".join(catalog.outdated()), catalog.path))
+		self.catalog = catalog
+		self.processes = processes
+		self.interval = interval
+		self.settle = settle
+		self.despike = despike
+		self.thumbnails = os.path.join(self.catalog.path, "thumbnails") if thumbnails else None
+		self.state = self.catalog.processed()
+		log.info("catalog %s contains %d files" %(self.catalog.path, len(self.state)))
+
+	def scan(self):
+		"""
+		return list of jobs (path, modified, size) for new or changed files
+		"""
+		now = time.time()
+		jobs = []
+		for directory in self.directories:
+			for root, dirs, files in os.walk(directory):
+				for name in files:
+					if not name.lower().endswith(".pnt"):
+						continue
+					path = os.path.join(root, name)
+					try:
+						st = os.stat(path)
+					except OSError:
+						continue # removed in the meantime
+					modified, size = stamp(st)
+					if self.state.get(path) == (modified, size):
+						continue
+					if now - st.st_mtime < self.settle:
+						continue
+					jobs.append((path, modified, size))
+		return sorted(jobs)
+
+	def runOnce(self, pool=None):
+		"""
+		process pending files, return number of processed files
+		"""
+		jobs = self.scan()
+		if not jobs:
+			return 0
+
+		log.info("processing %d new or changed files" %len(jobs))
+		close = pool is None
+		if close:
+			pool = multiprocessing.Pool(self.processes)
+		try:
+			for header, summary, error in pool.imap_unordered(functools.partial(process, despike=self.despike, thumbnails=self.thumbnails), jobs):
+				self.catalog.add(header, summary, error)
+				if error is not None:
+					log.error("could not process %s: %s" %(error["File"], error["Error"]))
+					row = error
+				else:
+					log.info("processed %s" %header["File"])
+					row = header
+				self.state[row["File"]] = (row["Modified"], row["Size [bytes]"])
+		finally:
+			if close:
+				pool.close()
+				pool.join()
+
+		return len(jobs)
+
+	def run(self):
+		"""
+		poll directories until interrupted
+		"""
+		log.info("watching %s" %", ".join(self.directories))
+		pool = multiprocessing.Pool(self.processes)
+		try:
+			while True:
+				self.runOnce(pool)
+				time.sleep(self.interval)
+		except KeyboardInterrupt:
+			log.info("stopped by user")
+		finally:
+			pool.terminate()
+			pool.join()
+
+def main(argv=None):
+	"""
+	parse command line and run ingest daemon
+	"""
+	parser = argparse.ArgumentParser(description="Watch directories and catalog SnowMicroPen .pnt files")
+	parser.add_argument("directories", nargs="+", help="directories to watch")
+	parser.add_argument("-c", "--catalog", default="catalog", help="catalog directory")
+	parser.add_argument("-j", "--processes", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+	parser.add_argument("-i", "--interval", type=float, default=10., help="polling interval [s]")
+	parser.add_argument("-s", "--settle", type=float, default=5., help="minimum file age [s]")
+	parser.add_argument("--once", action="store_true", help="process pending files and exit")
+	parser.add_argument("--despike", nargs=3, type=float, metavar=("WINDOW", "THRESHOLD", "MINIMUM"),
+						help="remove spikes with a Hampel filter, e.g. 15 3 0.05 (samples, MADs, N)")
+	parser.add_argument("--thumbnails", action="store_true", help="draw sparkline thumbnails next to the catalog")
+	parser.add_argument("--migrate", action="store_true", help="rewrite catalog tables of an older version (old files kept as .bak)")
+	args = parser.parse_args(argv)
+
+	logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+	daemon = Ingest(args.directories, args.catalog, args.processes, args.interval, args.settle, args.despike, args.thumbnails, args.migrate)
+	if args.once:
+		daemon.runOnce()
+	else:
+		daemon.run()
+
+if __name__ == "__main__":
+	main()
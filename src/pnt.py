@@ -266,26 +266,7 @@ class Pnt():
 			fname = self.filename
 		fname = os.path.join(os.getcwd(),fname)
 
-		buff = "" # buffer string
-
-		data = self.data[:,1] / self.header["CNV Force [N/mV]"] # convert N to mV
-
-		# adapt header entries
-		self.header["Force Samples"] = len(data) # correct the number of force samples if data have been modified
-		self.header["Length Comment"] = len(self.header["Comment"])
-
-		#pack header to buffer
-		for (key, fmt, start, length, unit) in PARAMTABLE:
-			fmt = ">" + fmt # big endian
-			if type(self.header[key]) is tuple:
-				buff += struct.pack(fmt, *self.header[key])
-			elif "x" in fmt: # reserved spaces
-				buff += length * struct.pack(">"+"s","\x00")
-			else:
-				buff += struct.pack(fmt, self.header[key])
-
-		#pack data array to buffer
-		buff += struct.pack(">"+len(data)*"h", *data)
+		buff = pack(self.header, self.data[:,1])
 
 		#write buffer to file
 		with open(fname,"w+b") as f:
@@ -296,3 +277,35 @@ class Pnt():
 			print "wrote %d bytes to %s" %(len(buff),fname)
 
 		return fname
+
+def pack(header, force):
+	"""
+	pack header dict and force array [N] to .pnt binary string
+	header entries "Force Samples" and "Length Comment" are adapted to the data
+	the force is truncated to integer mV like struct.pack does, raises
+	ValueError if it does not fit into 16 bit
+	"""
+	data = numpy.trunc(numpy.asarray(force) / header["CNV Force [N/mV]"]) # convert N to mV
+	outside = (data < -32768) | (data > 32767) | numpy.isnan(data)
+	if outside.any():
+		raise ValueError("%d force values outside of the 16 bit range of .pnt files" %outside.sum())
+
+	# adapt header entries
+	header["Force Samples"] = len(data) # correct the number of force samples if data have been modified
+	header["Length Comment"] = len(header["Comment"])
+
+	#pack header to buffer
+	buff = ""
+	for (key, fmt, start, length, unit) in PARAMTABLE:
+		fmt = ">" + fmt # big endian
+		if type(header[key]) is tuple:
+			buff += struct.pack(fmt, *header[key])
+		elif "x" in fmt: # reserved spaces
+			buff += length * struct.pack(">"+"s","\x00")
+		else:
+			buff += struct.pack(fmt, header[key])
+
+	#pack data array to buffer
+	buff += data.astype(">i2").tostring()
+
+	return buff
@@ -0,0 +1,63 @@
+"""
+regression tests of catalog.Catalog.processed and ingest restarts
+
+run from src: python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src)
+sys.path.insert(0, os.path.join(src, "extensions"))
+
+from catalog import Catalog
+import ingest
+
+logging.getLogger("SnowMicroPynIngest").setLevel(logging.CRITICAL)
+
+class Processed(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.directory, "catalog"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testNewerHeader(self):
+        """an error is replaced by a later successful run"""
+        self.catalog.add(error={"File": "a.pnt", "Modified": "100.000", "Size [bytes]": "0", "Error": "empty"})
+        self.catalog.add(header={"File": "a.pnt", "Modified": "200.000", "Size [bytes]": "145920"})
+        self.assertEqual(self.catalog.processed(), {"a.pnt": ("200.000", "145920")})
+
+    def testNewerError(self):
+        """a successful run is replaced by a later error"""
+        self.catalog.add(header={"File": "a.pnt", "Modified": "100.000", "Size [bytes]": "145920"})
+        self.catalog.add(error={"File": "a.pnt", "Modified": "200.000", "Size [bytes]": "0", "Error": "empty"})
+        self.assertEqual(self.catalog.processed(), {"a.pnt": ("200.000", "0")})
+
+    def testRestart(self):
+        """a file which failed once and was replaced is not processed again after a restart"""
+        data = os.path.join(self.directory, "data")
+        os.makedirs(data)
+        path = os.path.join(data, "S31M0075.pnt")
+        shutil.copy(os.path.join(src, "testdata", "S31M0074.pnt"), path) # empty
+        os.utime(path, (1e9, 1e9))
+        daemon = ingest.Ingest([data], self.catalog, processes=1, settle=0.)
+        self.assertEqual(daemon.runOnce(), 1)
+        self.assertEqual(len(self.catalog.latest("errors")), 1)
+
+        shutil.copy(os.path.join(src, "testdata", "S31M0075.pnt"), path) # synced completely
+        os.utime(path, (1e9 + 60, 1e9 + 60))
+        self.assertEqual(daemon.runOnce(), 1)
+        for restart in range(2):
+            daemon = ingest.Ingest([data], Catalog(self.catalog.path), processes=1, settle=0.)
+            self.assertEqual(daemon.scan(), [])
+        self.assertEqual(len(list(self.catalog.tables["header"].read())), 1)
+
+if __name__ == "__main__":
+    unittest.main()
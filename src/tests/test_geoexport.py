@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+regression tests of geoexport.py
+
+run from src: python -m unittest discover tests
+"""
+
+import os
+import sys
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+from xml.dom import minidom
+
+src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src)
+sys.path.insert(0, os.path.join(src, "extensions"))
+
+from catalog import Catalog
+import geoexport
+
+class NonAscii(unittest.TestCase):
+    """pnt comments are undecoded bytes, e.g. latin-1"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.directory, "catalog"))
+        for name, comment in (("a.pnt", "Schnee \xf6"), ("b.pnt", "Schnee \xc3\xb6")): # latin-1, UTF-8
+            self.catalog.add(header={"File": name, "Modified": "1.000", "Size [bytes]": "10",
+                                     "Latitude": "46.8", "Longitude": "9.8", "Comment": comment},
+                             summary={"File": name, "Max Force [N]": 1.5})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self, extension):
+        filename = os.path.join(self.directory, "locations" + extension)
+        self.assertEqual(geoexport.export(self.catalog, filename), (2, 0))
+        return filename
+
+    def testGeoJSON(self):
+        with open(self.export(".geojson")) as f:
+            features = json.load(f)["features"]
+        self.assertEqual([p["properties"]["Comment"] for p in features], [u"Schnee ö"] * 2)
+
+    def testKML(self):
+        document = minidom.parse(self.export(".kml")) # raises on invalid UTF-8
+        comments = [d.getElementsByTagName("value")[0].firstChild.data
+                    for d in document.getElementsByTagName("Data") if d.getAttribute("name") == "Comment"]
+        self.assertEqual(comments, [u"Schnee ö"] * 2)
+
+    def testCSV(self):
+        with open(self.export(".csv"), "rb") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row["Comment"].decode("utf-8") for row in rows], [u"Schnee ö"] * 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+regression tests of pnt.pack
+
+run from src: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src)
+sys.path.insert(0, os.path.join(src, "extensions"))
+
+import pnt
+
+class Pack(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(src, "testdata", "S31M0075.pnt")
+        self.p = pnt.Pnt(self.filename)
+
+    def testData(self):
+        """force written as read"""
+        with open(self.filename, "rb") as f:
+            raw = f.read()
+        end = 512 + 2 * len(self.p.data)
+        self.assertEqual(pnt.pack(dict(self.p.header), self.p.data[:,1])[512:end], raw[512:end])
+
+    def testTruncate(self):
+        """force is truncated to integer mV, like struct.pack"""
+        cnv = self.p.header["CNV Force [N/mV]"]
+        buff = pnt.pack(dict(self.p.header), [2.7 * cnv, -2.7 * cnv])
+        self.assertEqual(buff[512:], "\x00\x02\xff\xfe")
+
+    def testRange(self):
+        """16 bit overflow is an error, not wrapped around"""
+        cnv = self.p.header["CNV Force [N/mV]"]
+        for value in (32768 * cnv, -32769 * cnv, float("nan")):
+            self.assertRaises(ValueError, pnt.pack, dict(self.p.header), [0., value])
+
+if __name__ == "__main__":
+    unittest.main()
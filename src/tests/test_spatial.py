@@ -0,0 +1,58 @@
+"""
+regression tests of extensions/spatial.py
+
+run from src: python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+
+src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src)
+sys.path.insert(0, os.path.join(src, "extensions"))
+
+import pnt
+import spatial
+from catalog import Catalog
+
+class NoFix(unittest.TestCase):
+    """files without GPS fix, e.g. all files of testdata (99999/99999)"""
+    def check(self, index):
+        self.assertEqual(len(index), 0)
+        self.assertEqual(len(index.radius(46.8, 9.8, 1e6)[0]), 0)
+        self.assertEqual(len(index.nearest(46.8, 9.8, k=3)[0]), 0)
+        self.assertEqual(len(index.bbox(-90, 90, -180, 180)), 0)
+        self.assertIsNone(index.center())
+        self.assertIsNone(index.center([0, 1]))
+
+    def testSentinel(self):
+        self.check(spatial.SpatialIndex(["a", "b"], [99999., 0.], [99999., 0.]))
+
+    def testEmpty(self):
+        self.check(spatial.SpatialIndex([], [], []))
+
+    def testTestdata(self):
+        names = [os.path.join(src, "testdata", "S31M007%d.pnt" %i) for i in (5, 6)]
+        self.check(spatial.SpatialIndex.fromFiles([pnt.Pnt(name) for name in names]))
+
+    def testEmptyCatalog(self):
+        path = tempfile.mkdtemp()
+        try:
+            index = Catalog(path).spatialIndex()
+            self.assertEqual(len(index.radius(46.8, 9.8, 1e6)[0]), 0)
+            self.assertIsNone(index.center())
+        finally:
+            shutil.rmtree(path)
+
+    def testValidFix(self):
+        self.assertFalse(spatial.validFix(99999., 99999.))
+        self.assertFalse(spatial.validFix(0., 0.))
+        self.assertTrue(spatial.validFix(46.8, 9.8))
+        numpy.testing.assert_array_equal(spatial.validFix([46.8, 0., 99999.], [9.8, 0., 99999.]), [True, False, False])
+
+if __name__ == "__main__":
+    unittest.main()